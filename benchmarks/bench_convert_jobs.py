@@ -0,0 +1,45 @@
+"""
+Benchmark of the conversion of a rule set with different numbers of worker processes. The output
+must be identical to the sequential conversion for all numbers of workers.
+
+Usage: python benchmarks/bench_convert_jobs.py [number of rules]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sigma.backends.test import TextQueryTestBackend
+from sigma.cli.convert import convert_collection, iter_parallel_conversion
+from sigma.cli.rules import load_rules
+
+from corpus import write_rules
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write_rules(tmpdir, count)
+
+        print(f"{'Jobs':>6} {'Total (s)':>10} {'Rules/s':>10}")
+        reference_output = None
+        for jobs in (1, 2, 4, 8):
+            rule_collection = load_rules((Path(tmpdir),), "*.yml")
+            backend = TextQueryTestBackend()
+            start = time.perf_counter()
+            if jobs == 1:
+                output = backend.convert(rule_collection)
+            else:
+                rule_queries = iter_parallel_conversion(
+                    backend, TextQueryTestBackend, rule_collection, "default", None, jobs
+                )
+                output = convert_collection(backend, rule_queries, "default")
+            elapsed = time.perf_counter() - start
+            if reference_output is None:
+                reference_output = output
+            assert output == reference_output
+            print(f"{jobs:>6} {elapsed:>10.3f} {count / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of the application of filters with growing numbers of per-rule filters, one filter file
+per rule plus a few filters for any rule, compared with the application by SigmaCollection.
+
+Usage: python benchmarks/bench_filters.py [max number of filters]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sigma.collection import SigmaCollection
+from sigma.cli.rules import iter_rule_collections, merge_collections
+
+from corpus import rule_id, write_rules
+
+filter_template = """title: Benchmark filter {i}
+logsource:
+    category: process_creation
+    product: windows
+filter:
+    rules:
+        - {rule}
+    selection:
+        User: 'user{i}'
+    condition: not selection
+"""
+
+global_filter_template = """title: Benchmark global filter {i}
+logsource:
+    product: windows
+filter:
+    rules: any
+    selection:
+        ParentImage|endswith: '\\\\parent{i}.exe'
+    condition: not selection
+"""
+
+
+def write_filters(directory, count):
+    """Write count filter files for the benchmark rules and ten filters for any rule into directory."""
+    for i in range(count):
+        (Path(directory) / f"filter_{i}.yml").write_text(filter_template.format(i=i, rule=rule_id(i)))
+    for i in range(10):
+        (Path(directory) / f"global_filter_{i}.yml").write_text(global_filter_template.format(i=i))
+
+
+def merge_unindexed(collections):
+    return SigmaCollection.merge(collections, resolve_references=False)
+
+
+def main():
+    max_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(f"{'Filters':>8} {'SigmaCollection (s)':>20} {'Indexed (s)':>12}")
+    count = 100
+    while count <= max_count:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_rules(tmpdir, count)
+            write_filters(tmpdir, count)
+            elapsed = list()
+            for merge in (merge_unindexed, merge_collections):
+                collections = list(iter_rule_collections((Path(tmpdir),), "*.yml", rule_cache=False))
+                start = time.perf_counter()
+                merge(collections)
+                elapsed.append(time.perf_counter() - start)
+        print(f"{count:>8} {elapsed[0]:>20.3f} {elapsed[1]:>12.3f}")
+        count *= 10
+
+
+if __name__ == "__main__":
+    main()
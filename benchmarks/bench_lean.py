@@ -0,0 +1,59 @@
+"""
+Benchmark of the memory retained by a rule collection loaded with load_rules with and without
+lean loading. Each measurement runs in its own process after loading a few rules, so one-time
+allocations like imports and caches aren't counted.
+
+Usage: python benchmarks/bench_lean.py [max number of rules]
+"""
+import gc
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from sigma.cli.rules import load_rules
+
+from corpus import write_rules
+
+
+def retained_memory(directory, lean):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write_rules(tmpdir, 10)
+        load_rules((Path(tmpdir),), "*.yml", lean=lean)
+    gc.collect()
+    tracemalloc.start()
+    rule_collection = load_rules((Path(directory),), "*.yml", lean=lean)
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0] / 2**20
+
+
+def measure(directory, lean):
+    result = subprocess.run(
+        [sys.executable, __file__, "--measure", directory, str(int(lean))],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+        text=True,
+    )
+    return float(result.stdout)
+
+
+def main():
+    if sys.argv[1:2] == ["--measure"]:
+        print(retained_memory(sys.argv[2], sys.argv[3] == "1"))
+        return
+    max_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(f"{'Rules':>8} {'Default (MiB)':>14} {'Lean (MiB)':>11} {'Saved':>6}")
+    count = 100
+    while count <= max_count:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_rules(tmpdir, count)
+            default = measure(tmpdir, False)
+            lean = measure(tmpdir, True)
+        print(f"{count:>8} {default:>14.1f} {lean:>11.1f} {1 - lean / default:>6.0%}")
+        count *= 10
+
+
+if __name__ == "__main__":
+    main()
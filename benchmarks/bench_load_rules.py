@@ -0,0 +1,33 @@
+"""
+Benchmark of load_rules with growing numbers of rule file path arguments, as passed by CI jobs
+that convert the output of e.g. git diff --name-only. The time per rule file should stay flat.
+
+Usage: python benchmarks/bench_load_rules.py [max number of path arguments]
+"""
+import sys
+import tempfile
+import time
+
+from sigma.cli.rules import load_rules
+
+from corpus import write_rules
+
+
+def main():
+    max_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = write_rules(tmpdir, max_count)
+
+        print(f"{'Paths':>8} {'Total (s)':>10} {'Per file (ms)':>14}")
+        count = 10
+        while count <= max_count:
+            start = time.perf_counter()
+            rule_collection = load_rules(tuple(paths[:count]), "*.yml")
+            elapsed = time.perf_counter() - start
+            assert len(rule_collection) == count
+            print(f"{count:>8} {elapsed:>10.3f} {elapsed / count * 1000:>14.3f}")
+            count *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Benchmark of the resolution of rule references with growing numbers of correlation rules. The
+time per correlation rule should stay flat.
+
+Usage: python benchmarks/bench_resolve_references.py [max number of correlation rules]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sigma.collection import SigmaCollection
+from sigma.cli.rules import iter_rule_collections, resolve_rule_references
+
+from corpus import write_correlations, write_rules
+
+
+def main():
+    max_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(f"{'Correlations':>12} {'Total (s)':>10} {'Per correlation (ms)':>21}")
+    count = 100
+    while count <= max_count:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_rules(tmpdir, count)
+            write_correlations(tmpdir, count)
+            rule_collection = SigmaCollection.merge(
+                list(iter_rule_collections((Path(tmpdir),), "*.yml")), resolve_references=False
+            )
+        start = time.perf_counter()
+        resolve_rule_references(rule_collection)
+        elapsed = time.perf_counter() - start
+        print(f"{count:>12} {elapsed:>10.3f} {elapsed / count * 1000:>21.4f}")
+        count *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Benchmark of the peak memory of loading a complete rule collection with load_rules compared to
+streaming the rules with RuleStream. The peak of the stream should stay flat with growing rule
+counts.
+
+Usage: python benchmarks/bench_rule_stream.py [max number of rules]
+"""
+import sys
+import tempfile
+import tracemalloc
+
+from sigma.cli.rules import RuleStream, load_rules
+
+from corpus import write_rules
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def main():
+    max_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = write_rules(tmpdir, max_count)
+        print(f"{'Rules':>8} {'load_rules (MiB)':>17} {'RuleStream (MiB)':>17}")
+        count = 50
+        while count <= max_count:
+            input = tuple(paths[:count])
+            collection_peak = peak_memory(lambda: load_rules(input, "*.yml"))
+            stream_peak = peak_memory(lambda: sum(1 for rule in RuleStream(input, "*.yml")))
+            print(f"{count:>8} {collection_peak:>17.1f} {stream_peak:>17.1f}")
+            count *= 10
+
+
+if __name__ == "__main__":
+    main()
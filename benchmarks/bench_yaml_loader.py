@@ -0,0 +1,40 @@
+"""
+Benchmark of rule loading with the libyaml-based CSafeLoader compared to the pure Python
+SafeLoader of PyYAML.
+
+Usage: python benchmarks/bench_yaml_loader.py [number of rules]
+"""
+import sys
+import tempfile
+import time
+
+import yaml
+
+import sigma.cli.rules
+from sigma.cli.rules import load_rules
+
+from corpus import write_rules
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    loaders = [("SafeLoader", yaml.SafeLoader)]
+    if yaml.__with_libyaml__:
+        loaders.append(("CSafeLoader", yaml.CSafeLoader))
+    else:
+        print("PyYAML was built without libyaml, only the pure Python loader is available.")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = tuple(write_rules(tmpdir, count))
+        print(f"{'Loader':>12} {'Total (s)':>10} {'Rules/s':>10}")
+        for name, loader in loaders:
+            sigma.cli.rules.YamlLoader = loader
+            start = time.perf_counter()
+            rule_collection = load_rules(paths, "*.yml")
+            elapsed = time.perf_counter() - start
+            assert len(rule_collection) == count
+            print(f"{name:>12} {elapsed:>10.3f} {count / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Generation of synthetic Sigma rule corpora for the benchmarks.
+"""
+from pathlib import Path
+
+rule_template = """title: Benchmark rule {i}
+id: 00000000-0000-0000-0000-{i:012d}
+name: benchmark_rule_{i}
+status: test
+description: Synthetic rule {i} generated for benchmarking.
+references:
+    - https://example.com/rules/{i}
+author: Sigma CLI benchmarks
+tags:
+    - attack.execution
+    - attack.t1059.001
+logsource:
+    category: process_creation
+    product: windows
+detection:
+    selection:
+        Image|endswith: '\\\\proc{i}.exe'
+        CommandLine|contains: 'arg{i}'
+    condition: selection
+falsepositives:
+    - Unknown
+level: medium
+"""
+
+
+def rule_id(i):
+    return f"00000000-0000-0000-0000-{i:012d}"
+
+
+def write_rules(directory, count):
+    """Write count rule files into directory and return their paths."""
+    paths = list()
+    for i in range(count):
+        path = Path(directory) / f"rule_{i}.yml"
+        path.write_text(rule_template.format(i=i))
+        paths.append(path)
+    return paths
+
+
+correlation_template = """title: Benchmark correlation {i}
+id: 10000000-0000-0000-0000-{i:012d}
+name: benchmark_correlation_{i}
+status: test
+correlation:
+    type: event_count
+    rules:
+        - benchmark_rule_{i}
+        - {previous}
+    group-by:
+        - User
+    timespan: 5m
+    condition:
+        gte: 10
+level: high
+"""
+
+
+def write_correlations(directory, count):
+    """
+    Write count correlation rules into one multi-document file in directory, each referencing a
+    base rule by name and the previous correlation rule by id. The file name sorts before the
+    base rules, so all references point forward in load order. Returns the path of the file.
+    """
+    path = Path(directory) / "correlations.yml"
+    path.write_text(
+        "---\n".join(
+            correlation_template.format(
+                i=i, previous=f"10000000-0000-0000-0000-{i - 1:012d}" if i else "benchmark_rule_0"
+            )
+            for i in reversed(range(count))
+        )
+    )
+    return path
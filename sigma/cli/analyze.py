@@ -4,8 +4,11 @@ import click
 from prettytable import PrettyTable
 from sigma.processing.resolver import SigmaPipelineNotFoundError
 
-from sigma.cli.convert import pipeline_resolver
-from sigma.cli.rules import check_rule_errors, load_rules
+from sigma.cli.cache import PipelineCache
+from sigma.cli.convert import resolve_pipeline
+from sigma.cli.lean import lean_option
+from sigma.cli.rules import RuleStream, check_rule_errors, load_rules, rule_loading_options
+from sigma.cli.timings import timings
 from sigma.analyze.attack import score_functions, calculate_attack_scores
 from sigma.analyze.fields import extract_fields_from_collection
 from sigma.analyze.stats import create_logsourcestats, format_row
@@ -26,13 +29,8 @@ def analyze_group():
         (f"{definition[1]} ({func})" for func, definition in score_functions.items())
     ),
 )
-@click.option(
-    "--file-pattern",
-    "-P",
-    default="*.yml",
-    show_default=True,
-    help="Pattern for file names to be included in recursion into directories.",
-)
+@rule_loading_options
+@lean_option
 @click.option(
     "--min-level",
     "-L",
@@ -105,6 +103,7 @@ def analyze_attack(
     function,
     output,
     input,
+    **load_options,
 ):
     try:
         min_sigmalevel = SigmaLevel[min_level.upper()]
@@ -119,10 +118,12 @@ def analyze_attack(
         mitre_attack_version,
     )
 
-    rules = load_rules(input, file_pattern)
-    check_rule_errors(rules)
+    # The minimum level isn't applied while loading, rules without level are counted at the minimum level.
+    rules = RuleStream(input, file_pattern, **load_options)
     score_function = score_functions[function][0]
-    scores = calculate_attack_scores(rules, score_function, not subtechniques,min_sigmalevel=min_sigmalevel,min_sigmastatus=min_sigmastatus,)
+    with timings.phase("analysis"):
+        scores = calculate_attack_scores(rules, score_function, not subtechniques,min_sigmalevel=min_sigmalevel,min_sigmastatus=min_sigmastatus,)
+    check_rule_errors(rules)
     layer_techniques = [
         {
             "techniqueID": technique,
@@ -153,20 +154,15 @@ def analyze_attack(
                 max_color,
             ],
             "minValue": min_score,
-            "maxValue": max_score or max(scores.values()),
+            "maxValue": max_score or max(scores.values(), default=0),
         },
         "techniques": layer_techniques,
     }
     json.dump(layer, output, indent=2)
 
 @analyze_group.command(name="logsource", help="Create stats about logsources.")
-@click.option(
-    "--file-pattern",
-    "-P",
-    default="*.yml",
-    show_default=True,
-    help="Pattern for file names to be included in recursion into directories.",
-)
+@rule_loading_options
+@lean_option
 @click.option(
     "--sort-by",
     "-k",
@@ -190,10 +186,12 @@ def analyze_logsource(
     sort_by,
     output,
     input,
+    **load_options,
 ):
-    rules = load_rules(input, file_pattern)
+    rules = RuleStream(input, file_pattern, **load_options)
+    with timings.phase("analysis"):
+        stats = create_logsourcestats(rules)
     check_rule_errors(rules)
-    stats = create_logsourcestats(rules)
 
     # Extract column header
     headers = ["Logsource"] + list(next(iter(stats.values())).keys())
@@ -220,13 +218,8 @@ def analyze_logsource(
     name="fields",
     help="Extract field names from Sigma rules for a given target backend and processing pipeline(s).",
 )
-@click.option(
-    "--file-pattern",
-    "-P",
-    default="*.yml",
-    show_default=True,
-    help="Pattern for file names to be included in recursion into directories.",
-)
+@rule_loading_options
+@lean_option
 @click.option(
     "--target",
     "-t",
@@ -247,6 +240,11 @@ def analyze_logsource(
     default=True,
     help="Verify if a pipeline is used that is intended for another backend.",
 )
+@click.option(
+    "--pipeline-cache/--no-pipeline-cache",
+    default=True,
+    help="Cache resolved processing pipelines on disk and resolve them again only if pipeline files or plugins changed.",
+)
 @click.option(
     "--group/--no-group",
     default=False,
@@ -270,14 +268,15 @@ def analyze_logsource(
     required=True,
     type=click.Path(exists=True, allow_dash=True, path_type=pathlib.Path),
 )
-def analyze_fields(file_pattern, target, pipeline, pipeline_check, group, enable_template_vars, template_vars_path, input):
+def analyze_fields(file_pattern, target, pipeline, pipeline_check, pipeline_cache, group, enable_template_vars, template_vars_path, input, **load_options):
     """Extract field names from Sigma rule sets.
     
     This command extracts and outputs all unique field names present in the given
     Sigma rule collection, formatted for the specified target backend.
     """
     # Load plugins and get available backends
-    plugins = InstalledSigmaPlugins.autodiscover()
+    with timings.phase("plugin discovery"):
+        plugins = InstalledSigmaPlugins.autodiscover()
     backends = plugins.backends
     
     if target not in backends:
@@ -287,13 +286,15 @@ def analyze_fields(file_pattern, target, pipeline, pipeline_check, group, enable
         )
     
     # Load rules
-    rules = load_rules(input, file_pattern)
+    rules = load_rules(input, file_pattern, **load_options)
     check_rule_errors(rules)
     
     # Resolve pipelines
     try:
-        processing_pipeline = pipeline_resolver.resolve(
-            pipeline, target if pipeline_check else None
+        processing_pipeline = resolve_pipeline(
+            pipeline,
+            target if pipeline_check else None,
+            PipelineCache(load_options.get("rule_cache_dir")) if pipeline_cache else None,
         )
         
         # Configure template variable settings on the processing pipeline
@@ -326,7 +327,8 @@ def analyze_fields(file_pattern, target, pipeline, pipeline_check, group, enable
         raise click.ClickException(f"Failed to initialize backend '{target}': {str(e)}")
     
     # Extract fields
-    all_fields, errors = extract_fields_from_collection(rules, backend, group)
+    with timings.phase("analysis", len(rules)):
+        all_fields, errors = extract_fields_from_collection(rules, backend, group)
     
     # Handle errors
     if errors:
@@ -0,0 +1,444 @@
+import hashlib
+import importlib.metadata as metadata
+import json
+import os
+import pickle
+import pkgutil
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import sigma.pipelines
+
+CACHE_FORMAT_VERSION = 1
+
+# Limits of the rule cache, which is evicted after each use.
+RULE_CACHE_MAX_SIZE = 1024 * 2**20
+RULE_CACHE_MAX_AGE = 30 * 86400
+
+
+def default_cache_dir():
+    """
+    Return the default cache directory of Sigma CLI. This is the sigma-cli directory in the
+    platform-specific user cache directory.
+    """
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "sigma-cli"
+
+
+def cache_namespace():
+    """
+    Identifier of the environment that produced cached objects. Pickled pySigma objects are only
+    valid for the same pySigma and Python version, therefore these are part of the cache paths.
+    """
+    try:
+        pysigma_version = metadata.version("pysigma")
+    except metadata.PackageNotFoundError:
+        pysigma_version = "unknown"
+    return f"v{CACHE_FORMAT_VERSION}-pysigma{pysigma_version}-py{sys.version_info[0]}.{sys.version_info[1]}"
+
+
+def write_atomic(path, data):
+    """
+    Write data to a temporary file and move it into place, so concurrent readers never see
+    partially written cache entries.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def evict_entries(entries, max_size=None, max_age=None):
+    """
+    Remove the cache entries, given as (path, stat result), that were not used for more than
+    max_age seconds and the least recently used entries until the total size is at most max_size
+    bytes. Returns the number of removed entries and the remaining entries.
+    """
+    entries = sorted(entries, key=lambda entry: entry[1].st_mtime, reverse=True)
+    now = time.time()
+    kept = list()
+    kept_size = 0
+    removed = 0
+    for path, stat in entries:
+        if (max_age is not None and now - stat.st_mtime > max_age) or (
+            max_size is not None and kept_size + stat.st_size > max_size
+        ):
+            try:
+                path.unlink()
+                removed += 1
+                continue
+            except OSError:
+                pass
+        kept.append((path, stat))
+        kept_size += stat.st_size
+    return removed, kept
+
+
+class RuleCache:
+    """
+    On-disk cache of parsed Sigma rule files. Each entry holds the SigmaCollection parsed from one
+    file together with the fingerprint of the file (modification time, size and SHA-256 hash of
+    the content). With a rule selection, the entries hold the selected rules and are separate
+    from the entries of other selections. Unchanged files are served from the cache without YAML parsing and rule
+    construction. If only the modification time changed (e.g. after a fresh checkout) the content
+    hash decides.
+
+    The modification time of entries is updated on each hit, evict() removes the least recently
+    used entries.
+    """
+
+    def __init__(self, directory=None, selection=None):
+        self.directory = Path(directory or default_cache_dir()) / "rules" / cache_namespace()
+        self.selection = selection.fingerprint() if selection is not None else None
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, path):
+        # The path as given is part of the key because it is recorded as rule source.
+        key = f"{path.absolute()}\0{path}"
+        if self.selection is not None:  # entries contain only the selected rules
+            key += f"\0{self.selection}"
+        return self.directory / hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def read_entry(self, entry_path):
+        try:
+            with entry_path.open("rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:  # corrupted or incompatible entry is treated like a missing one
+            return None
+
+    def write_entry(self, entry_path, entry):
+        try:
+            write_atomic(entry_path, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError:  # the cache is an optimization, failing to write it must not fail the command
+            pass
+
+    def load(self, path, parse):
+        """
+        Return the SigmaCollection for the rule file at path. On a cache miss, parse is called with
+        the path and the decoded file content and its result is stored in the cache.
+        """
+        stat = path.stat()
+        entry_path = self.entry_path(path)
+        entry = self.read_entry(entry_path)
+        if entry is not None and (entry["mtime"], entry["size"]) == (stat.st_mtime_ns, stat.st_size):
+            try:
+                os.utime(entry_path)
+            except OSError:
+                pass
+            self.hits += 1
+            return entry["collection"]
+
+        content = path.read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry is not None and entry["digest"] == digest:
+            self.hits += 1
+            collection = entry["collection"]
+        else:
+            self.misses += 1
+            collection = parse(path, content.decode("utf-8"))
+        self.write_entry(
+            entry_path,
+            {
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "digest": digest,
+                "collection": collection,
+            },
+        )
+        return collection
+
+    def entries(self):
+        """Return (path, stat result) of all entries of all rule caches in the cache directory."""
+        entries = list()
+        for path in self.directory.parent.glob("*/*"):
+            try:
+                entries.append((path, path.stat()))
+            except OSError:
+                pass
+        return entries
+
+    def evict(self, max_size=RULE_CACHE_MAX_SIZE, max_age=RULE_CACHE_MAX_AGE):
+        """See evict_entries."""
+        return evict_entries(self.entries(), max_size, max_age)
+
+
+def package_version(obj):
+    """
+    Return the name and version of the installed distribution that provides the module of obj,
+    e.g. the backend plugin package of a backend class.
+    """
+    return module_version(obj.__module__)
+
+
+def module_version(module):
+    """Return the name and version of the installed distribution that provides the named module."""
+    package = module.split(".")[0]
+    for distribution in metadata.packages_distributions().get(package, []):
+        try:
+            dist = metadata.distribution(distribution)
+        except metadata.PackageNotFoundError:
+            continue
+        # Namespace packages like sigma are shared by many distributions, pick the one that
+        # contains the module.
+        module_path = module.replace(".", "/")
+        if any(
+            str(file).startswith(module_path + "/") or str(file) == module_path + ".py"
+            for file in dist.files or ()
+        ):
+            return f"{distribution}-{dist.version}"
+    return f"{package}-unknown"
+
+
+def pipeline_module(name):
+    """
+    Return the name of the plugin module that provides the named pipeline, like pySigma's plugin
+    discovery finds it: pipelines are the variables of the modules in sigma.pipelines, named
+    without the suffix _pipeline. The pipeline objects can't be used for this, because all
+    pipelines registered with the Pipeline decorator are the same instance.
+    """
+    for module_info in pkgutil.iter_modules(sigma.pipelines.__path__, "sigma.pipelines."):
+        module = sys.modules.get(module_info.name)  # modules skipped by discovery aren't imported
+        if module is None or module_info.name in ("sigma.pipelines.base", "sigma.pipelines.common"):
+            continue
+        if any(variable.replace("_pipeline", "") == name for variable in vars(module)):
+            return module.__name__
+    return None
+
+
+def file_digest(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def pipeline_fingerprint(pipeline_specs, named_pipelines):
+    """
+    Fingerprint of the processing pipeline resolved from pipeline_specs. Named pipelines from
+    named_pipelines (the pipelines of the pipeline resolver) are identified by name and the
+    version of the plugin providing them, pipeline files and directories by their content.
+    """
+    fingerprint = list()
+    for spec in pipeline_specs:
+        if spec in named_pipelines:
+            module = pipeline_module(spec) or named_pipelines[spec].__module__
+            fingerprint.append(("name", spec, module_version(module)))
+            continue
+        path = Path(spec.rstrip("/*"))
+        if path.is_dir():
+            fingerprint.append(
+                (
+                    "directory",
+                    spec,
+                    [
+                        (str(file.relative_to(path)), file_digest(file))
+                        for file in sorted(path.glob("**/*.yml"))
+                    ],
+                )
+            )
+        else:
+            fingerprint.append(("file", spec, file_digest(path)))
+    return fingerprint
+
+
+def rule_digest(rule):
+    """
+    Content hash of a rule as it is passed to the backend, i.e. after filters were applied.
+    pySigma names the detections added by filters with random identifiers, which are replaced by
+    stable ones.
+    """
+    content = json.dumps(rule.to_dict(), sort_keys=True, default=str)
+    filter_identifiers = dict()
+    content = re.sub(
+        r"_filt_[a-z]{10}",
+        lambda m: filter_identifiers.setdefault(m.group(0), f"_filt_{len(filter_identifiers)}"),
+        content,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ConversionCache:
+    """
+    On-disk cache of the queries converted from Sigma rules. Entries are addressed by the content
+    hash of the rule and of the conversion context, which identifies everything else the
+    conversion result depends on: backend and its version, processing pipeline fingerprint,
+    output format, correlation method and backend options.
+
+    The modification time of entries is updated on each hit, evict() removes the least recently
+    used entries.
+    """
+
+    def __init__(self, directory=None, context=None):
+        self.directory = Path(directory or default_cache_dir()) / "conversions" / cache_namespace()
+        self.context = hashlib.sha256(
+            json.dumps(context, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, rule):
+        digest = hashlib.sha256(f"{self.context}\0{rule_digest(rule)}".encode("utf-8")).hexdigest()
+        return self.directory / digest[:2] / digest
+
+    def load(self, rule, convert):
+        """
+        Return the queries of rule from the cache. On a cache miss, convert is called, which must
+        return the queries and a flag that indicates if the result can be cached.
+        """
+        entry_path = self.entry_path(rule)
+        try:
+            with entry_path.open("rb") as f:
+                queries = pickle.load(f)
+            os.utime(entry_path)
+            self.hits += 1
+            return queries
+        except Exception:  # missing, corrupted or incompatible entries are handled as miss
+            pass
+
+        self.misses += 1
+        queries, cacheable = convert()
+        if cacheable:
+            try:
+                write_atomic(entry_path, pickle.dumps(queries, protocol=pickle.HIGHEST_PROTOCOL))
+            except (OSError, pickle.PicklingError, TypeError, AttributeError):
+                pass  # the cache is an optimization, failing to write it must not fail the command
+        return queries
+
+    def entries(self):
+        """Return (path, stat result) of all entries of all conversion caches in the cache directory."""
+        entries = list()
+        for path in self.directory.parent.glob("*/*/*"):
+            try:
+                entries.append((path, path.stat()))
+            except OSError:
+                pass
+        return entries
+
+    def evict(self, max_size=None, max_age=None):
+        """See evict_entries."""
+        return evict_entries(self.entries(), max_size, max_age)
+
+
+class MemoryConversionCache:
+    """
+    In-memory cache of converted queries for repeated conversions of a rule set in one process,
+    like in watch mode. Entries are addressed by the content hash of the rule, the conversion
+    context is fixed for the lifetime of the cache. Misses are looked up in the on-disk
+    conversion_cache if given. prune() removes the entries that weren't used since the previous
+    call, so the cache only holds the queries of the current rule set.
+    """
+
+    def __init__(self, conversion_cache=None):
+        self.conversion_cache = conversion_cache
+        self.entries = dict()
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, rule, convert):
+        """Return the queries of rule from the cache, see ConversionCache.load."""
+        digest = rule_digest(rule)
+        self.used.add(digest)
+        try:
+            queries = pickle.loads(self.entries[digest])
+            self.hits += 1
+            return queries
+        except KeyError:
+            pass
+
+        self.misses += 1
+        cacheable = True
+
+        def convert_and_check():
+            nonlocal cacheable
+            queries, cacheable = convert()
+            return queries, cacheable
+
+        if self.conversion_cache is not None:
+            queries = self.conversion_cache.load(rule, convert_and_check)
+        else:
+            queries, cacheable = convert()
+        if cacheable:
+            try:
+                self.entries[digest] = pickle.dumps(queries, protocol=pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                pass
+        return queries
+
+    def prune(self):
+        """Remove the entries that weren't used since the previous prune()."""
+        self.entries = {digest: entry for digest, entry in self.entries.items() if digest in self.used}
+        self.used = set()
+
+
+class PipelineCache:
+    """
+    Cache of resolved processing pipelines, keyed by the pipeline specifications, the target of
+    the compatibility check and the pipeline fingerprint (see pipeline_fingerprint), so changed
+    pipeline files or upgraded pipeline plugins are resolved again. Resolved pipelines are kept in
+    memory and on disk. Each lookup returns a new copy of the pipeline, because the pipelines are
+    modified by their users.
+
+    Pipelines that can't be pickled, e.g. because they contain functions defined at runtime, are
+    resolved on each lookup.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or default_cache_dir()) / "pipelines" / cache_namespace()
+        self.pipelines = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, resolver, pipeline_specs, target):
+        try:
+            fingerprint = pipeline_fingerprint(pipeline_specs, resolver.pipelines)
+        except OSError:  # missing pipeline files are reported by the resolver
+            return None
+        key = json.dumps([list(pipeline_specs), target, fingerprint], default=str)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def resolve(self, resolver, pipeline_specs, target=None):
+        """Resolve pipeline_specs like resolver.resolve(pipeline_specs, target)."""
+        key = self.key(resolver, pipeline_specs, target) if pipeline_specs else None
+        if key is None:
+            return resolver.resolve(pipeline_specs, target)
+
+        entry_path = self.directory / key
+        data = self.pipelines.get(key)
+        if data is None:
+            try:
+                data = entry_path.read_bytes()
+            except OSError:
+                pass
+        if data is not None:
+            try:
+                pipeline = pickle.loads(data)
+                self.pipelines[key] = data
+                self.hits += 1
+                return pipeline
+            except Exception:  # corrupted or incompatible entry is treated like a missing one
+                pass
+
+        self.misses += 1
+        pipeline = resolver.resolve(pipeline_specs, target)
+        try:
+            data = pickle.dumps(pipeline, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return pipeline
+        self.pipelines[key] = data
+        try:
+            write_atomic(entry_path, data)
+        except OSError:  # the cache is an optimization, failing to write it must not fail the command
+            pass
+        return pipeline
@@ -1,3 +1,4 @@
+import copy
 import pathlib
 from collections import Counter
 from sys import stderr
@@ -8,7 +9,9 @@ from dataclasses import fields
 import click
 from prettytable import PrettyTable
 
-from sigma.cli.rules import load_rules
+from sigma.cli.rules import load_rules, rule_loading_options
+from sigma.cli.timings import timings
+from sigma.cli.watch import WatchedRules, create_watcher, watch_options, watch_rules
 from sigma.exceptions import SigmaConditionError, SigmaError
 from sigma.plugins import InstalledSigmaPlugins
 from sigma.validation import SigmaValidator
@@ -21,7 +24,8 @@ severity_color = {"low": "green", "medium": "yellow", "high": "red"}
 # ==========================================
 def setup_validator(validation_config, exclude):
     
-    plugins = InstalledSigmaPlugins.autodiscover()
+    with timings.phase("plugin discovery"):
+        plugins = InstalledSigmaPlugins.autodiscover()
     validators = plugins.validators
 
     if (
@@ -65,16 +69,19 @@ def report_config_warnings(exclude_invalid, exclude_valid):
 def validate_loaded_rules(check_rules, rule_validator):
     with click.progressbar(
         check_rules, label="Checking Sigma rules", file=stderr
-    ) as rules:
+    ) as rules, timings.phase("validation", len(check_rules)):
         issues = rule_validator.validate_rules(rules)
     return issues
 
 
-def load_and_check_rules(input, file_pattern, rule_errors, cond_errors):
-    rule_collection = load_rules(input, file_pattern)
+def check_loaded_rules(rules, rule_errors, cond_errors):
+    """
+    Print the errors of rules and parse the conditions of rules without errors. Returns the rules
+    without errors, which are validated.
+    """
     check_rules = list()
     first_error = True
-    for rule in rule_collection.rules:
+    for rule in rules:
         if (
             len(rule.errors) > 0
         ):  # rule has errors: print errors and skip further checking of rule
@@ -100,6 +107,159 @@ def load_and_check_rules(input, file_pattern, rule_errors, cond_errors):
             check_rules.append(rule)
     return check_rules
 
+
+def load_and_check_rules(input, file_pattern, rule_errors, cond_errors, **load_options):
+    rule_collection = load_rules(input, file_pattern, **load_options)
+    return check_loaded_rules(rule_collection.rules, rule_errors, cond_errors)
+
+
+def report_check(rule_errors, cond_errors, issues):
+    """
+    Print the validation issues and the summary of a check. Returns the counts of rule errors,
+    condition errors and issues.
+    """
+    # TODO: From Python 3.10 the commented line below can be used.
+    rule_error_count = sum(rule_errors.values())
+    # rule_error_count = rule_errors.total()
+
+    issue_count = len(issues)
+    issue_counter = Counter()
+    if issue_count > 0:
+        click.echo("=== Issues ===")
+        for issue in issues:
+            # Need to split SigmaValidationIssue __str__
+            formatted_rules_output = ", ".join(
+                [
+                    str(rule_with_issue.source)
+                    if rule_with_issue.source is not None
+                    else str(rule_with_issue.id) or rule_with_issue.title
+                    for rule_with_issue in issue.rules
+                ]
+            )
+            additional_fields = " ".join(
+                [
+                    f"{field.name}={click.style(issue.__getattribute__(field.name) or '-', bold=True, fg='blue')}"
+                    for field in fields(issue)
+                    if field.name not in ("rules", "severity", "description")
+                ]
+            )
+
+            click.echo(
+                "issue="
+                + click.style(issue.__class__.__name__, bold=True, fg="cyan")
+                + " severity="
+                + click.style(
+                    issue.severity.name.lower(),
+                    bold=True,
+                    fg=severity_color[issue.severity.name.lower()],
+                )
+                + " description="
+                + click.style(issue.description, bold=True, fg="blue")
+                + " rule="
+                + click.style(formatted_rules_output, bold=True, fg="blue")
+                + f" {additional_fields}"
+            )
+            issue_counter.update((issue.__class__,))
+
+    # TODO: From Python 3.10 the commented line below can be used.
+    cond_error_count = sum(cond_errors.values())
+    # cond_error_count = cond_errors.total()
+    click.echo()
+    click.echo("=== Summary ===")
+    click.echo(
+        f"Found {rule_error_count} errors, { cond_error_count } condition errors and { issue_count } issues."
+    )
+
+    if rule_error_count > 0:
+        click.echo("\nRule error summary:")
+        rule_error_table = PrettyTable(
+            field_names=("Count", "Rule Error"),
+            align="l",
+        )
+        rule_error_table.add_rows(
+            [
+                (count, fill(error, width=60))
+                for error, count in sorted(
+                    rule_errors.items(), key=lambda item: item[1], reverse=True
+                )
+            ]
+        )
+        click.echo(rule_error_table.get_string())
+    else:
+        click.echo("No rule errors found.")
+
+    if cond_error_count > 0:
+        click.echo("\nCondition error summary:")
+        cond_error_table = PrettyTable(
+            field_names=("Count", "Condition Error"),
+            align="l",
+        )
+        cond_error_table.add_rows(
+            [
+                (count, fill(error, width=60))
+                for error, count in sorted(
+                    cond_errors.items(), key=lambda item: item[1], reverse=True
+                )
+            ]
+        )
+        click.echo(cond_error_table.get_string())
+    else:
+        click.echo("No condition errors found.")
+
+    if issue_count > 0:
+        click.echo("\nValidation issue summary:")
+        validation_issue_summary = PrettyTable(
+            field_names=("Count", "Issue", "Severity", "Description"),
+            align="l",
+        )
+        validation_issue_summary.add_rows(
+            [
+                (
+                    count,
+                    issue.__name__,
+                    issue.severity.name,
+                    fill(issue.description, width=60),
+                )
+                for issue, count in sorted(
+                    issue_counter.items(), key=lambda item: item[1], reverse=True
+                )
+            ]
+        )
+        click.echo(validation_issue_summary.get_string())
+    else:
+        click.echo("No validation issues found.")
+    return rule_error_count, cond_error_count, issue_count
+
+
+def watch_check(input, file_pattern, rule_validator, polling, interval, **load_options):
+    """
+    Check the rules and check them again after each change of the rule files. Only the rules of
+    changed files and the rules connected to them by correlation references are checked again, so
+    validators that compare rules with each other, like the identifier uniqueness check, only see
+    these rules.
+    """
+    watched = WatchedRules(input, file_pattern, **load_options)
+
+    def handle(changed, removed):
+        rule_collection = watched.collection()
+        rules = watched.affected_rules(rule_collection, changed)
+        rule_errors = Counter()
+        cond_errors = Counter()
+        check_rules = check_loaded_rules(rules, rule_errors, cond_errors)
+        # Validators keep state across rules, each run starts with fresh validators.
+        try:
+            issues = validate_loaded_rules(check_rules, copy.deepcopy(rule_validator))
+        except SigmaError as e:
+            raise click.ClickException("Check error: " + str(e))
+        report_check(rule_errors, cond_errors, issues)
+
+    watch_rules(
+        watched,
+        create_watcher(input, load_options.get("exclude_path", ()), polling, interval),
+        handle,
+    )
+
+
 @click.command()
 @click.option(
     "--validation-config",
@@ -107,13 +267,7 @@ def load_and_check_rules(input, file_pattern, rule_errors, cond_errors):
     type=click.File("r"),
     help="Validation configuration file in YAML format.",
 )
-@click.option(
-    "--file-pattern",
-    "-P",
-    default="*.yml",
-    show_default=True,
-    help="Pattern for file names to be included in recursion into directories.",
-)
+@rule_loading_options
 @click.option(
     "--fail-on-error/--pass-on-error",
     "-e/-E",
@@ -136,6 +290,7 @@ def load_and_check_rules(input, file_pattern, rule_errors, cond_errors):
     multiple=True,
     help="List of validators to exclude from the validation. Repeat --exclude for multiple exclusions.",
 )
+@watch_options
 @click.argument(
     "input",
     nargs=-1,
@@ -143,129 +298,32 @@ def load_and_check_rules(input, file_pattern, rule_errors, cond_errors):
     type=click.Path(exists=True, allow_dash=True, path_type=pathlib.Path),
 )
 def check(
-    input, validation_config, file_pattern, fail_on_error, fail_on_issues, exclude
+    input,
+    validation_config,
+    file_pattern,
+    fail_on_error,
+    fail_on_issues,
+    exclude,
+    watch,
+    watch_polling,
+    watch_interval,
+    **load_options,
 ):
     """Check Sigma rules for validity and best practices (not yet implemented)."""
     
     rule_validator = setup_validator(validation_config, exclude)
 
+    if watch:
+        watch_check(input, file_pattern, rule_validator, watch_polling, watch_interval, **load_options)
+        return
+
     try:
         rule_errors = Counter()
         cond_errors = Counter()
-        check_rules = load_and_check_rules(input, file_pattern, rule_errors, cond_errors)
-
-        # TODO: From Python 3.10 the commented line below can be used.
-        rule_error_count = sum(rule_errors.values())
-        # rule_error_count = rule_errors.total()
+        check_rules = load_and_check_rules(input, file_pattern, rule_errors, cond_errors, **load_options)
 
         issues = validate_loaded_rules(check_rules, rule_validator)
-
-        issue_count = len(issues)
-        issue_counter = Counter()
-        if issue_count > 0:
-            click.echo("=== Issues ===")
-            for issue in issues:
-                # Need to split SigmaValidationIssue __str__
-                formatted_rules_output = ", ".join(
-                    [
-                        str(rule_with_issue.source)
-                        if rule_with_issue.source is not None
-                        else str(rule_with_issue.id) or rule_with_issue.title
-                        for rule_with_issue in issue.rules
-                    ]
-                )
-                additional_fields = " ".join(
-                    [
-                        f"{field.name}={click.style(issue.__getattribute__(field.name) or '-', bold=True, fg='blue')}"
-                        for field in fields(issue)
-                        if field.name not in ("rules", "severity", "description")
-                    ]
-                )
-
-                click.echo(
-                    "issue="
-                    + click.style(issue.__class__.__name__, bold=True, fg="cyan")
-                    + " severity="
-                    + click.style(
-                        issue.severity.name.lower(),
-                        bold=True,
-                        fg=severity_color[issue.severity.name.lower()],
-                    )
-                    + " description="
-                    + click.style(issue.description, bold=True, fg="blue")
-                    + " rule="
-                    + click.style(formatted_rules_output, bold=True, fg="blue")
-                    + f" {additional_fields}"
-                )
-                issue_counter.update((issue.__class__,))
-
-        # TODO: From Python 3.10 the commented line below can be used.
-        cond_error_count = sum(cond_errors.values())
-        # cond_error_count = cond_errors.total()
-        click.echo()
-        click.echo("=== Summary ===")
-        click.echo(
-            f"Found {rule_error_count} errors, { cond_error_count } condition errors and { issue_count } issues."
-        )
-
-        if rule_error_count > 0:
-            click.echo("\nRule error summary:")
-            rule_error_table = PrettyTable(
-                field_names=("Count", "Rule Error"),
-                align="l",
-            )
-            rule_error_table.add_rows(
-                [
-                    (count, fill(error, width=60))
-                    for error, count in sorted(
-                        rule_errors.items(), key=lambda item: item[1], reverse=True
-                    )
-                ]
-            )
-            click.echo(rule_error_table.get_string())
-        else:
-            click.echo("No rule errors found.")
-
-        if cond_error_count > 0:
-            click.echo("\nCondition error summary:")
-            cond_error_table = PrettyTable(
-                field_names=("Count", "Condition Error"),
-                align="l",
-            )
-            cond_error_table.add_rows(
-                [
-                    (count, fill(error, width=60))
-                    for error, count in sorted(
-                        cond_errors.items(), key=lambda item: item[1], reverse=True
-                    )
-                ]
-            )
-            click.echo(cond_error_table.get_string())
-        else:
-            click.echo("No condition errors found.")
-
-        if issue_count > 0:
-            click.echo("\nValidation issue summary:")
-            validation_issue_summary = PrettyTable(
-                field_names=("Count", "Issue", "Severity", "Description"),
-                align="l",
-            )
-            validation_issue_summary.add_rows(
-                [
-                    (
-                        count,
-                        issue.__name__,
-                        issue.severity.name,
-                        fill(issue.description, width=60),
-                    )
-                    for issue, count in sorted(
-                        issue_counter.items(), key=lambda item: item[1], reverse=True
-                    )
-                ]
-            )
-            click.echo(validation_issue_summary.get_string())
-        else:
-            click.echo("No validation issues found.")
+        rule_error_count, cond_error_count, issue_count = report_check(rule_errors, cond_errors, issues)
 
         if (
             fail_on_error
@@ -1,12 +1,43 @@
-import json
+import copy
+import multiprocessing
+import multiprocessing.connection
 import pathlib
+import pickle
 import textwrap
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from typing import Sequence
 
 import click
+import yaml
 
-from sigma.cli.rules import load_rules, check_rule_errors
+from sigma.cli.cache import (
+    ConversionCache,
+    MemoryConversionCache,
+    PipelineCache,
+    package_version,
+    pipeline_fingerprint,
+)
+from sigma.cli.lean import lean_option
+from sigma.cli.output import OutputDirectory, OutputWriter
+from sigma.cli.rules import (
+    RuleStream,
+    check_rule_errors,
+    group_by_references,
+    load_rules,
+    map_in_order,
+    max_chunk_size,
+    requires_collection,
+    rule_loading_options,
+)
+from sigma.cli.timings import timings
+from sigma.cli.watch import WatchedRules, create_watcher, watch_options, watch_rules
+from sigma.collection import SigmaCollection
 from sigma.conversion.base import Backend
+from sigma.correlations import SigmaCorrelationRule, SigmaRuleReference
 from sigma.exceptions import (
     SigmaError,
     SigmaPipelineNotAllowedForBackendError,
@@ -14,7 +45,13 @@ from sigma.exceptions import (
 )
 from sigma.plugins import InstalledSigmaPlugins
 
-plugins = InstalledSigmaPlugins.autodiscover()
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # Windows, memory limits are not supported
+
+with timings.phase("plugin discovery"):
+    plugins = InstalledSigmaPlugins.autodiscover()
 backends = plugins.backends
 pipelines = plugins.pipelines
 pipeline_resolver = plugins.get_pipeline_resolver()
@@ -67,15 +104,848 @@ class ChoiceWithPluginHint(click.Choice):
         )
 
 
+def convert_rule(backend, rule, format, correlation_method=None, conversion_cache=None):
+    """
+    Convert a single rule or correlation rule, from the conversion cache if given. Correlation
+    rules and the rules referenced by them are always converted, because the conversion of
+    correlation rules uses the conversion results of the referenced rules.
+    """
+    with timings.phase("query generation", 1):
+        if isinstance(rule, SigmaCorrelationRule):
+            return backend.convert_correlation_rule(rule, format, correlation_method)
+        if conversion_cache is None or rule._backreferences:
+            return backend.convert_rule(rule, format)
+
+        def convert():
+            error_count = len(backend.errors)
+            queries = backend.convert_rule(rule, format)
+            return queries, len(backend.errors) == error_count  # rules with errors are not cached
+
+        return conversion_cache.load(rule, convert)
+
+
+def convert_rule_stream(backend, rule_stream, format, conversion_cache=None):
+    """
+    Convert rules one by one while they are loaded, without keeping the rule collection in memory.
+    Returns the finalized backend output or None if the rules contain correlation rules or
+    filters, which require the whole rule collection for conversion.
+    """
+    backend.init_processing_pipeline(format)
+    queries = list()
+    for rule in rule_stream:
+        if isinstance(rule, SigmaCorrelationRule) or rule_stream.filters:
+            rule_stream.close()
+            return None
+        if not rule_stream.errors:  # further conversion is pointless, only collect all errors
+            queries.extend(convert_rule(backend, rule, format, conversion_cache=conversion_cache))
+    if rule_stream.filters:
+        return None
+    check_rule_errors(rule_stream)
+    with timings.phase("finalization", len(queries)):
+        return backend.finalize(queries, format)
+
+
+def resolve_pipeline(pipeline, target=None, pipeline_cache=None):
+    """Resolve processing pipeline specifications, from pipeline_cache if given."""
+    with timings.phase("pipeline resolution", len(pipeline)):
+        if pipeline_cache is None:
+            return pipeline_resolver.resolve(pipeline, target)
+        return pipeline_cache.resolve(pipeline_resolver, pipeline, target)
+
+
+def create_backend(
+    target,
+    pipeline,
+    pipeline_check,
+    skip_unsupported,
+    backend_options,
+    enable_template_vars=False,
+    template_vars_path=(),
+    pipeline_cache=None,
+    backend_class=None,
+):
+    """
+    Resolve the processing pipeline, from pipeline_cache if given, and initialize the backend for a
+    conversion. This is also called in the worker processes of parallel conversions, each of them
+    builds its own backend from the same options. The backend class of target can be passed as
+    backend_class, because worker processes started with spawn don't necessarily discover the same
+    backends.
+    """
+    backend_class = backend_class or backends[target]
+    try:
+        processing_pipeline = resolve_pipeline(
+            pipeline, target if pipeline_check else None, pipeline_cache
+        )
+        
+        # Configure template variable settings on the processing pipeline
+        if enable_template_vars:
+            processing_pipeline.allow_template_vars = True
+        if template_vars_path:
+            processing_pipeline.vars_allowed_paths = [str(p) for p in template_vars_path]
+    except SigmaPipelineNotFoundError as e:
+        raise click.UsageError(
+            f"The pipeline '{e.spec}' was not found.\n"
+            + "List all installed processing pipelines with: "
+            + click.style(f"sigma list pipelines {target}", bold=True, fg="green")
+            + "\n"
+            "List pipeline plugins for installation with: "
+            + click.style(
+                f"sigma plugin list --plugin-type pipeline", bold=True, fg="green"
+            )
+            + "\n"
+            + "Pipelines not listed here are treated as file names."
+        )
+    except SigmaPipelineNotAllowedForBackendError as e:
+        raise click.UsageError(
+            textwrap.dedent(
+                f"""
+        The pipeline '{e.wrong_pipeline}' is not intended to be used with the target {target}.
+        You can list all pipelines that are intended to be used with this target with """
+                + click.style(f"sigma list pipelines {target}", bold=True, fg="green")
+                + """.
+        If you know what you're doing and want to use this pipeline(s) in this conversion, disable this
+        check with --disable-pipeline-check.
+        """
+            )
+        )
+
+    try:
+        backend: Backend = backend_class(
+            processing_pipeline=processing_pipeline,
+            collect_errors=skip_unsupported,
+            **backend_options,
+        )
+    except TypeError as e:
+        param = str(e).split("'")[1]
+        raise click.BadParameter(
+            f"Parameter '{param}' is not supported by backend '{target}'.",
+            param_hint="backend_option",
+        )
+
+    return backend
+
+
+worker_backend = None
+
+
+def init_conversion_worker(backend_factory):
+    """Build the backend of a conversion worker process once on its start."""
+    global worker_backend
+    worker_backend = backend_factory()
+
+
+def portable_error(error):
+    """
+    Errors are pickled to return them from worker processes. Some exception classes can't be
+    restored from their pickled form, these are replaced by a SigmaError with the same message.
+    """
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return SigmaError(str(error))
+
+
+def detach_rules(pairs):
+    """
+    Prepare (position, rule) pairs for sending them to a worker process. Pickling follows the
+    references between correlation rules and the rules they reference recursively, which exceeds
+    the recursion limit for long chains of correlation rules. In shallow copies of the rules, the
+    references are replaced by the positions of the referenced rules, attach_rules restores them
+    in the worker. References to rules that aren't contained in pairs are dropped.
+    """
+    positions = {id(rule): position for position, rule in pairs}
+    detached = list()
+    for position, rule in pairs:
+        backreferences = [positions[id(other)] for other in rule._backreferences if id(other) in positions]
+        references = list()
+        rule = copy.copy(rule)
+        rule._backreferences = list()
+        if isinstance(rule, SigmaCorrelationRule):
+            references = [positions.get(id(reference.rule)) for reference in rule.referenced_rules]
+            rule_references = [SigmaRuleReference(reference.reference) for reference in rule.referenced_rules]
+            if rule.rules is not None:  # the same references as referenced_rules
+                rule.rules = rule_references
+            rule.referenced_rules = rule_references
+        detached.append((position, rule, backreferences, references))
+    return detached
+
+
+def attach_rules(detached):
+    """Restore the references between the rules detached with detach_rules and return the (position, rule) pairs."""
+    rules = {position: rule for position, rule, _, _ in detached}
+    for _, rule, backreferences, references in detached:
+        rule._backreferences = [rules[position] for position in backreferences]
+        if isinstance(rule, SigmaCorrelationRule):
+            for reference, position in zip(rule.referenced_rules, references):
+                if position is not None:
+                    reference.rule = rules[position]
+    return [(position, rule) for position, rule, _, _ in detached]
+
+
+def convert_shard(shard, format, correlation_method, conversion_cache=None):
+    """
+    Convert a shard of (position, rule) pairs detached with detach_rules in a worker process.
+    Correlation rules must be in the same shard after the rules referenced by them. Returns the
+    queries of each rule and the errors collected by the backend, both keyed by the rule position,
+    and the conversion cache hit and miss counts of the shard.
+    """
+    shard = attach_rules(shard)
+    worker_backend.init_processing_pipeline(format)
+    worker_backend.errors = list()
+    if conversion_cache is not None:
+        conversion_cache.hits = conversion_cache.misses = 0
+    positions = {id(rule): position for position, rule in shard}
+    try:
+        queries = [
+            (position, convert_rule(worker_backend, rule, format, correlation_method, conversion_cache))
+            for position, rule in shard
+        ]
+    except Exception as e:
+        raise portable_error(e) from None
+    errors = [(positions[id(rule)], portable_error(error)) for rule, error in worker_backend.errors]
+    if conversion_cache is None:
+        return queries, errors, 0, 0
+    return queries, errors, conversion_cache.hits, conversion_cache.misses
+
+
+def conversion_shards(rules, jobs):
+    """
+    Split rules into shards of (position, rule) pairs for conversion in jobs worker processes,
+    detached with detach_rules. Groups of rules connected by correlation references are never
+    split.
+    """
+    positions = {id(rule): position for position, rule in enumerate(rules)}
+    shard_size = min(max_chunk_size, max(1, -(-len(rules) // (jobs * 4))))
+    shards = [[]]
+    for group in group_by_references(rules):
+        if len(shards[-1]) >= shard_size:
+            shards.append([])
+        shards[-1].extend((positions[id(rule)], rule) for rule in group)
+    return [detach_rules(shard) for shard in shards if shard]
+
+
+def iter_conversion(backend, rule_collection, format, correlation_method, conversion_cache=None):
+    """
+    Convert the rules of rule_collection one by one and generate the list of queries of each rule.
+    References must be resolved. This does the same as backend.convert() without finalization.
+    """
+    backend.init_processing_pipeline(format)
+    for rule in rule_collection.rules:
+        yield convert_rule(backend, rule, format, correlation_method, conversion_cache)
+
+
+def iter_parallel_conversion(
+    backend, backend_factory, rule_collection, format, correlation_method, jobs, conversion_cache=None
+):
+    """
+    Convert rule_collection in jobs worker processes and generate the list of queries of each rule
+    in the order of the rules, as soon as the conversion of all preceding rules is finished. The
+    errors collected by the workers are added to backend.errors in the order of the rules and
+    their conversion cache statistics to conversion_cache.
+    """
+    rules = rule_collection.rules
+    results = [None] * len(rules)
+    next_position = 0
+    errors = list()
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_conversion_worker, initargs=(backend_factory,)
+    ) as executor:
+        try:
+            # The conversion runs in the workers, only the time waiting for them is measured.
+            for shard_queries, shard_errors, hits, misses in timings.iterate(
+                "query generation",
+                map_in_order(
+                    executor,
+                    partial(
+                        convert_shard,
+                        format=format,
+                        correlation_method=correlation_method,
+                        conversion_cache=conversion_cache,
+                    ),
+                    conversion_shards(rules, jobs),
+                    jobs * 2,
+                ),
+                lambda result: len(result[0]),
+            ):
+                for position, queries in shard_queries:
+                    results[position] = queries
+                errors.extend(shard_errors)
+                if conversion_cache is not None:
+                    conversion_cache.hits += hits
+                    conversion_cache.misses += misses
+                while next_position < len(rules) and results[next_position] is not None:
+                    yield results[next_position]
+                    results[next_position] = None
+                    next_position += 1
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+    errors.sort(key=lambda item: item[0])
+    backend.errors.extend((rules[position], error) for position, error in errors)
+
+
+def supervised_conversion_worker(
+    connection, backend_factory, format, correlation_method, conversion_cache, memory_limit
+):
+    """
+    Worker process of iter_supervised_conversion. Reports when it is ready, receives groups of
+    (position, rule) pairs, detached with detach_rules, and sends the result of each rule as soon
+    as it is converted, so the supervisor can measure the conversion time of each rule without the
+    startup of the worker. The address space of the process is limited to memory_limit bytes. A rule exceeding it is reported and the worker exits, because its state is unreliable
+    after running out of memory.
+    """
+    if memory_limit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    init_conversion_worker(backend_factory)
+    worker_backend.init_processing_pipeline(format)
+    connection.send(("ready",))
+    while (group := connection.recv()) is not None:
+        for position, rule in attach_rules(group):
+            worker_backend.errors = list()
+            if conversion_cache is not None:
+                conversion_cache.hits = conversion_cache.misses = 0
+            try:
+                queries = convert_rule(worker_backend, rule, format, correlation_method, conversion_cache)
+                errors = [portable_error(error) for _, error in worker_backend.errors]
+                hits, misses = (
+                    (conversion_cache.hits, conversion_cache.misses) if conversion_cache else (0, 0)
+                )
+                connection.send(("done", position, queries, errors, hits, misses))
+            except MemoryError:
+                connection.send(("memory", position))
+                return
+            except Exception as e:
+                connection.send(("error", position, portable_error(e)))
+
+
+class SupervisedWorker:
+    """
+    A worker process of iter_supervised_conversion with the group of rules it converts and the
+    index of the next rule of the group it will return a result for. The time limit of a rule only
+    starts when the worker is ready, so a slow startup of the process isn't counted.
+    """
+
+    def __init__(self, args):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=supervised_conversion_worker, args=(child_connection, *args), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.group = None
+        self.index = 0
+        self.deadline = None
+        self.ready = False
+
+    def convert(self, group, timeout):
+        self.group = group
+        self.index = 0
+        self.deadline = None if timeout is None or not self.ready else time.monotonic() + timeout
+        self.connection.send(detach_rules(group))
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+            self.process.join(1)
+        except OSError:
+            pass
+        if self.process.is_alive():
+            self.kill()
+
+
+def iter_supervised_conversion(
+    backend,
+    backend_factory,
+    rule_collection,
+    format,
+    correlation_method,
+    jobs,
+    timeout=None,
+    memory_limit=None,
+    conversion_cache=None,
+):
+    """
+    Convert rule_collection in jobs supervised worker processes and generate the list of queries
+    of each rule in the order of the rules. Rules whose conversion takes longer than timeout
+    seconds or exceeds memory_limit bytes, or whose worker dies, are skipped: their worker is
+    replaced and the rule is reported in backend.errors like an unsupported rule, together with
+    the correlation rules referencing it. Groups of rules connected by correlation references are
+    converted by the same worker. If a worker is replaced in the middle of a group, the remaining
+    rules of the group are converted again together with the rules they reference.
+    """
+    rules = rule_collection.rules
+    positions = {id(rule): position for position, rule in enumerate(rules)}
+    pending = deque(
+        [(positions[id(rule)], rule) for rule in group] for group in group_by_references(rules)
+    )
+    results = [None] * len(rules)
+    done = [False] * len(rules)
+    skipped = set()
+    errors = list()
+    next_position = 0
+    limit_message = {
+        "timeout": f"time limit of {timeout} seconds exceeded",
+        "memory": f"memory limit of {(memory_limit or 0) // (1024 * 1024)} MiB exceeded",
+    }
+    args = (backend_factory, format, correlation_method, conversion_cache, memory_limit)
+    workers = [SupervisedWorker(args) for _ in range(min(jobs, len(pending)))]
+
+    def skip(position, reason):
+        results[position] = list()
+        done[position] = True
+        skipped.add(position)
+        errors.append((position, SigmaError(f"Conversion skipped: {reason}")))
+
+    def replace(worker, reason):
+        """Skip the current rule of worker, replace it and requeue the rest of its group."""
+        group, index = worker.group, worker.index
+        skip(group[index][0], reason)
+        worker.kill()
+        workers[workers.index(worker)] = SupervisedWorker(args)
+        remaining = list()
+        for position, rule in group:  # referenced rules are ordered before correlation rules
+            if position in skipped:
+                continue
+            if (
+                isinstance(rule, SigmaCorrelationRule)
+                and not done[position]
+                and any(positions.get(id(reference.rule)) in skipped for reference in rule.referenced_rules)
+            ):
+                skip(position, "referenced rule was skipped")
+                continue
+            remaining.append((position, rule))
+        if any(not done[position] for position, _ in remaining):
+            pending.appendleft(remaining)
+
+    try:
+        while next_position < len(rules):
+            for worker in workers:
+                while worker.group is None and pending:
+                    group = pending.popleft()
+                    if not all(done[position] for position, _ in group):
+                        worker.convert(group, timeout)
+            busy = [worker for worker in workers if worker.group is not None]
+            wait_timeout = None
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            if deadlines:
+                wait_timeout = max(0, min(deadlines) - time.monotonic())
+            with timings.phase("query generation"):
+                ready = multiprocessing.connection.wait(
+                    [worker.connection for worker in busy], wait_timeout
+                )
+            for worker in busy:
+                if worker.connection in ready:
+                    try:
+                        message = worker.connection.recv()
+                    except (EOFError, OSError):
+                        worker.process.join()
+                        replace(worker, f"worker process terminated with exit code {worker.process.exitcode}")
+                        continue
+                    if message[0] == "ready":
+                        worker.ready = True
+                        if timeout is not None:
+                            worker.deadline = time.monotonic() + timeout
+                        continue
+                    if message[0] == "error":
+                        raise message[2]
+                    if message[0] == "memory":
+                        replace(worker, limit_message["memory"])
+                        continue
+                    _, position, queries, rule_errors, hits, misses = message
+                    if not done[position]:
+                        results[position] = queries
+                        done[position] = True
+                        errors.extend((position, error) for error in rule_errors)
+                        if conversion_cache is not None:
+                            conversion_cache.hits += hits
+                            conversion_cache.misses += misses
+                    worker.index += 1
+                    if worker.index == len(worker.group):
+                        worker.group = None
+                    elif timeout is not None:
+                        worker.deadline = time.monotonic() + timeout
+                elif worker.deadline is not None and worker.deadline <= time.monotonic():
+                    replace(worker, limit_message["timeout"])
+            while next_position < len(rules) and done[next_position]:
+                yield results[next_position]
+                results[next_position] = None
+                next_position += 1
+    finally:
+        for worker in workers:
+            worker.stop()
+    errors.sort(key=lambda item: item[0])
+    backend.errors.extend((rules[position], error) for position, error in errors)
+
+
+def convert_collection(backend, rule_queries, format):
+    """Finalize the queries generated by rule_queries into the backend output."""
+    queries = [query for queries in rule_queries for query in queries]
+    backend.init_processing_pipeline(format)
+    with timings.phase("finalization", len(queries)):
+        return backend.finalize(queries, format)
+
+
+def convert_streaming(backend, rule_queries, format, writer):
+    """
+    Finalize the queries generated by rule_queries rule by rule and write them with writer as soon
+    as they are available. This requires an output format that returns a list with an item per
+    query and no finalizers in the processing pipeline, which operate on the whole output.
+    """
+    backend.init_processing_pipeline(format)
+    if backend.last_processing_pipeline.finalizers:
+        raise click.UsageError(
+            "Streaming output is not possible with processing pipelines that contain finalizers."
+        )
+    for queries in rule_queries:
+        if not queries:
+            continue
+        with timings.phase("finalization", len(queries)):
+            output = backend.finalize(queries, format)
+        if not isinstance(output, list):
+            raise click.UsageError(
+                f"Output format '{format}' doesn't return a list of queries and can't be streamed."
+            )
+        writer.write_items(output)
+    writer.close()
+
+
+def convert_to_directory(backend, rules, rule_queries, format, output_directory):
+    """
+    Finalize the queries generated by rule_queries for each of rules separately and write them
+    into one file per rule in output_directory.
+    """
+    backend.init_processing_pipeline(format)
+    for rule, queries in zip(rules, rule_queries):
+        if queries:
+            with timings.phase("finalization", len(queries)):
+                output = backend.finalize(queries, format)
+            output_directory.write_rule(rule, output)
+    output_directory.close()
+    click.echo(
+        f"Output directory: {output_directory.written} files written, "
+        + f"{output_directory.unchanged} unchanged, {output_directory.removed} removed",
+        err=True,
+    )
+
+
+class Conversion:
+    """
+    Conversion of a rule set with one backend, processing pipeline and output format. The backend
+    and the processing pipeline are resolved and the options are validated on construction, so
+    that errors are reported before any rules are loaded.
+    """
+
+    def __init__(
+        self,
+        target,
+        pipeline,
+        format,
+        correlation_method,
+        backend_options,
+        without_pipeline=False,
+        pipeline_check=True,
+        skip_unsupported=False,
+        enable_template_vars=False,
+        template_vars_path=(),
+        conversion_cache=False,
+        cache_dir=None,
+        pipeline_cache=None,
+        rule_timeout=None,
+        rule_memory_limit=None,
+    ):
+        if rule_memory_limit is not None and resource is None:
+            raise click.UsageError("Memory limits for rules are not supported on this platform.")
+
+        # Check if pipeline is required
+        if backends[target].requires_pipeline and len(pipeline) == 0 and not without_pipeline:
+            raise click.UsageError(
+                textwrap.dedent(
+                    f"""
+            Processing pipeline required by backend! Define a custom pipeline or choose a predefined one.
+
+            Get all available pipelines for {target} with:
+            """
+                    + click.style(f"sigma list pipelines {target}", bold=True, fg="green")
+                    + """
+
+            If you never heard about processing pipelines you should get familiar with them
+            (https://sigmahq-pysigma.readthedocs.io/en/latest/Processing_Pipelines.html).
+            If you know what you're doing add --without-pipeline to your command line to suppress this error.
+            """
+                )
+            )
+
+        self.target = target
+        self.format = format
+        self.correlation_method = correlation_method
+        self.rule_timeout = rule_timeout
+        self.rule_memory_limit = rule_memory_limit
+        self.backend_factory = partial(
+            create_backend,
+            target,
+            pipeline,
+            pipeline_check,
+            skip_unsupported,
+            backend_options,
+            enable_template_vars,
+            template_vars_path,
+            pipeline_cache,
+            backends[target],
+        )
+        self.backend = backend = self.backend_factory()
+
+        if format not in backends[target].formats.keys():
+            raise click.BadParameter(
+                f"Output format '{format}' is not supported by backend '{target}'. Run "
+                + click.style(f"sigma list formats {target}", bold=True, fg="green")
+                + " to list all available formats of the target.",
+                param_hint="format",
+            )
+
+        if correlation_method is not None:
+            correlation_methods = backend.correlation_methods
+            if correlation_methods is None:
+                raise click.BadParameter(
+                    f"Backend '{target}' does not support correlations but correlation method was provided on command line.",
+                    param_hint="correlation_method",
+                )
+            elif correlation_method not in correlation_methods.keys():
+                raise click.BadParameter(
+                    f"Correlation method '{correlation_method}' is not supported by backend '{target}'. Run "
+                    + click.style(f"sigma list correlation-methods {target}", bold=True, fg="green")
+                    + " to list all available correlation methods of the target.",
+                    param_hint="correlation_method",
+                )
+
+        if conversion_cache:
+            self.conversion_cache = ConversionCache(
+                cache_dir,
+                {
+                    "backend": f"{type(backend).__module__}.{type(backend).__qualname__}",
+                    "backend_version": package_version(type(backend)),
+                    "pipeline": pipeline_fingerprint(pipeline, pipeline_resolver.pipelines),
+                    "template_vars": (enable_template_vars, [str(path) for path in template_vars_path]),
+                    "format": format,
+                    "correlation_method": correlation_method,
+                    "backend_options": backend_options,
+                },
+            )
+        else:
+            self.conversion_cache = None
+
+    def convert_stream(self, rule_stream):
+        """Convert a RuleStream, see convert_rule_stream."""
+        return convert_rule_stream(self.backend, rule_stream, self.format, self.conversion_cache)
+
+    def converts_in_process(self, rule_collection, jobs=1):
+        """Check if convert converts the rules in this process, where the conversion modifies them."""
+        supervised = self.rule_timeout is not None or self.rule_memory_limit is not None
+        return not supervised and not (jobs > 1 and len(rule_collection) > 1)
+
+    def convert(self, rule_collection, jobs=1, writer=None, output_directory=None, stream=False):
+        """
+        Convert rule_collection, with jobs worker processes if jobs is greater than one. With rule
+        time or memory limits, the rules are always converted in supervised worker processes. The
+        output is written into output_directory if given and with writer otherwise.
+        """
+        backend = self.backend
+        backend.errors = list()
+        if self.conversion_cache is not None:
+            self.conversion_cache.hits = self.conversion_cache.misses = 0
+        supervised = self.rule_timeout is not None or self.rule_memory_limit is not None
+        in_process = self.converts_in_process(rule_collection, jobs)
+        if supervised:
+            rule_queries = iter_supervised_conversion(
+                backend,
+                self.backend_factory,
+                rule_collection,
+                self.format,
+                self.correlation_method,
+                jobs,
+                self.rule_timeout,
+                self.rule_memory_limit and self.rule_memory_limit * 1024 * 1024,
+                self.conversion_cache,
+            )
+        elif not in_process:
+            rule_queries = iter_parallel_conversion(
+                backend,
+                self.backend_factory,
+                rule_collection,
+                self.format,
+                self.correlation_method,
+                jobs,
+                self.conversion_cache,
+            )
+        else:
+            rule_queries = iter_conversion(
+                backend, rule_collection, self.format, self.correlation_method, self.conversion_cache
+            )
+
+        if output_directory is not None:
+            convert_to_directory(backend, rule_collection.rules, rule_queries, self.format, output_directory)
+        elif stream:
+            convert_streaming(backend, rule_queries, self.format, writer)
+        else:
+            writer.write_result(convert_collection(backend, rule_queries, self.format))
+
+    def report(self, cache_stats=False, label=None):
+        """Report conversion cache statistics and the errors ignored by the backend."""
+        label = f" ({label})" if label else ""
+        if self.conversion_cache is not None and cache_stats:
+            hits, misses = self.conversion_cache.hits, self.conversion_cache.misses
+            click.echo(
+                f"Conversion cache{label}: {hits} hits, {misses} misses"
+                + (f" ({hits / (hits + misses):.1%} hit rate)" if hits + misses else ""),
+                err=True,
+            )
+
+        if len(self.backend.errors) > 0:
+            click.echo(f"\nIgnored errors{label}:", err=True)
+            for rule, error in self.backend.errors:
+                click.echo(f"{str(rule.source)}: {str(error)}", err=True)
+
+
+@contextmanager
+def conversion_errors(verbose):
+    """Turn errors raised by backends into click exceptions with a message."""
+    try:
+        yield
+    except SigmaError as e:
+        if verbose:
+            click.echo('Error while converting')
+            raise e
+        else:
+            raise click.ClickException("Error while converting: " + str(e))
+    except NotImplementedError as e:
+        if verbose:
+            click.echo('Feature required for conversion of Sigma rule is not supported by backend')
+            raise e
+        else:
+            raise click.ClickException("Feature required for conversion of Sigma rule is not supported by backend: " + str(e))
+
+
+def merge_backend_options(backend_option):
+    """Merge backend options: multiple occurences of a key result in array of values"""
+    backend_options = dict()
+    for option in backend_option:
+        for k, v in option.items():
+            backend_options.setdefault(k, list()).append(v)
+    return {
+        k: (v[0] if len(v) == 1 else v)  # if there's only one item, return it.
+        for k, v in backend_options.items()
+    }
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def load_matrix(path):
+    """
+    Load a conversion matrix file. This is a YAML file with a list of conversions, each with a
+    target, optional pipelines, output format, correlation method and backend options, and an
+    output file or directory:
+
+        conversions:
+          - target: splunk
+            pipeline: [sysmon, splunk_windows]
+            format: savedsearches
+            output: splunk/savedsearches.conf
+          - target: lucene
+            pipeline: ecs_windows
+            backend-options:
+              index: winlogbeat-*
+            output-dir: lucene
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            matrix = yaml.safe_load(f)
+        conversions = matrix["conversions"]
+        if not isinstance(conversions, list) or not conversions:
+            raise ValueError("'conversions' must be a non-empty list")
+        allowed_keys = {"target", "pipeline", "format", "correlation-method", "backend-options", "output", "output-dir"}
+        for i, conversion in enumerate(conversions, 1):
+            if not isinstance(conversion, dict):
+                raise ValueError(f"conversion {i} must be a mapping")
+            if unknown_keys := set(conversion) - allowed_keys:
+                raise ValueError(f"unknown keys in conversion {i}: {', '.join(sorted(unknown_keys))}")
+            if conversion.get("target") not in backends:
+                raise ValueError(f"unknown target '{conversion.get('target')}' in conversion {i}")
+            if ("output" in conversion) == ("output-dir" in conversion):
+                raise ValueError(f"conversion {i} must have either an output or an output-dir")
+            if not isinstance(conversion.get("backend-options", {}), dict):
+                raise ValueError(f"backend-options of conversion {i} must be a mapping")
+    except (OSError, yaml.YAMLError, TypeError, KeyError, ValueError) as e:
+        raise click.BadParameter(f"Invalid conversion matrix '{path}': {e}", param_hint="matrix")
+    return conversions
+
+
+def watch_convert(
+    conversion,
+    input,
+    file_pattern,
+    writer,
+    output_directory,
+    stream,
+    verbose,
+    cache_stats,
+    polling,
+    interval,
+    **load_options,
+):
+    """
+    Convert the rules and convert them again after each change of the rule files. With an output
+    directory, the whole rule set is converted again, with the queries of unchanged rules reused
+    from memory, and only the files of changed rules are written. Otherwise, only the queries of
+    the rules of changed files and the rules connected to them by correlation references are
+    written to the output. output_directory is a factory of the OutputDirectory of each run.
+    """
+    watched = WatchedRules(input, file_pattern, **load_options)
+    if output_directory is not None:
+        conversion.conversion_cache = MemoryConversionCache(conversion.conversion_cache)
+
+    def handle(changed, removed):
+        rule_collection = watched.collection()
+        check_rule_errors(rule_collection)
+        if output_directory is None:
+            rules = watched.affected_rules(rule_collection, changed)
+            if not rules:
+                return
+            rule_collection = SigmaCollection(rules, resolve_references=False)
+        with conversion_errors(verbose):
+            conversion.convert(
+                rule_collection,
+                writer=writer,
+                output_directory=output_directory and output_directory(),
+                stream=stream,
+            )
+        if output_directory is not None:
+            conversion.conversion_cache.prune()
+        conversion.report(cache_stats)
+
+    watch_rules(
+        watched,
+        create_watcher(input, load_options.get("exclude_path", ()), polling, interval),
+        handle,
+    )
+
+
 @click.command()
 @click.option(
     "--target",
     "-t",
     type=ChoiceWithPluginHint(backends.keys(), "backend"),
-    required=True,
     help="Target query language ("
     + click.style("sigma list targets", bold=True, fg="green")
-    + ")",
+    + "). Required unless --matrix is given.",
 )
 @click.option(
     "--pipeline",
@@ -108,25 +978,38 @@ class ChoiceWithPluginHint(click.Choice):
     "-c",
     help="Select method for generation of correlation queries. If not given the default method of the backend is used."
 )
+@click.option(
+    "--matrix",
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+    help="Convert the rules with all targets, pipelines and formats defined in a YAML conversion matrix file. "
+    "Rules are loaded and checked only once.",
+)
 @click.option(
     "--filter",
     multiple=True,
     type=click.Path(exists=True, allow_dash=True, path_type=pathlib.Path),
     help="Select filters/exclusions to apply to the rules. Multiple Sigma meta filters can be applied.",
 )
-@click.option(
-    "--file-pattern",
-    "-P",
-    default="*.yml",
-    show_default=True,
-    help="Pattern for file names to be included in recursion into directories.",
-)
+@rule_loading_options
 @click.option(
     "--skip-unsupported/--fail-unsupported",
     "-s/",
     default=False,
     help="Skip conversion of rules that can't be handled by the backend",
 )
+@click.option(
+    "--rule-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Skip rules whose conversion takes longer than this number of seconds. Rules are converted in "
+    "supervised worker processes (--jobs, at least one) that are replaced if a rule exceeds a limit. "
+    "Skipped rules are reported like rules skipped with --skip-unsupported.",
+)
+@click.option(
+    "--rule-memory-limit",
+    type=click.IntRange(min=1),
+    help="Skip rules whose conversion exceeds this memory limit in MiB. The limit applies to the address "
+    "space of each supervised worker process, including the memory used by Python and the plugins.",
+)
 @click.option(
     "--output",
     "-o",
@@ -135,6 +1018,19 @@ class ChoiceWithPluginHint(click.Choice):
     show_default=True,
     help="Write result to specified file. '-' writes to standard output.",
 )
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    help="Write the result of each rule into its own file in the given directory, named by the rule id. "
+    "Only files with changed content are written, files of rules that were removed since the last run are deleted.",
+)
+@click.option(
+    "--output-threads",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="Number of threads that write files with --output-dir.",
+)
 @click.option(
     "--encoding",
     "-e",
@@ -143,6 +1039,50 @@ class ChoiceWithPluginHint(click.Choice):
     show_default=True,
     help="Output encoding for string backend outputs. This is ignored for backends that return binary output.",
 )
+@click.option(
+    "--pipeline-cache/--no-pipeline-cache",
+    default=True,
+    help="Cache resolved processing pipelines on disk and resolve them again only if pipeline files or plugins changed.",
+)
+@click.option(
+    "--conversion-cache/--no-conversion-cache",
+    default=False,
+    help="Cache converted queries on disk and reuse them for unchanged rules, backends, pipelines and options. "
+    "The cache is stored in the directory given with --rule-cache-dir.",
+)
+@click.option(
+    "--conversion-cache-max-size",
+    type=click.IntRange(min=0),
+    default=1024,
+    show_default=True,
+    help="Maximum size of the conversion cache in MiB. Least recently used entries are evicted first.",
+)
+@click.option(
+    "--conversion-cache-max-age",
+    type=click.IntRange(min=0),
+    default=30,
+    show_default=True,
+    help="Evict conversion cache entries that were not used for this number of days.",
+)
+@click.option(
+    "--cache-stats",
+    is_flag=True,
+    default=False,
+    help="Show statistics of the conversion cache.",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    default=False,
+    help="Write queries to the output as soon as they are converted instead of writing the whole result at the end. "
+    "Only possible for output formats that return a list of queries.",
+)
+@click.option(
+    "--ndjson",
+    is_flag=True,
+    default=False,
+    help="Write each query as JSON document on its own line (newline-delimited JSON). Implies --stream.",
+)
 @click.option(
     "--json-indent",
     "-j",
@@ -169,6 +1109,8 @@ class ChoiceWithPluginHint(click.Choice):
     type=click.Path(exists=True, path_type=pathlib.Path),
     help="Allowed paths for template variable expansion. Can be specified multiple times.",
 )
+@watch_options
+@lean_option
 @click.argument(
     "input",
     nargs=-1,
@@ -190,180 +1132,201 @@ def convert(
     pipeline_check,
     format,
     correlation_method,
+    matrix,
     filter,
     skip_unsupported,
+    rule_timeout,
+    rule_memory_limit,
     output,
+    output_dir,
+    output_threads,
     encoding,
+    pipeline_cache,
+    conversion_cache,
+    conversion_cache_max_size,
+    conversion_cache_max_age,
+    cache_stats,
+    stream,
+    ndjson,
     json_indent,
     backend_option,
     enable_template_vars,
     template_vars_path,
+    watch,
+    watch_polling,
+    watch_interval,
     input,
     file_pattern,
     verbose,
+    **load_options,
 ):
     """
     Convert Sigma rules into queries. INPUT can be multiple files or directories. This command automatically recurses
-    into directories and converts all files matching the pattern in --file-pattern.
-    """
+    into directories and converts all files matching the patterns in --file-pattern.
 
-    # Check if pipeline is required
-    if backends[target].requires_pipeline and pipeline == () and not without_pipeline:
-        raise click.UsageError(
-            textwrap.dedent(
-                f"""
-        Processing pipeline required by backend! Define a custom pipeline or choose a predefined one.
+    With --matrix, the rules are loaded once and converted with each target, pipeline and output format defined in the
+    conversion matrix file. The conversion options given on the command line apply to all these conversions.
 
-        Get all available pipelines for {target} with:
-        """
-                + click.style(f"sigma list pipelines {target}", bold=True, fg="green")
-                + """
+    With --watch, the rules are converted again after each change of the rule files. Only changed files are parsed
+    again and only the queries of changed rules are written to the output. With --output-dir, only the files of
+    changed rules are updated.
 
-        If you never heard about processing pipelines you should get familiar with them
-        (https://sigmahq-pysigma.readthedocs.io/en/latest/Processing_Pipelines.html).
-        If you know what you're doing add --without-pipeline to your command line to suppress this error.
-        """
-            )
-        )
+    Rules are converted while they are loaded. Correlation rules and filters require the whole rule set, rule files are
+    searched for them without parsing before the conversion starts. Rules from standard input are always loaded
+    completely first and the conversion starts over if correlation rules or filters are found in archives.
+    """
 
-    # Merge backend options: multiple occurences of a key result in array of values
-    backend_options = dict()
-    for option in backend_option:
-        for k, v in option.items():
-            backend_options.setdefault(k, list()).append(v)
-    backend_options = {
-        k: (v[0] if len(v) == 1 else v)  # if there's only one item, return it.
-        for k, v in backend_options.items()
-    }
+    if ndjson and json_indent is not None:
+        raise click.UsageError("JSON indentation is not possible with newline-delimited JSON output.")
+    stream = stream or ndjson
+    if watch and matrix is not None:
+        raise click.UsageError("--watch can't be used with --matrix.")
+    if matrix is not None:
+        context = click.get_current_context()
+        for name, option in (
+            ("target", "--target"),
+            ("pipeline", "--pipeline"),
+            ("format", "--format"),
+            ("correlation_method", "--correlation-method"),
+            ("backend_option", "--backend-option"),
+        ):
+            if context.get_parameter_source(name) is not click.core.ParameterSource.DEFAULT:
+                raise click.UsageError(f"{option} can't be used with --matrix, define it in the conversion matrix.")
+    if watch and (rule_timeout is not None or rule_memory_limit is not None):
+        raise click.UsageError("--watch can't be used with --rule-timeout or --rule-memory-limit.")
+    jobs = load_options.get("jobs", 1)
+    cache_dir = load_options.get("rule_cache_dir")
+    common_options = dict(
+        without_pipeline=without_pipeline,
+        pipeline_check=pipeline_check,
+        skip_unsupported=skip_unsupported,
+        enable_template_vars=enable_template_vars,
+        template_vars_path=template_vars_path,
+        conversion_cache=conversion_cache,
+        cache_dir=cache_dir,
+        pipeline_cache=PipelineCache(cache_dir) if pipeline_cache else None,
+        rule_timeout=rule_timeout,
+        rule_memory_limit=rule_memory_limit,
+    )
 
-    # Initialize processing pipeline and backend
-    backend_class = backends[target]
-    try:
-        processing_pipeline = pipeline_resolver.resolve(
-            pipeline, target if pipeline_check else None
-        )
-        
-        # Configure template variable settings on the processing pipeline
-        if enable_template_vars:
-            processing_pipeline.allow_template_vars = True
-        if template_vars_path:
-            processing_pipeline.vars_allowed_paths = [str(p) for p in template_vars_path]
-    except SigmaPipelineNotFoundError as e:
-        raise click.UsageError(
-            f"The pipeline '{e.spec}' was not found.\n"
-            + "List all installed processing pipelines with: "
-            + click.style(f"sigma list pipelines {target}", bold=True, fg="green")
-            + "\n"
-            "List pipeline plugins for installation with: "
-            + click.style(
-                f"sigma plugin list --plugin-type pipeline", bold=True, fg="green"
-            )
-            + "\n"
-            + "Pipelines not listed here are treated as file names."
-        )
-    except SigmaPipelineNotAllowedForBackendError as e:
-        raise click.UsageError(
-            textwrap.dedent(
-                f"""
-        The pipeline '{e.wrong_pipeline}' is not intended to be used with the target {target}.
-        You can list all pipelines that are intended to be used with this target with """
-                + click.style(f"sigma list pipelines {target}", bold=True, fg="green")
-                + """.
-        If you know what you're doing and want to use this pipeline(s) in this conversion, disable this
-        check with --disable-pipeline-check.
-        """
+    if matrix is not None:
+        conversions = [
+            (
+                Conversion(
+                    entry["target"],
+                    as_list(entry.get("pipeline")),
+                    entry.get("format", "default"),
+                    entry.get("correlation-method"),
+                    entry.get("backend-options", {}),
+                    **common_options,
+                ),
+                entry,
             )
+            for entry in load_matrix(matrix)
+        ]
+        rule_collection = load_rules(input + filter, file_pattern, keep_input=filter, **load_options)
+        check_rule_errors(rule_collection)
+        for i, (conversion, entry) in enumerate(conversions):
+            # Conversion modifies the rules, each conversion in this process gets its own copy.
+            # Rules converted in worker processes are copies anyway.
+            rules = rule_collection
+            if conversion.converts_in_process(rule_collection, jobs) and i < len(conversions) - 1:
+                rules = copy.deepcopy(rule_collection)
+            label = f"{entry['target']}/{conversion.format}"
+            with conversion_errors(verbose):
+                if "output-dir" in entry:
+                    conversion.convert(
+                        rules,
+                        jobs,
+                        output_directory=OutputDirectory(
+                            entry["output-dir"], encoding, json_indent, ndjson, output_threads
+                        ),
+                    )
+                else:
+                    with click.open_file(entry["output"], "wb") as f:
+                        conversion.convert(
+                            rules, jobs, OutputWriter(f, encoding, json_indent, ndjson), stream=stream
+                        )
+            conversion.report(cache_stats, label)
+        evict_conversion_cache(
+            conversions[0][0].conversion_cache,
+            conversion_cache_max_size,
+            conversion_cache_max_age,
+            cache_stats,
         )
+        return
 
-    try:
-        backend: Backend = backend_class(
-            processing_pipeline=processing_pipeline,
-            collect_errors=skip_unsupported,
-            **backend_options,
-        )
-    except TypeError as e:
-        param = str(e).split("'")[1]
-        raise click.BadParameter(
-            f"Parameter '{param}' is not supported by backend '{target}'.",
-            param_hint="backend_option",
-        )
+    if target is None:
+        raise click.UsageError("Missing option '--target' / '-t'.")
+    if (
+        output_dir is not None
+        and click.get_current_context().get_parameter_source("output")
+        is not click.core.ParameterSource.DEFAULT
+    ):
+        raise click.UsageError("--output and --output-dir can't be used together.")
 
-    if format not in backends[target].formats.keys():
-        raise click.BadParameter(
-            f"Output format '{format}' is not supported by backend '{target}'. Run "
-            + click.style(f"sigma list formats {target}", bold=True, fg="green")
-            + " to list all available formats of the target.",
-            param_hint="format",
+    conversion = Conversion(
+        target,
+        pipeline,
+        format,
+        correlation_method,
+        merge_backend_options(backend_option),
+        **common_options,
+    )
+    writer = OutputWriter(output, encoding, json_indent, ndjson)
+    if watch:
+        watch_convert(
+            conversion,
+            input + filter,
+            file_pattern,
+            writer,
+            output_dir and partial(OutputDirectory, output_dir, encoding, json_indent, ndjson, output_threads),
+            stream,
+            verbose,
+            cache_stats,
+            watch_polling,
+            watch_interval,
+            **load_options,
         )
-    
-    if correlation_method is not None:
-        correlation_methods = backend.correlation_methods
-        if correlation_methods is None:
-            raise click.BadParameter(
-                f"Backend '{target}' does not support correlations but correlation method was provided on command line.",
-                param_hint="correlation_method",
-            )
-        elif correlation_method not in correlation_methods.keys():
-            raise click.BadParameter(
-                f"Correlation method '{correlation_method}' is not supported by backend '{target}'. Run "
-                + click.style(f"sigma list correlation-methods {target}", bold=True, fg="green")
-                + " to list all available correlation methods of the target.",
-                param_hint="correlation_method",
-            )
-
-    try:
-        rule_collection = load_rules(input + filter, file_pattern)
-        check_rule_errors(rule_collection)
-        result = backend.convert(rule_collection, format, correlation_method)
-        if isinstance(result, str):  # String result
-            click.echo(bytes(result, encoding), output)
-        elif isinstance(result, bytes):  # Bytes result: only allow to write it to file.
-            if output.isatty():
-                raise click.UsageError(
-                    "Backend returns binary output. Please provide output file with --output/-o."
-                )
-            else:
-                click.echo(result, output)
-        elif isinstance(result, list) and all(
-            (  # List of strings Concatenate with newlines in between.
-                isinstance(item, str) for item in result
-            )
-        ):
-            click.echo(bytes("\n\n".join(result), encoding), output)
-        elif isinstance(result, list) and all(
-            (  # List of dicts: concatenate with newline and render each result als JSON.
-                isinstance(item, dict) for item in result
-            )
+        return
+    with conversion_errors(verbose):
+        if (
+            filter
+            or jobs > 1
+            or load_options.get("shard") is not None
+            or stream
+            or output_dir is not None
+            or rule_timeout is not None
+            or rule_memory_limit is not None
+            or requires_collection(input, file_pattern, load_options.get("exclude_path", ()))
         ):
-            click.echo(
-                bytes(
-                    "\n".join(
-                        (json.dumps(item, indent=json_indent) for item in result)
-                    ),
-                    encoding,
-                ),
-                output,
-            )
-        elif isinstance(result, dict):
-            click.echo(bytes(json.dumps(result, indent=json_indent), encoding))
-        else:
-            raise click.ClickException(
-                f"Backend returned unexpected format {str(type(result))}"
-            )
-    except SigmaError as e:
-        if verbose:
-            click.echo('Error while converting')
-            raise e
+            result = None
         else:
-            raise click.ClickException("Error while converting: " + str(e))
-    except NotImplementedError as e:
-        if verbose:
-            click.echo('Feature required for conversion of Sigma rule is not supported by backend')
-            raise e
+            result = conversion.convert_stream(RuleStream(input, file_pattern, **load_options))
+        if result is None:  # conversion of the whole collection is required
+            rule_collection = load_rules(input + filter, file_pattern, keep_input=filter, **load_options)
+            check_rule_errors(rule_collection)
+            output_directory = None
+            if output_dir is not None:
+                output_directory = OutputDirectory(output_dir, encoding, json_indent, ndjson, output_threads)
+            conversion.convert(rule_collection, jobs, writer, output_directory, stream)
         else:
-            raise click.ClickException("Feature required for conversion of Sigma rule is not supported by backend: " + str(e))
+            writer.write_result(result)
+
+    evict_conversion_cache(
+        conversion.conversion_cache, conversion_cache_max_size, conversion_cache_max_age, cache_stats
+    )
+    conversion.report(cache_stats)
 
-    if len(backend.errors) > 0:
-        click.echo("\nIgnored errors:", err=True)
-        for rule, error in backend.errors:
-            click.echo(f"{str(rule.source)}: {str(error)}", err=True)
+
+def evict_conversion_cache(conversion_cache, max_size, max_age, cache_stats):
+    """Evict old entries from the conversion cache and show its size."""
+    if conversion_cache is None:
+        return
+    removed, entries = conversion_cache.evict(max_size * 2**20, max_age * 86400)
+    if cache_stats:
+        click.echo(
+            f"Conversion cache size: {len(entries)} entries "
+            + f"({sum(stat.st_size for _, stat in entries) / 2**20:.1f} MiB), {removed} evicted",
+            err=True,
+        )
@@ -0,0 +1,39 @@
+import subprocess
+from pathlib import Path
+
+import click
+
+
+def git(*args, directory=None):
+    """Run a git command in directory and return its output."""
+    try:
+        result = subprocess.run(
+            ["git", *args],
+            cwd=directory,
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except FileNotFoundError:
+        raise click.ClickException("git is required for this operation but was not found.")
+    except subprocess.CalledProcessError as e:
+        raise click.ClickException(f"git {args[0]} failed: {e.stderr.strip()}")
+    return result.stdout
+
+
+def changed_files(revision, directory=None):
+    """
+    Return the resolved paths of files in the git repository containing directory (default:
+    current directory) that were added or modified since revision. This includes uncommitted and
+    untracked (but not ignored) files.
+    """
+    toplevel = Path(git("rev-parse", "--show-toplevel", directory=directory).strip())
+    changed = git(
+        "diff", "--name-only", "--diff-filter=ACMR", "-z", revision, "--", directory=toplevel
+    )
+    untracked = git("ls-files", "--others", "--exclude-standard", "-z", directory=toplevel)
+    return {
+        (toplevel / name).resolve()
+        for name in (changed + untracked).split("\0")
+        if name
+    }
@@ -0,0 +1,84 @@
+import dataclasses
+import sys
+
+import click
+
+from sigma.correlations import SigmaCorrelationRule
+from sigma.rule import SigmaDetection, SigmaRule
+from sigma.types import SigmaString
+
+# Descriptive metadata that isn't used for conversion to queries and by the analyses.
+lean_attributes = ("description", "license", "author")
+lean_list_attributes = ("references", "falsepositives")
+
+
+def lean_option(func):
+    """Option for loading rules without descriptive metadata and with shared strings."""
+    return click.option(
+        "--lean",
+        is_flag=True,
+        default=False,
+        help="Load rules without description, license, author, references and false positives and share "
+        "repeated strings between rules to reduce memory usage on large rule sets. Don't use this with output "
+        "formats that contain these rule attributes.",
+    )(func)
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def lean_string(value):
+    value.original = intern(value.original)
+    for i, part in enumerate(value.s):  # in place, a new list would cost more than it saves
+        value.s[i] = intern(part)
+
+
+def lean_detection(detection):
+    for detection_item in detection.detection_items:
+        if isinstance(detection_item, SigmaDetection):
+            lean_detection(detection_item)
+        else:
+            detection_item.field = intern(detection_item.field)
+            for value in detection_item.value + (detection_item.original_value or []):
+                if isinstance(value, SigmaString):
+                    lean_string(value)
+
+
+def lean_rule(rule):
+    """
+    Remove the descriptive metadata from a rule and replace repeated strings, i.e. tags, log source
+    values, detection identifiers, field names and values, by interned ones that are shared by all
+    rules.
+    """
+    for name in lean_attributes:
+        setattr(rule, name, None)
+    for name in lean_list_attributes:
+        setattr(rule, name, list())
+    for tag in rule.tags:
+        tag.namespace = intern(tag.namespace)
+        tag.name = intern(tag.name)
+    if isinstance(rule, SigmaRule):
+        logsource = rule.logsource
+        rule.logsource = dataclasses.replace(
+            logsource,
+            category=intern(logsource.category),
+            product=intern(logsource.product),
+            service=intern(logsource.service),
+        )
+        detections = rule.detection.detections
+        interned = {intern(name): detection for name, detection in detections.items()}
+        detections.clear()  # the detections are referenced by the parsed conditions
+        detections.update(interned)
+        for detection in detections.values():
+            lean_detection(detection)
+    elif isinstance(rule, SigmaCorrelationRule) and rule.group_by is not None:
+        rule.group_by = [intern(field) for field in rule.group_by]
+    return rule
+
+
+def lean_collection(collection):
+    """Apply lean_rule to the rules of collection. Filters are kept as they are, they are applied to the rules."""
+    for rule in collection.rules:
+        lean_rule(rule)
+    return collection
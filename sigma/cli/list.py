@@ -10,7 +10,10 @@ from sigma.processing.conditions import (
 from prettytable import PrettyTable
 from textwrap import dedent, fill
 
-plugins = InstalledSigmaPlugins.autodiscover()
+from sigma.cli.timings import timings
+
+with timings.phase("plugin discovery"):
+    plugins = InstalledSigmaPlugins.autodiscover()
 
 
 def _plugin_id_from_module(module_name: str, namespace: str) -> str:
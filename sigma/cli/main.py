@@ -1,4 +1,5 @@
 import click
+import pathlib
 import sys
 import requests
 from packaging.version import Version
@@ -29,12 +30,16 @@ except ImportError:
     pass
 
 import importlib.metadata as metadata
+from .timings import enable_timings, timings
+from .profile import Profile
 from .list import list_group
 from .convert import convert
 from .check import check
 from .plugin import plugin_group
 from .analyze import analyze_group
 from .pysigma import pysigma_group
+from .rules import yaml_loader_name
+from .serve import serve
 
 
 CONTEXT_SETTINGS={
@@ -43,13 +48,74 @@ CONTEXT_SETTINGS={
 
 
 @click.group(context_settings=CONTEXT_SETTINGS)
-def cli():
-    pass
+@click.option(
+    "--timings",
+    "show_timings",
+    is_flag=True,
+    default=False,
+    help="Show the time spent in each phase of the command (plugin discovery, rule loading, conversion, output...) on standard error.",
+)
+@click.option(
+    "--timings-format",
+    type=click.Choice(("table", "json")),
+    default="table",
+    show_default=True,
+    help="Format of the --timings report.",
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    type=click.Path(dir_okay=False, writable=True, path_type=pathlib.Path),
+    help="Profile the command and write the profile to this file. Profiles are written as pstats file or, if the file name ends with .json, as speedscope JSON.",
+)
+@click.option(
+    "--profile-format",
+    type=click.Choice(("pstats", "speedscope")),
+    help="Format of the profile written with --profile, overrides the format derived from the file name.",
+)
+@click.option(
+    "--profile-sampling",
+    is_flag=True,
+    default=False,
+    help="Sample the call stack in regular intervals instead of tracing all function calls. This has a much lower overhead, but the profile is less precise.",
+)
+@click.option(
+    "--profile-interval",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Sampling interval of --profile-sampling in milliseconds.",
+)
+def cli(show_timings, timings_format, profile_path, profile_format, profile_sampling, profile_interval):
+    ctx = click.get_current_context()
+    if show_timings:
+        enable_timings()
+        ctx.call_on_close(lambda: timings.report(timings_format))
+    if profile_path is not None:
+        profile = Profile(
+            profile_path,
+            profile_format,
+            profile_sampling,
+            profile_interval / 1000,
+            " ".join(["sigma"] + sys.argv[1:]),
+        )
+        profile.start()
+        ctx.call_on_close(profile.stop)
 
 
 @click.command()
-def version():
+@click.option(
+    "--yaml-loader",
+    is_flag=True,
+    default=False,
+    help="Show the YAML loader used for parsing Sigma rules.",
+)
+def version(yaml_loader):
     """Print version of Sigma CLI."""
+    if yaml_loader:
+        click.echo(f"YAML loader: {yaml_loader_name()}")
+        return
+
     try:
         data = requests.get("https://pypi.org/pypi/sigma-cli/json").json()
         versions = list(data["releases"].keys())
@@ -77,6 +143,7 @@ def main():
     cli.add_command(list_group)
     cli.add_command(convert)
     cli.add_command(check)
+    cli.add_command(serve)
     cli.add_command(version)
     cli()
 
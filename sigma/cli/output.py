@@ -0,0 +1,192 @@
+import io
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import click
+
+from sigma.cli.timings import timings
+
+
+class OutputWriter:
+    """
+    Write backend outputs to a binary file object. write_result() writes a complete finalized
+    result, write_items() writes the items of a list result incrementally while the conversion is
+    still running, each item is encoded and flushed as soon as it is written. The output is the
+    same as if all items were written with write_result() at once, with the exception of ndjson
+    mode: here, each item is written as JSON document on its own line, also query strings.
+    """
+
+    def __init__(self, output, encoding="utf-8", json_indent=None, ndjson=False):
+        self.output = output
+        self.encoding = encoding
+        self.json_indent = json_indent
+        self.ndjson = ndjson
+        self.item_type = None  # type of the items written incrementally, set by the first item
+
+    def write(self, data):
+        self.output.write(data)
+
+    def write_result(self, result):
+        """Write a complete backend result."""
+        with timings.phase("output", 0 if isinstance(result, list) else 1):
+            if isinstance(result, list) and (
+                self.ndjson
+                or all(isinstance(item, str) for item in result)
+                or all(isinstance(item, dict) for item in result)
+            ):
+                self.write_items(result)
+                self.close()
+            elif isinstance(result, str):  # String result
+                click.echo(bytes(result, self.encoding), self.output)
+            elif isinstance(result, bytes):  # Bytes result: only allow to write it to file.
+                if self.output.isatty():
+                    raise click.UsageError(
+                        "Backend returns binary output. Please provide output file with --output/-o."
+                    )
+                else:
+                    click.echo(result, self.output)
+            elif isinstance(result, dict):
+                click.echo(bytes(json.dumps(result, indent=self.json_indent), self.encoding), self.output)
+            else:
+                raise click.ClickException(
+                    f"Backend returned unexpected format {str(type(result))}"
+                )
+
+    def write_items(self, items):
+        """
+        Write items of a list result. Strings are separated by empty lines, dicts are rendered as
+        JSON and separated by newlines. In ndjson mode, each item is written as JSON on its own
+        line.
+        """
+        with timings.phase("output", len(items)):
+            for item in items:
+                if self.ndjson:
+                    self.write(bytes(json.dumps(item) + "\n", self.encoding))
+                    continue
+
+                if isinstance(item, str):
+                    item_type, separator, data = str, "\n\n", item
+                elif isinstance(item, dict):
+                    item_type, separator, data = dict, "\n", json.dumps(item, indent=self.json_indent)
+                else:
+                    raise click.ClickException(
+                        f"Backend returned unexpected format {str(type(item))}"
+                    )
+                if self.item_type is None:
+                    self.item_type = item_type
+                elif self.item_type is item_type:
+                    data = separator + data
+                else:
+                    raise click.ClickException("Backend returned a list of mixed item types")
+                self.write(bytes(data, self.encoding))
+            self.output.flush()
+
+    def close(self):
+        """Terminate a result that was written with write_items()."""
+        if not self.ndjson:
+            self.write(b"\n")
+        self.output.flush()
+
+
+def write_if_changed(path, data):
+    """
+    Write data to path unless the file already has this content, so that the modification time of
+    unchanged files is preserved. Returns True if the file was written.
+    """
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    # Unlike cache entries, output files are created with the default permissions.
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+class OutputDirectory:
+    """
+    Write the output of each rule into its own file in a directory. Files are named by the rule id
+    (or the rule name, or the rule file name if the rule has neither) with a suffix derived from
+    the output type. Files are only rewritten if their content changed. The files written by the
+    previous run are recorded in a manifest, files of rules that don't exist anymore are removed.
+    Files are written by a pool of threads.
+    """
+
+    manifest_name = ".sigma-cli-manifest"
+
+    def __init__(self, directory, encoding="utf-8", json_indent=None, ndjson=False, threads=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.encoding = encoding
+        self.json_indent = json_indent
+        self.ndjson = ndjson
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.writes = list()
+        self.names = set()
+        self.written = self.unchanged = self.removed = 0
+
+    def file_name(self, rule, output):
+        if rule.id is not None:
+            name = str(rule.id)
+        elif rule.name is not None:
+            name = rule.name
+        else:
+            name = rule.source.path.stem if rule.source is not None else "rule"
+        name = re.sub(r"[^\w.-]", "_", name)
+        if isinstance(output, bytes):
+            suffix = ".bin"
+        elif self.ndjson:
+            suffix = ".ndjson"
+        elif isinstance(output, dict) or (
+            isinstance(output, list) and output and all(isinstance(item, dict) for item in output)
+        ):
+            suffix = ".json"
+        else:
+            suffix = ".txt"
+        file_name = name + suffix
+        i = 1
+        while file_name in self.names:  # rules without unique id or name
+            i += 1
+            file_name = f"{name}-{i}{suffix}"
+        self.names.add(file_name)
+        return file_name
+
+    def write_rule(self, rule, output):
+        """Write the finalized output of a rule into its file."""
+        data = io.BytesIO()
+        OutputWriter(data, self.encoding, self.json_indent, self.ndjson).write_result(output)
+        path = self.directory / self.file_name(rule, output)
+        self.writes.append(self.executor.submit(write_if_changed, path, data.getvalue()))
+
+    def close(self):
+        """
+        Wait until all files are written, remove files of rules that were written by the previous
+        run but not by this one and update the manifest.
+        """
+        with timings.phase("output"):
+            self.executor.shutdown()
+        for write in self.writes:
+            if write.result():
+                self.written += 1
+            else:
+                self.unchanged += 1
+
+        manifest = self.directory / self.manifest_name
+        try:
+            previous_names = set(manifest.read_text(encoding="utf-8").splitlines())
+        except FileNotFoundError:
+            previous_names = set()
+        for name in sorted(previous_names - self.names):
+            path = self.directory / name
+            if path.parent == self.directory:  # never remove files outside of the directory
+                try:
+                    path.unlink()
+                    self.removed += 1
+                except FileNotFoundError:
+                    pass
+        write_if_changed(manifest, "".join(name + "\n" for name in sorted(self.names)).encode("utf-8"))
@@ -0,0 +1,202 @@
+import cProfile
+import json
+import marshal
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from time import perf_counter
+
+import click
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that samples the stack of the profiled thread from a background thread
+    every interval seconds. The overhead only depends on the interval and not on the number of
+    function calls, so it can be used for long running production jobs. Samples are counted per
+    stack, weighted with the time elapsed since the previous sample.
+    """
+
+    def __init__(self, interval=0.01, thread=None):
+        self.interval = interval
+        self.thread_id = (thread or threading.current_thread()).ident
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.run, name="sigma-cli-profiler", daemon=True)
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def run(self):
+        last = perf_counter()
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = perf_counter()
+            stack = list()
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += now - last
+            last = now
+
+
+def stats_from_samples(samples):
+    """
+    Build pstats statistics from stack samples, so they can be viewed with the same tools as
+    deterministic profiles. Call counts are the number of samples a function appears in.
+    """
+    stats = dict()
+    for stack, weight in samples.items():
+        seen = set()
+        for i, func in enumerate(stack):
+            cc, nc, tt, ct, callers = stats.setdefault(func, (0, 0, 0.0, 0.0, dict()))
+            leaf = i == len(stack) - 1
+            if func not in seen:  # recursive calls count once per sample
+                seen.add(func)
+                cc, nc, ct = cc + 1, nc + 1, ct + weight
+            if leaf:
+                tt += weight
+            if i > 0:
+                caller = callers.get(stack[i - 1], (0, 0, 0.0, 0.0))
+                callers[stack[i - 1]] = (
+                    caller[0] + 1,
+                    caller[1] + 1,
+                    caller[2] + (weight if leaf else 0.0),
+                    caller[3] + weight,
+                )
+            stats[func] = (cc, nc, tt, ct, callers)
+    return stats
+
+
+def samples_from_stats(stats, min_fraction=0.0001, max_depth=256):
+    """
+    Approximate stack samples from pstats statistics of a deterministic profile for flame graph
+    views. The cumulative time of each function is distributed to its callees in proportion to the
+    time spent in calls from this function. Stacks below min_fraction of the total time are
+    omitted.
+    """
+    callees = dict()
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, dict())[func] = caller_stats[3]
+    roots = [func for func, func_stats in stats.items() if not func_stats[4]]
+    total = sum(stats[func][3] for func in roots)
+    samples = Counter()
+
+    def expand(stack, func, time):
+        cc, nc, tt, ct, callers = stats[func]
+        scale = time / ct if ct > 0 else 0.0
+        stack = stack + (func,)
+        if tt * scale > 0:
+            samples[stack] += tt * scale
+        if len(stack) >= max_depth:
+            return
+        for callee, callee_time in callees.get(func, dict()).items():
+            if callee not in stack and callee_time * scale >= total * min_fraction:
+                expand(stack, callee, callee_time * scale)
+
+    for root in roots:
+        expand((), root, stats[root][3])
+    return samples
+
+
+def frame_name(func):
+    filename, line, name = func
+    if filename == "~":  # built-in functions in cProfile statistics
+        return name, None, None
+    return name, filename, line
+
+
+def speedscope_profile(samples, name):
+    """Render stack samples in the speedscope file format as sampled profile."""
+    frames = list()
+    frame_index = dict()
+    profile_samples = list()
+    weights = list()
+    for stack, weight in samples.items():
+        indices = list()
+        for func in stack:
+            if func not in frame_index:
+                frame_index[func] = len(frames)
+                name_, filename, line = frame_name(func)
+                frame = {"name": name_}
+                if filename is not None:
+                    frame.update(file=filename, line=line)
+                frames.append(frame)
+            indices.append(frame_index[func])
+        profile_samples.append(indices)
+        weights.append(weight)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": profile_samples,
+                "weights": weights,
+            }
+        ],
+        "name": name,
+        "activeProfileIndex": 0,
+        "exporter": "sigma-cli",
+    }
+
+
+def profile_format(path, format=None):
+    """Output format given explicitly or derived from the file name: speedscope for .json files."""
+    if format is not None:
+        return format
+    return "speedscope" if Path(path).suffix.lower() == ".json" else "pstats"
+
+
+class Profile:
+    """
+    Profile of a command, deterministic with cProfile or statistical with SamplingProfiler, that
+    is written to path as pstats file or speedscope JSON.
+    """
+
+    def __init__(self, path, format=None, sampling=False, interval=0.01, name="sigma"):
+        self.path = Path(path)
+        self.format = profile_format(path, format)
+        self.name = name
+        if sampling:
+            self.profiler = SamplingProfiler(interval)
+        else:
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        if isinstance(self.profiler, SamplingProfiler):
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        """Stop profiling and write the profile."""
+        if isinstance(self.profiler, SamplingProfiler):
+            self.profiler.stop()
+            samples = self.profiler.samples
+            stats = stats_from_samples(samples) if self.format == "pstats" else None
+        else:
+            self.profiler.disable()
+            self.profiler.create_stats()
+            stats = self.profiler.stats
+            samples = samples_from_stats(stats) if self.format == "speedscope" else None
+
+        if self.format == "speedscope":
+            profile = speedscope_profile(samples, self.name)
+            self.path.write_text(json.dumps(profile), encoding="utf-8")
+        else:
+            with self.path.open("wb") as f:
+                marshal.dump(stats, f)
+        click.echo(f"Profile written to {self.path}", err=True)
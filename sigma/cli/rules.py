@@ -1,41 +1,959 @@
-from pathlib import Path
+import copy
+import hashlib
+import os
+import re
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+from functools import partial
+from itertools import islice, product
+from pathlib import Path, PurePosixPath
 from sys import stderr
+from uuid import UUID
 import click
-from sigma.collection import SigmaCollection
+import yaml
+from sigma.collection import SigmaCollection, deep_dict_update
+from sigma.correlations import SigmaCorrelationRule, SigmaExtendedCorrelationCondition
+from sigma.exceptions import SigmaCollectionError, SigmaRuleLocation
+from sigma.filters import SigmaFilter
+from sigma.rule import SigmaRule
+from sigma.cli.cache import RuleCache
+from sigma.cli.git import changed_files
+from sigma.cli.lean import lean_collection
+from sigma.cli.selection import RuleSelection, rule_selection_options
+from sigma.cli.timings import timings
 
+stdin_path = Path("-")
 
-def load_rules(input, file_pattern):
+# Top-level keys of correlation rules and filters in YAML block style.
+collection_rule_key = re.compile(rb"^(?:correlation|filter)[ \t]*:", re.MULTILINE)
+max_chunk_size = 100
+archive_suffixes = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Use the libyaml-based loader if PyYAML was built with it, it's much faster than the pure Python one.
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader as YamlLoader
+
+
+def yaml_loader_name():
+    """Name of the YAML loader used for parsing Sigma rules."""
+    if YamlLoader.__name__ == "CSafeLoader":
+        return "libyaml (CSafeLoader)"
+    else:
+        return "pure Python (SafeLoader)"
+
+
+def parse_yaml(content):
+    """Parse all YAML documents contained in a string or stream."""
+    return list(yaml.load_all(content, Loader=YamlLoader))
+
+
+class JobsParamType(click.ParamType):
     """
-    Load Sigma rules from files or stdin.
+    Number of worker processes: a positive integer or 'auto' for one worker per CPU.
     """
-    rule_collection = SigmaCollection([], [])
 
-    for path in list(input):
-        if path == Path("-"):
-            rule_collection = SigmaCollection.merge([
-                rule_collection,
-                SigmaCollection.from_yaml(click.get_text_stream("stdin"))
-            ])
+    name = "jobs"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            jobs = value
+        elif value == "auto":
+            return os.cpu_count() or 1
         else:
-            rule_paths = SigmaCollection.resolve_paths(
-                [path],
-                recursion_pattern="**/" + file_pattern,
+            try:
+                jobs = int(value)
+            except ValueError:
+                self.fail(f"Value '{value}' is not a number or 'auto'", param, ctx)
+        if jobs < 1:
+            self.fail(f"Number of jobs must be at least 1, got {jobs}", param, ctx)
+        return jobs
+
+
+class ShardParamType(click.ParamType):
+    """
+    Shard of a rule set given as K/N: the K-th of N shards, counted from 1. Converted into a tuple
+    (K, N).
+    """
+
+    name = "shard"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, tuple):
+            return value
+        try:
+            index, count = (int(part) for part in value.split("/"))
+        except ValueError:
+            self.fail(f"Value '{value}' doesn't have the format K/N", param, ctx)
+        if not 1 <= index <= count:
+            self.fail(f"Shard {index} of {count} doesn't exist, K must be between 1 and N", param, ctx)
+        return index, count
+
+
+def rule_loading_options(func):
+    """
+    Add the options shared by all commands that load Sigma rules with load_rules. The values are
+    passed as keyword arguments to the command and should be forwarded to load_rules.
+    """
+    func = click.option(
+        "--file-pattern",
+        "-P",
+        multiple=True,
+        default=["*.yml"],
+        show_default=True,
+        help="Pattern for file names to be included in recursion into directories, optionally with trailing "
+        "directories like 'windows/*.yml'. Repeat for multiple patterns.",
+    )(func)
+    func = click.option(
+        "--exclude-path",
+        multiple=True,
+        help="Glob pattern for files and directories that are skipped in recursion into directories, "
+        "e.g. '.git' or 'deprecated/*'. Matched against the name and the path relative to the input. "
+        "Repeat for multiple patterns.",
+    )(func)
+    func = click.option(
+        "--changed-since",
+        metavar="REV",
+        help="Only process rule files that were added or modified since the given git revision, "
+        "together with the rules they reference.",
+    )(func)
+    func = click.option(
+        "--shard",
+        type=ShardParamType(),
+        metavar="K/N",
+        help="Only process the K-th of N shards of the rules, e.g. 2/4 on the second of four CI runners. Rules are "
+        "assigned to shards by a hash of their id, correlation rules are in the same shard as the rules they "
+        "reference. Each shard keeps the order of the rules.",
+    )(func)
+    func = click.option(
+        "--jobs",
+        type=JobsParamType(),
+        default="1",
+        show_default=True,
+        help="Number of worker processes used for parsing and, in sigma convert, converting Sigma rules. "
+        "'auto' uses one worker per CPU.",
+    )(func)
+    func = click.option(
+        "--rule-cache/--no-rule-cache",
+        default=False,
+        show_default=True,
+        help="Cache parsed Sigma rules on disk and skip parsing of unchanged rule files. Entries not used for "
+        "30 days and the least recently used entries exceeding 1 GiB are evicted after each run.",
+    )(func)
+    func = click.option(
+        "--rule-cache-dir",
+        type=click.Path(file_okay=False, path_type=Path),
+        envvar="SIGMA_CLI_CACHE_DIR",
+        help="Cache directory. Defaults to sigma-cli in the user cache directory.",
+    )(func)
+    return rule_selection_options(func)
+
+
+def iter_yaml_collections(stream, selection=None):
+    """
+    Parse the YAML documents from stream one by one and generate a SigmaCollection for each
+    document, so processing can start before the end of the stream is reached and only one
+    document is held in memory at a time. Sigma collection actions (global, reset and repeat) are
+    handled like SigmaCollection.from_dicts does. Filters are only collected and references are
+    not resolved in the generated collections. Rules that aren't selected by selection are
+    removed from the generated collections.
+    """
+    collections = iter_yaml_documents(stream)
+    if selection is None:
+        return collections
+    return (selection.select_rules(collection) for collection in collections)
+
+
+def iter_yaml_documents(stream):
+    global_rule = dict()
+    prev_rule = dict()
+    for i, rule in enumerate(yaml.load_all(stream, Loader=YamlLoader), start=1):
+        if rule is None:  # empty YAML document, e.g. from a trailing '---'
+            continue
+        action = rule.get("action")
+        if action is None:
+            if "correlation" not in rule and "filter" not in rule:
+                # merge with global rule, the merged rule is the base of subsequent repeat actions
+                rule = deep_dict_update(rule, copy.deepcopy(global_rule))
+                prev_rule = rule
+            yield SigmaCollection.from_dicts(
+                [copy.deepcopy(rule)], collect_filters=True, resolve_references=False
+            )
+        elif action == "global":
+            del rule["action"]
+            global_rule = rule
+            prev_rule = global_rule
+        elif action == "reset":
+            global_rule = dict()
+        elif action == "repeat":
+            prev_rule = deep_dict_update(prev_rule, rule)
+            parsed_rule = SigmaRule.from_dict(copy.deepcopy(prev_rule))
+            yield SigmaCollection(
+                [parsed_rule], parsed_rule.errors, collect_filters=True, resolve_references=False
+            )
+        else:
+            raise SigmaCollectionError(f"Unknown Sigma collection action '{ action }' in rule { i }")
+
+
+def is_deselected(content, selection):
+    """
+    Check if the rule file content is certainly not selected by selection from the header
+    sections of the file, without parsing the whole file.
+    """
+    header = selection.header(content)
+    if header is None:
+        return False
+    try:
+        header = yaml.load(header, Loader=YamlLoader)
+    except yaml.YAMLError:  # reported by the complete parse
+        return False
+    return not selection.matches(header if isinstance(header, dict) else dict())
+
+
+def parse_rule_content(path, content, selection=None):
+    """
+    Parse the content of a single Sigma rule file into a SigmaCollection. Filters are only collected
+    and references are not resolved, this is done once after all files are loaded. Only rules
+    selected by selection are constructed. Rules without path have no source.
+    """
+    if selection is None:
+        documents = parse_yaml(content)
+    else:
+        if is_deselected(content, selection):
+            return SigmaCollection([], collect_filters=True, resolve_references=False)
+        documents = parse_yaml(content)
+        selected_documents = selection.select_documents(documents)
+        if selected_documents is not None:
+            documents, selection = selected_documents, None
+    collection = SigmaCollection.from_dicts(
+        documents,
+        collect_errors=True,
+        source=SigmaRuleLocation(path) if path is not None else None,
+        collect_filters=True,
+        resolve_references=False,
+    )
+    if selection is not None:  # documents with collection actions are selected after construction
+        selection.select_rules(collection)
+    return collection
+
+
+def parse_rule_file(path, rule_cache=None, selection=None):
+    """
+    Parse a single Sigma rule file into a SigmaCollection, from the rule cache if available. The
+    rule cache must be created with the same selection.
+    """
+    if rule_cache is not None:
+        return rule_cache.load(path, partial(parse_rule_content, selection=selection))
+    with path.open(encoding="utf-8") as fd:
+        return parse_rule_content(path, fd if selection is None else fd.read(), selection)
+
+
+def parse_rule_files(paths, rule_cache=None, selection=None):
+    """
+    Parse a chunk of Sigma rule files. This is the unit of work passed to worker processes. Returns
+    the parsed collections and the rule cache hit and miss counts of the chunk.
+    """
+    collections = [parse_rule_file(path, rule_cache, selection) for path in paths]
+    if rule_cache is None:
+        return collections, 0, 0
+    return collections, rule_cache.hits, rule_cache.misses
+
+
+def chunk_paths(paths, jobs):
+    """
+    Split paths into chunks for distribution across jobs worker processes. Multiple chunks per
+    worker are generated to balance differing file sizes. The chunk size is limited to keep the
+    amount of parsed rules returned at once bounded.
+    """
+    chunk_size = min(max_chunk_size, max(1, -(-len(paths) // (jobs * 4))))
+    return [paths[i : i + chunk_size] for i in range(0, len(paths), chunk_size)]
+
+
+def map_in_order(executor, func, chunks, window):
+    """
+    Apply func to chunks in the executor and generate the results in the order of chunks, like
+    executor.map() does. At most window chunks are in flight, so results don't pile up if the
+    consumer is slower than the workers.
+    """
+    chunks = iter(chunks)
+    pending = deque(executor.submit(func, chunk) for chunk in islice(chunks, window))
+    while pending:
+        result = pending.popleft().result()
+        for chunk in islice(chunks, 1):
+            pending.append(executor.submit(func, chunk))
+        yield result
+
+
+def parse_rule_paths(rule_paths, jobs, executor, rule_cache, progress, selection=None):
+    """
+    Generate one SigmaCollection per rule file in the order of rule_paths. Files are parsed in
+    the executor if one is given, with at most two chunks per worker in flight. Also yields the
+    rule cache hit and miss counts of worker processes.
+    """
+    if executor is None:
+        for rule_path in rule_paths:
+            yield parse_rule_file(rule_path, rule_cache, selection), 0, 0
+            progress.update(1)
+    else:
+        for chunk_collections, hits, misses in map_in_order(
+            executor,
+            partial(parse_rule_files, rule_cache=rule_cache, selection=selection),
+            chunk_paths(rule_paths, jobs),
+            jobs * 2,
+        ):
+            yield from ((collection, 0, 0) for collection in chunk_collections[:-1])
+            yield chunk_collections[-1], hits, misses
+            progress.update(len(chunk_collections))
+
+
+def is_archive(path):
+    """Check if path is a tar or zip archive by its file name."""
+    return path.name.lower().endswith(archive_suffixes)
+
+
+def is_member_excluded(name, exclude_paths):
+    """
+    Check if an archive member or one of the directories containing it matches one of the
+    exclusion glob patterns, like excluded directories are pruned in directory recursion.
+    """
+    parts = name.split("/")
+    return any(
+        is_excluded(part, "/".join(parts[: i + 1]), exclude_paths)
+        for i, part in enumerate(parts)
+    )
+
+
+def matches_file_pattern(relative_path, file_patterns):
+    """
+    Check if a file matches one of the file name patterns. Like the recursive glob '**/' + pattern,
+    patterns with directory parts, e.g. 'windows/*.yml', are matched against the trailing
+    components of the path relative to the input directory, other patterns against the file name.
+    """
+    return any(
+        PurePosixPath(relative_path).match(pattern)
+        if "/" in pattern
+        else fnmatch(relative_path.rsplit("/", 1)[-1], pattern)
+        for pattern in file_patterns
+    )
+
+
+def iter_archive_members(path, file_patterns, exclude_paths):
+    """
+    Generate the paths and decoded contents of the files in the tar or zip archive at path that
+    match one of file_patterns, in archive order. The members are read straight from the archive
+    without extraction. The generated paths point inside the archive, e.g. rules.zip/windows/rule.yml.
+    """
+    def matches(name):
+        return (
+            matches_file_pattern(name, file_patterns)
+            and not is_member_excluded(name, exclude_paths)
+        )
+
+    if path.name.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and matches(member.filename):
+                    yield path / member.filename, archive.read(member).decode("utf-8")
+    else:
+        with tarfile.open(path, "r:*") as archive:
+            for member in archive:
+                if member.isfile() and matches(member.name):
+                    yield path / member.name, archive.extractfile(member).read().decode("utf-8")
+
+
+def parse_rule_contents(items, selection=None):
+    """
+    Parse a chunk of rule file paths and contents. This is the unit of work passed to worker
+    processes for rules read from archives.
+    """
+    return [parse_rule_content(path, content, selection) for path, content in items]
+
+
+def parse_archive(path, file_patterns, exclude_paths, jobs, executor, selection=None):
+    """
+    Generate one SigmaCollection per rule file contained in the archive at path. The archive is
+    read sequentially and the rules are parsed in the executor if one is given.
+    """
+    members = iter_archive_members(path, file_patterns, exclude_paths)
+    if executor is None:
+        for member_path, content in members:
+            yield parse_rule_content(member_path, content, selection)
+    else:
+        chunks = iter(lambda: list(islice(members, max_chunk_size)), [])
+        parse = partial(parse_rule_contents, selection=selection)
+        for chunk_collections in map_in_order(executor, parse, chunks, jobs * 2):
+            yield from chunk_collections
+
+
+def is_excluded(name, relative_path, exclude_paths):
+    """Check if a file or directory matches one of the exclusion glob patterns."""
+    return any(
+        fnmatch(name, pattern) or fnmatch(relative_path, pattern)
+        for pattern in exclude_paths
+    )
+
+
+def file_identity(path, entry=None, device=None):
+    """
+    Identify a file by device and inode to recognize files reached through symlinks or
+    overlapping inputs. For directory entries that aren't symlinks, the inode is known from the
+    directory listing and the device is the one of the directory, which saves a stat() call.
+    """
+    if entry is not None and device is not None and not entry.is_symlink():
+        return device, entry.inode()
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+def walk_rule_paths(directory, file_patterns, exclude_paths, seen, relative=""):
+    """
+    Recurse into directory with os.scandir and generate paths of files matching one of
+    file_patterns. Excluded directories are pruned before descending into them. Files and
+    directories already contained in seen are skipped. Files are generated in name order, files of
+    a directory before the content of its subdirectories.
+    """
+    directory_id = file_identity(directory)
+    if directory_id in seen:
+        return
+    seen.add(directory_id)
+    device = directory_id[0]
+
+    with os.scandir(directory) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    subdirectories = list()
+    for entry in entries:
+        relative_path = relative + entry.name
+        if is_excluded(entry.name, relative_path, exclude_paths):
+            continue
+        if entry.is_dir():
+            subdirectories.append((entry, relative_path))
+        elif entry.is_file() and matches_file_pattern(relative_path, file_patterns):
+            entry_id = file_identity(entry.path, entry, device)
+            if entry_id not in seen:
+                seen.add(entry_id)
+                yield directory / entry.name
+    for entry, relative_path in subdirectories:
+        yield from walk_rule_paths(
+            directory / entry.name, file_patterns, exclude_paths, seen, relative_path + "/"
+        )
+
+
+def resolve_rule_paths(input, file_pattern, exclude_path=()):
+    """
+    Resolve input files and directories into a flat list of rule files. Directories are recursed
+    into and files matching one of the file name patterns in file_pattern are included, files
+    given directly are included regardless of their name. Archives given directly are kept as
+    they are, their members are resolved while reading them. Paths matching one of the glob patterns
+    in exclude_path are skipped. Each file is included only once, even if reached through
+    symlinks or overlapping inputs. Standard input is kept as '-' at its position.
+    """
+    file_patterns = (file_pattern,) if isinstance(file_pattern, str) else file_pattern
+    seen = set()
+    rule_paths = list()
+    for path in input:
+        if path == stdin_path:
+            rule_paths.append(path)
+        elif path.is_dir():
+            rule_paths.extend(walk_rule_paths(path, file_patterns, exclude_path, seen))
+        elif not is_excluded(path.name, path.as_posix(), exclude_path):
+            path_id = file_identity(path)
+            if path_id not in seen:
+                seen.add(path_id)
+                rule_paths.append(path)
+    return rule_paths
+
+
+def requires_collection(input, file_pattern, exclude_path=()):
+    """
+    Check if the rules of input may contain correlation rules or filters, which can only be
+    processed with the whole rule collection. Rule files are searched for the top-level keys of
+    these rules without parsing them. Standard input can't be read twice and always requires the
+    whole rule collection. Archive members aren't searched, because this requires decompression,
+    they are checked while the rules are loaded.
+    """
+    for path in resolve_rule_paths(input, file_pattern, exclude_path):
+        if path == stdin_path:
+            return True
+        if not is_archive(path):
+            try:
+                if collection_rule_key.search(path.read_bytes()):
+                    return True
+            except OSError:  # reported while loading the rules
+                return True
+    return False
+
+
+def rule_references(rule):
+    """Return the ids and names of the rules referenced by a correlation rule or filter."""
+    if isinstance(rule, SigmaCorrelationRule):
+        if rule.rules is not None:
+            return [rule_reference.reference for rule_reference in rule.rules]
+        elif isinstance(rule.condition, SigmaExtendedCorrelationCondition):
+            return list(rule.condition.get_referenced_rules())
+    elif isinstance(rule, SigmaFilter) and not isinstance(rule.filter.rules, str):
+        return [rule_reference.reference for rule_reference in rule.filter.rules]
+    return []
+
+
+def normalize_reference(reference):
+    """Normalize rule references to UUIDs into their canonical string form."""
+    try:
+        return str(UUID(reference))
+    except ValueError:
+        return reference
+
+
+def select_referenced_rules(collections, referencing_rules):
+    """
+    Select the rules from collections that are referenced by referencing_rules, directly or
+    through other referenced rules, and return them with their errors as one SigmaCollection in
+    the order of collections. Filters that apply to any rule select all rules matching their log
+    source.
+    """
+    rules = [rule for collection in collections for rule in collection.rules]
+    index = dict()
+    for rule in rules:
+        if rule.id is not None:
+            index.setdefault(str(rule.id), rule)
+        if rule.name is not None:
+            index.setdefault(rule.name, rule)
+
+    selected = set()
+    pending = list(referencing_rules)
+
+    def select(rule):
+        if id(rule) not in selected:
+            selected.add(id(rule))
+            pending.append(rule)
+
+    for rule in referencing_rules:
+        if isinstance(rule, SigmaFilter) and isinstance(rule.filter.rules, str):  # 'any'
+            for candidate in rules:
+                if isinstance(candidate, SigmaRule) and candidate.logsource in rule.logsource:
+                    select(candidate)
+    while pending:
+        for reference in rule_references(pending.pop()):
+            referenced_rule = index.get(normalize_reference(reference))
+            if referenced_rule is not None:
+                select(referenced_rule)
+
+    selected_rules = [rule for rule in rules if id(rule) in selected]
+    return SigmaCollection(
+        selected_rules,
+        [error for rule in selected_rules for error in rule.errors],
+        collect_filters=True,
+        resolve_references=False,
+    )
+
+
+def iter_rule_collections(
+    input,
+    file_pattern,
+    exclude_path=(),
+    changed_since=None,
+    jobs=1,
+    rule_cache=False,
+    rule_cache_dir=None,
+    selection=None,
+    lean=False,
+    keep_input=(),
+):
+    """
+    Generate one SigmaCollection per rule file or standard input in input order. Filters are only
+    collected and references are not resolved in the generated collections. See
+    resolve_rule_paths for file_pattern and exclude_path, which also apply to the members of tar
+    and zip archives. Rules from archives are not cached. If jobs is greater than one, rule files
+    are parsed in that many worker processes. If rule_cache is set, parsed rule files are cached
+    in rule_cache_dir. If a RuleSelection is given, only the rules selected by it are loaded. If
+    lean is set, the rules are made lean with lean_collection after parsing.
+
+    If changed_since is set to a git revision, only rule files that were added or modified since
+    this revision are loaded, together with the rules they reference through correlations or
+    filters. These are generated as one additional collection at the end. Files of the inputs that
+    are also contained in keep_input, e.g. the filters passed to sigma convert, are always loaded.
+    """
+    with timings.phase("path resolution") as phase:
+        rule_paths = resolve_rule_paths(input, file_pattern, exclude_path)
+        unchanged_paths = list()
+        if changed_since is not None:
+            changed = changed_files(changed_since) | {
+                path.resolve() for path in resolve_rule_paths(keep_input, file_pattern, exclude_path)
+            }
+            unchanged_paths = [
+                path for path in rule_paths if path != stdin_path and path.resolve() not in changed
+            ]
+            rule_paths = [
+                path for path in rule_paths if path == stdin_path or path.resolve() in changed
+            ]
+        phase.items += len(rule_paths) + len(unchanged_paths)
+    file_paths = [path for path in rule_paths if path != stdin_path and not is_archive(path)]
+    archive_paths = [path for path in rule_paths if path != stdin_path and is_archive(path)]
+    file_patterns = (file_pattern,) if isinstance(file_pattern, str) else file_pattern
+
+    cache = RuleCache(rule_cache_dir, selection) if rule_cache else None
+    cache_hits = cache_misses = 0
+    referencing_rules = list()
+    executor = (
+        ProcessPoolExecutor(max_workers=jobs)
+        if jobs > 1 and (len(file_paths) + len(unchanged_paths) > 1 or archive_paths)
+        else None
+    )
+
+    try:
+        with click.progressbar(
+                length=len(file_paths), label="Parsing Sigma rules", file=stderr
+        ) as progress:
+            parsed_files = timings.iterate(
+                "rule parsing",
+                parse_rule_paths(file_paths, jobs, executor, cache, progress, selection),
+                lambda result: len(result[0].rules),
             )
+            for path in rule_paths:
+                if path == stdin_path:
+                    collections = timings.iterate(
+                        "rule parsing",
+                        iter_yaml_collections(click.get_text_stream("stdin"), selection),
+                        lambda collection: len(collection.rules),
+                    )
+                elif is_archive(path):
+                    collections = timings.iterate(
+                        "rule parsing",
+                        parse_archive(path, file_patterns, exclude_path, jobs, executor, selection),
+                        lambda collection: len(collection.rules),
+                    )
+                else:
+                    collection, hits, misses = next(parsed_files)
+                    cache_hits += hits
+                    cache_misses += misses
+                    collections = (collection,)
+                for collection in collections:
+                    if unchanged_paths:
+                        referencing_rules.extend(
+                            rule
+                            for rule in collection.rules + collection.filters
+                            if isinstance(rule, (SigmaCorrelationRule, SigmaFilter))
+                        )
+                    yield lean_collection(collection) if lean else collection
+
+        if referencing_rules:
             with click.progressbar(
-                    list(rule_paths), label="Parsing Sigma rules", file=stderr
-            ) as progress_rule_paths:
-                rule_collection = SigmaCollection.merge([
-                    rule_collection,
-                    SigmaCollection.load_ruleset(
-                        progress_rule_paths,
-                        collect_errors=True,
+                    length=len(unchanged_paths), label="Parsing referenced Sigma rules", file=stderr
+            ) as progress:
+                unchanged_collections = list()
+                for collection, hits, misses in timings.iterate(
+                    "rule parsing",
+                    parse_rule_paths(unchanged_paths, jobs, executor, cache, progress, selection),
+                    lambda result: len(result[0].rules),
+                ):
+                    unchanged_collections.append(collection)
+                    cache_hits += hits
+                    cache_misses += misses
+            collection = select_referenced_rules(unchanged_collections, referencing_rules)
+            yield lean_collection(collection) if lean else collection
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if cache is not None:
+        cache_hits += cache.hits
+        cache_misses += cache.misses
+        if cache_hits + cache_misses > 0:
+            click.echo(f"Rule cache: {cache_hits} hits, {cache_misses} misses", err=True)
+        cache.evict()
+
+
+def order_by_references(rules):
+    """
+    Order rules so that each rule comes after the rules referenced by it. Apart from that, the
+    order of the rules is kept. Runs in time linear in the number of rules and references.
+    """
+    ordered = list()
+    placed = set()
+    for rule in rules:
+        # Depth-first traversal of the references with an explicit stack, because correlation
+        # chains can be deeper than the recursion limit.
+        stack = [(rule, False)]
+        while stack:
+            current, references_placed = stack.pop()
+            if references_placed:
+                ordered.append(current)
+            elif id(current) not in placed:
+                placed.add(id(current))  # before descending, reference cycles must not loop endlessly
+                stack.append((current, True))
+                if isinstance(current, SigmaCorrelationRule):
+                    stack.extend(
+                        (rule_reference.rule, False)
+                        for rule_reference in reversed(current.referenced_rules)
                     )
-                ])
+    return ordered
+
+
+def group_by_references(rules):
+    """
+    Partition rules into groups of rules connected by correlation references, so that each
+    correlation rule is in the same group as all rules it references directly or indirectly.
+    Groups are returned in the order of their first rule and keep the order of rules. References
+    must be resolved.
+    """
+    parents = {id(rule): id(rule) for rule in rules}
+
+    def find(key):
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
 
-    rule_collection.resolve_rule_references()
+    for rule in rules:
+        if isinstance(rule, SigmaCorrelationRule):
+            for rule_reference in rule.referenced_rules:
+                if id(rule_reference.rule) in parents:
+                    parents[find(id(rule_reference.rule))] = find(id(rule))
+
+    groups = dict()
+    for rule in rules:
+        groups.setdefault(find(id(rule)), list()).append(rule)
+    return list(groups.values())
+
+
+def resolve_rule_references(rule_collection):
+    """
+    Resolve the rule references of correlation rules and order the rules by reference. This does
+    the same as SigmaCollection.resolve_rule_references for collections with applied filters, but
+    in time linear in the number of references: each reference is looked up in the id and name
+    index the collection built on construction, and the rules are ordered topologically instead of
+    being sorted with pairwise reference checks.
+    """
+    with timings.phase("reference resolution", len(rule_collection.rules)):
+        for rule in rule_collection.rules:
+            if isinstance(rule, SigmaCorrelationRule):
+                rule.resolve_rule_references(rule_collection)
+        rule_collection.rules = order_by_references(rule_collection.rules)
+
+
+def logsource_key(logsource):
+    return (logsource.category, logsource.product, logsource.service)
+
+
+def reference_key(reference):
+    """Key of a rule reference like SigmaCollection looks it up: the UUID if it is one, the rule name otherwise."""
+    try:
+        return UUID(reference)
+    except ValueError:
+        return reference
+
+
+class FilterIndex:
+    """
+    Index of Sigma filters by the rules they can apply to. Filters for any rule are indexed by
+    their log source, filters for specific rules by the referenced rule ids and names. Looking up
+    the filters of a rule takes the eight log source generalizations of the rule and its id and
+    name instead of checking every filter against the rule, which SigmaFilter does by building a
+    collection from the rule for each rule reference of the filter.
+    """
+
+    def __init__(self, filters):
+        self.filters = filters
+        self.logsource_filters = dict()
+        self.reference_filters = dict()
+        for position, sigma_filter in enumerate(filters):
+            if isinstance(sigma_filter.filter.rules, str):  # any rule
+                self.logsource_filters.setdefault(logsource_key(sigma_filter.logsource), list()).append(position)
+            else:
+                for reference in sigma_filter.filter.rules:
+                    self.reference_filters.setdefault(reference_key(reference.reference), list()).append(position)
+
+    def filters_for(self, rule):
+        """Filters that apply to rule in the order they were given."""
+        positions = set()
+        for key in set(product(*((value, None) for value in logsource_key(rule.logsource)))):
+            positions.update(self.logsource_filters.get(key, ()))
+        for key in (rule.id, rule.name):
+            if key is not None:
+                positions.update(self.reference_filters.get(key, ()))
+        return [
+            self.filters[position]
+            for position in sorted(positions)
+            if rule.logsource in self.filters[position].logsource
+        ]
+
+
+def merge_collections(collections):
+    """
+    Merge collections like SigmaCollection.merge without resolving references, but apply the
+    filters with a FilterIndex, so each rule only considers the filters that apply to it.
+    """
+    rule_collection = SigmaCollection(
+        [rule for collection in collections for rule in collection.rules + collection.filters],
+        [error for collection in collections for error in collection.errors],
+        collect_filters=True,
+        resolve_references=False,
+    )
+    if rule_collection.filters:
+        filter_index = FilterIndex(rule_collection.filters)
+        for i, rule in enumerate(rule_collection.rules):
+            if isinstance(rule, SigmaRule):
+                for sigma_filter in filter_index.filters_for(rule):
+                    rule = sigma_filter.apply_on_rule(rule)
+                rule_collection.rules[i] = rule
+    return rule_collection
+
+
+def rule_shard_key(rule):
+    """
+    Key that assigns a rule to a shard: the rule id, the rule name or, for rules with neither, the
+    rule file path and title. Paths are only stable if all shards are loaded with the same inputs.
+    """
+    if rule.id is not None:
+        return str(rule.id)
+    if rule.name is not None:
+        return rule.name
+    return f"{rule.source.path.as_posix() if rule.source is not None else ''}:{rule.title}"
+
+
+def shard_index(key, count):
+    """Zero-based shard of a key. Uses a cryptographic hash that, unlike hash(), is the same in all processes."""
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big") % count
+
+
+def select_shard(rule_collection, shard):
+    """
+    Restrict rule_collection to the rules of shard (K, N). Rules connected by correlation
+    references are assigned together by the smallest shard key of the group, references must be
+    resolved. The order of the rules is kept. Errors of rules of other shards are removed, errors
+    that don't belong to a rule are kept in all shards.
+    """
+    index, count = shard
+    selected = set()
+    for group in group_by_references(rule_collection.rules):
+        if shard_index(min(rule_shard_key(rule) for rule in group), count) == index - 1:
+            selected.update(id(rule) for rule in group)
+    rule_errors = {id(error) for rule in rule_collection.rules for error in rule.errors}
+    selected_errors = {
+        id(error) for rule in rule_collection.rules if id(rule) in selected for error in rule.errors
+    }
+    rule_collection.rules = [rule for rule in rule_collection.rules if id(rule) in selected]
+    rule_collection.errors = [
+        error
+        for error in rule_collection.errors
+        if id(error) in selected_errors or id(error) not in rule_errors
+    ]
+
+
+def remove_unresolved_correlations(collections):
+    """
+    Remove correlation rules that reference rules not contained in collections, e.g. rules that
+    weren't selected, and correlation rules that reference removed correlation rules.
+    """
+    def keys(rule):
+        return {key for key in (rule.id and str(rule.id), rule.name) if key}
+
+    known = {key for collection in collections for rule in collection.rules for key in keys(rule)}
+    removed = True
+    while removed:
+        removed = False
+        for collection in collections:
+            kept = list()
+            for rule in collection.rules:
+                if isinstance(rule, SigmaCorrelationRule) and not all(
+                    normalize_reference(reference) in known for reference in rule_references(rule)
+                ):
+                    known.difference_update(keys(rule))
+                    removed = True
+                else:
+                    kept.append(rule)
+            collection.rules = kept
+
+
+def load_rules(input, file_pattern, shard=None, select=(), min_level=None, status=(), tag=(), **load_options):
+    """
+    Load Sigma rules from files or stdin. See iter_rule_collections for the loading options.
+
+    All inputs are first resolved into a flat list of rule files that is parsed in one pass. The
+    rules and errors of all files are then assembled into a single SigmaCollection, filters are
+    applied and references resolved once. If shard is given as (K, N), only the rules of the K-th
+    of N shards are kept, see select_shard.
+
+    select, min_level, status and tag select the loaded rules by their metadata, see
+    RuleSelection. Correlation rules are loaded if all rules referenced by them are selected.
+    """
+    selection = RuleSelection.create(select, min_level, status, tag)
+    collections = list(iter_rule_collections(input, file_pattern, selection=selection, **load_options))
+    if selection is not None:
+        remove_unresolved_correlations(collections)
+    with timings.phase("filter application", sum(len(collection.rules) for collection in collections)):
+        rule_collection = merge_collections(collections)
+    resolve_rule_references(rule_collection)
+    if shard is not None:
+        select_shard(rule_collection, shard)
 
     return rule_collection
 
+
+def iter_loaded_rules(input, file_pattern, **load_options):
+    """Generate the collection loaded with load_rules, for loading it lazily in place of iter_rule_collections."""
+    yield load_rules(input, file_pattern, **load_options)
+
+
+class RuleStream:
+    """
+    Stream Sigma rules file by file without keeping the whole rule set in memory. This is intended
+    for processing that doesn't need collection-wide context. Filters are not applied and
+    references of correlation rules are not resolved. Filters are collected in the filters
+    property and errors of all loaded rules in the errors property, both are complete after the
+    stream was consumed. Rules with errors are not yielded.
+
+    Iterating the stream yields rules one by one, batches() yields lists of rules. A stream can
+    only be consumed once.
+
+    Sharding requires the whole rule set to keep correlation rules together with the rules they
+    reference, with a shard option, the rules are loaded with load_rules first.
+    """
+
+    def __init__(
+        self, input, file_pattern, shard=None, select=(), min_level=None, status=(), tag=(), **load_options
+    ):
+        if shard is not None:
+            self.collections = iter_loaded_rules(
+                input,
+                file_pattern,
+                shard=shard,
+                select=select,
+                min_level=min_level,
+                status=status,
+                tag=tag,
+                **load_options,
+            )
+        else:
+            self.collections = iter_rule_collections(
+                input,
+                file_pattern,
+                selection=RuleSelection.create(select, min_level, status, tag),
+                **load_options,
+            )
+        self.errors = list()
+        self.filters = list()
+
+    def __iter__(self):
+        for collection in self.collections:
+            self.errors.extend(collection.errors)
+            self.filters.extend(collection.filters)
+            yield from (rule for rule in collection.rules if not rule.errors)
+
+    def batches(self, size):
+        """Yield lists of at most size rules."""
+        rules = iter(self)
+        while batch := list(islice(rules, size)):
+            yield batch
+
+    def close(self):
+        """Stop loading of further rules and release the worker processes."""
+        self.collections.close()
+
+
 def check_rule_errors(sigma_collection):
     """
     Check if the SigmaCollection contains errors and handle them.
@@ -46,4 +964,4 @@ def check_rule_errors(sigma_collection):
             click.echo(f"* {error}", err=True)
         raise click.ClickException(
             "Errors found in Sigma rules. Please check the output above."
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,181 @@
+import re
+from fnmatch import fnmatch
+
+import click
+
+from sigma.rule import SigmaLevel, SigmaStatus
+
+levels = [level.name.lower() for level in SigmaLevel]
+statuses = [status.name.lower() for status in SigmaStatus]
+top_level_key = re.compile(r"([A-Za-z_][\w.-]*)[ \t]*:(\s|$)")
+
+
+def rule_selection_options(func):
+    """
+    Add the options that select rules by their metadata. The values are passed as keyword
+    arguments select, min_level, status and tag to the command. Commands that already have a
+    --min-level option keep their own.
+    """
+    params = {param.name for param in getattr(func, "__click_params__", ())}
+    func = click.option(
+        "--tag",
+        multiple=True,
+        help="Only process rules with a tag matching this glob pattern, e.g. 'attack.t1059*'. Repeat to select rules "
+        "matching any of the patterns.",
+    )(func)
+    func = click.option(
+        "--status",
+        type=click.Choice(statuses, case_sensitive=False),
+        multiple=True,
+        help="Only process rules with this status. Repeat to select rules with any of the statuses.",
+    )(func)
+    if "min_level" not in params:
+        func = click.option(
+            "--min-level",
+            type=click.Choice(levels, case_sensitive=False),
+            help="Only process rules with this level or a higher one.",
+        )(func)
+    func = click.option(
+        "--select",
+        multiple=True,
+        metavar="KEY=PATTERN",
+        help="Only process rules with a metadata value matching a glob pattern, e.g. 'logsource.product=windows'. "
+        "Nested keys are separated by dots. Patterns of the same key are alternatives, all keys must match.",
+    )(func)
+    return func
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def matches_any(values, patterns):
+    return any(fnmatch(str(value).lower(), pattern) for value in values for pattern in patterns)
+
+
+class RuleSelection:
+    """
+    Selection of Sigma rules by their metadata: values of keys given as dotted paths, minimum
+    level, status and tags. All values are matched case-insensitively, patterns are glob patterns.
+    Filters and correlation rules are always selected, load_rules removes correlation rules that
+    reference rules that weren't selected.
+
+    The selection is evaluated on the rule documents before the rules are constructed. For
+    single-document rule files, it is even evaluated before YAML parsing of the whole file: only
+    the top-level sections the selection depends on are extracted from the file and parsed, so
+    most files that aren't selected are never parsed completely.
+    """
+
+    def __init__(self, select=(), min_level=None, status=(), tag=()):
+        self.select = dict()
+        for item in select:
+            key, sep, pattern = item.partition("=")
+            if not sep or not key:
+                raise click.BadParameter(f"Value '{item}' has not format key=pattern", param_hint="select")
+            self.select.setdefault(tuple(key.split(".")), list()).append(pattern.lower())
+        self.min_level = levels.index(min_level.lower()) if min_level is not None else None
+        self.status = {value.lower() for value in status}
+        self.tag = [pattern.lower() for pattern in tag]
+        self.keys = {path[0] for path in self.select}
+        if self.min_level is not None:
+            self.keys.add("level")
+        if self.status:
+            self.keys.add("status")
+        if self.tag:
+            self.keys.add("tags")
+
+    @classmethod
+    def create(cls, select=(), min_level=None, status=(), tag=()):
+        """Return the selection given by the options or None if no rules are deselected."""
+        if not (select or min_level or status or tag):
+            return None
+        return cls(select, min_level, status, tag)
+
+    def fingerprint(self):
+        """Identify the selection in cache keys."""
+        return repr(
+            (
+                sorted(self.select.items()),
+                self.min_level,
+                sorted(self.status),
+                self.tag,
+            )
+        )
+
+    def matches(self, document):
+        """Check if the rule document, a dict like parsed from YAML, is selected."""
+        if "correlation" in document or "filter" in document:
+            return True
+        if self.min_level is not None:
+            level = str(document.get("level")).lower()
+            if level not in levels or levels.index(level) < self.min_level:
+                return False
+        if self.status and str(document.get("status")).lower() not in self.status:
+            return False
+        if self.tag and not matches_any(as_list(document.get("tags")), self.tag):
+            return False
+        for path, patterns in self.select.items():
+            value = document
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if not matches_any(as_list(value), patterns):
+                return False
+        return True
+
+    def header(self, content):
+        """
+        Extract the top-level sections of a single-document rule file that the selection depends
+        on as YAML text. Returns None if the file can't be decided from them, e.g. because it
+        contains multiple documents, collection actions, correlation rules or filters, or isn't
+        formatted as block mapping.
+        """
+        lines = list()
+        keys = set()
+        include = False
+        for line in content.splitlines(keepends=True):
+            if line.startswith(("---", "...")):
+                if keys:  # further document
+                    return None
+                continue
+            if line[:1] not in (" ", "\t", "-", "#", "\n", "\r", ""):  # not a continuation of the section
+                match = top_level_key.match(line)
+                if match is None:
+                    return None
+                key = match.group(1)
+                keys.add(key)
+                include = key in self.keys
+            if include:
+                lines.append(line)
+        if keys & {"action", "correlation", "filter"}:
+            return None
+        return "".join(lines)
+
+    def select_documents(self, documents):
+        """
+        Return the selected rule documents. Returns None if the documents contain collection
+        actions, these have to be selected with select_rules after the rules were constructed.
+        """
+        if any(isinstance(document, dict) and "action" in document for document in documents):
+            return None
+        return [
+            document for document in documents if not isinstance(document, dict) or self.matches(document)
+        ]
+
+    def select_rules(self, collection):
+        """Remove the rules that aren't selected from collection together with their errors."""
+        removed_errors = set()
+        rules = list()
+        for rule in collection.rules:
+            try:
+                selected = self.matches(rule.to_dict())
+            except Exception:  # rules with errors are kept, so their errors are reported
+                selected = True
+            if selected:
+                rules.append(rule)
+            else:
+                removed_errors.update(id(error) for error in rule.errors)
+        collection.rules = rules
+        collection.errors = [error for error in collection.errors if id(error) not in removed_errors]
+        return collection
@@ -0,0 +1,447 @@
+import base64
+import copy
+import json
+import os
+import socket
+import socketserver
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import click
+import yaml
+
+from sigma.analyze.attack import calculate_attack_scores, score_functions
+from sigma.analyze.fields import extract_fields_from_collection
+from sigma.analyze.stats import create_logsourcestats
+from sigma.cli.cache import PipelineCache
+from sigma.cli.check import setup_validator
+from sigma.cli.convert import Conversion, create_backend, merge_backend_options
+from sigma.cli.rules import JobsParamType, merge_collections, parse_rule_content, resolve_rule_references
+from sigma.exceptions import SigmaConditionError, SigmaError
+from sigma.rule import SigmaLevel, SigmaRule, SigmaStatus
+
+class RequestError(Exception):
+    """Error that is returned to the client with an HTTP status and a JSON body."""
+
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.body = {"error": message, **details}
+
+
+# Warm state of the process handling requests. Server threads share the state of the server
+# process, each worker process builds its own.
+pipeline_cache = None
+validators = dict()
+validators_lock = threading.Lock()
+
+
+def init_serve_worker(cache_dir, use_pipeline_cache):
+    global pipeline_cache
+    pipeline_cache = PipelineCache(cache_dir) if use_pipeline_cache else None
+
+
+def option(request, name, default=None, type=None, required=False, items=None):
+    """Get an option from a request and check its type and, for lists, the type of its items."""
+    value = request.get(name, default)
+    if required and value is None:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Request contains no '{name}'.")
+    if type is not None and value is not None and not isinstance(value, type):
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid value of '{name}'.")
+    if items is not None and value is not None and not all(isinstance(item, items) for item in value):
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid item in '{name}'.")
+    return value
+
+
+def load_request_rules(request):
+    """
+    Parse the rules and filters passed as YAML strings in a request into a SigmaCollection with
+    applied filters and resolved references, like load_rules does for files.
+    """
+    rules = option(request, "rules", type=str, required=True)
+    filters = option(request, "filters", [], list, items=str)
+    try:
+        collections = [parse_rule_content(None, content) for content in [rules, *filters]]
+        rule_collection = merge_collections(collections)
+        resolve_rule_references(rule_collection)
+    except yaml.YAMLError as e:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid YAML in rules or filters: {e}")
+    except (AttributeError, TypeError):  # raised by pySigma for YAML documents that aren't mappings
+        raise RequestError(
+            HTTPStatus.UNPROCESSABLE_ENTITY, "Error while loading rules: each YAML document must be a mapping."
+        )
+    except SigmaError as e:
+        raise RequestError(HTTPStatus.UNPROCESSABLE_ENTITY, f"Error while loading rules: {e}")
+    return rule_collection
+
+
+def check_request_rules(rule_collection):
+    if rule_collection.errors:
+        raise RequestError(
+            HTTPStatus.UNPROCESSABLE_ENTITY,
+            "Errors found in Sigma rules.",
+            rule_errors=[str(error) for error in rule_collection.errors],
+        )
+
+
+def rule_label(rule):
+    return str(rule.id) if rule.id is not None else rule.name or rule.title
+
+
+def json_result(result):
+    """Make a backend result JSON serializable, binary results are encoded with base64."""
+    if isinstance(result, bytes):
+        return {"encoding": "base64", "data": base64.b64encode(result).decode("ascii")}
+    return result
+
+
+def handle_convert(request):
+    try:
+        conversion = Conversion(
+            option(request, "target", type=str, required=True),
+            option(request, "pipeline", [], list, items=str),
+            option(request, "format", "default", str),
+            option(request, "correlation_method", type=str),
+            merge_backend_options([option(request, "backend_options", {}, dict)]),
+            without_pipeline=option(request, "without_pipeline", False, bool),
+            pipeline_check=option(request, "pipeline_check", True, bool),
+            skip_unsupported=option(request, "skip_unsupported", False, bool),
+            pipeline_cache=pipeline_cache,
+        )
+    except KeyError as e:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown target {e}.")
+    rule_collection = load_request_rules(request)
+    check_request_rules(rule_collection)
+    backend = conversion.backend
+    try:
+        result = backend.convert(rule_collection, conversion.format, conversion.correlation_method)
+    except (SigmaError, NotImplementedError) as e:
+        raise RequestError(HTTPStatus.UNPROCESSABLE_ENTITY, f"Error while converting: {e}")
+    return {
+        "result": json_result(result),
+        "errors": [{"rule": rule_label(rule), "error": str(error)} for rule, error in backend.errors],
+    }
+
+
+def get_validator(exclude):
+    """
+    Validators are set up once per set of excluded validators. Validators keep state across rules,
+    each request gets its own copy.
+    """
+    key = tuple(sorted(name.lower() for name in exclude))
+    with validators_lock:
+        if key not in validators:
+            validators[key] = setup_validator(None, key)
+        return copy.deepcopy(validators[key])
+
+
+def handle_check(request):
+    rule_validator = get_validator(option(request, "exclude", [], list, items=str))
+    rule_collection = load_request_rules(request)
+    condition_errors = list()
+    check_rules = list()
+    for rule in rule_collection.rules:
+        if rule.errors:
+            continue
+        if isinstance(rule, SigmaRule):
+            try:
+                for condition in rule.detection.parsed_condition:
+                    condition.parse()
+            except SigmaConditionError as e:
+                condition_errors.append(f"Condition error in {condition.source}:{e}")
+                continue
+        check_rules.append(rule)
+    issues = rule_validator.validate_rules(check_rules)
+    return {
+        "rule_errors": [str(error) for error in rule_collection.errors],
+        "condition_errors": condition_errors,
+        "issues": [
+            {
+                "issue": issue.__class__.__name__,
+                "severity": issue.severity.name.lower(),
+                "description": issue.description,
+                "rules": [rule_label(rule) for rule in issue.rules],
+                **{
+                    field.name: str(getattr(issue, field.name))
+                    for field in fields(issue)
+                    if field.name not in ("rules", "severity", "description")
+                },
+            }
+            for issue in issues
+        ],
+    }
+
+
+def handle_analyze_logsource(request):
+    rule_collection = load_request_rules(request)
+    check_request_rules(rule_collection)
+    return {"logsources": create_logsourcestats(rule_collection)}
+
+
+def handle_analyze_attack(request):
+    function = option(request, "function", "count", str)
+    if function not in score_functions:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown score function '{function}'.")
+    try:
+        min_level = SigmaLevel[option(request, "min_level", "informational", str).upper()]
+        min_status = SigmaStatus[option(request, "min_status", "unsupported", str).upper()]
+    except KeyError as e:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown level or status {e}.")
+    rule_collection = load_request_rules(request)
+    check_request_rules(rule_collection)
+    scores = calculate_attack_scores(
+        rule_collection,
+        score_functions[function][0],
+        not option(request, "subtechniques", True, bool),
+        min_sigmalevel=min_level,
+        min_sigmastatus=min_status,
+    )
+    return {"scores": scores}
+
+
+def handle_analyze_fields(request):
+    target = option(request, "target", type=str, required=True)
+    try:
+        backend = create_backend(
+            target,
+            option(request, "pipeline", [], list, items=str),
+            option(request, "pipeline_check", True, bool),
+            True,
+            {},
+            pipeline_cache=pipeline_cache,
+        )
+    except KeyError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown target '{target}'.")
+    rule_collection = load_request_rules(request)
+    check_request_rules(rule_collection)
+    group = option(request, "group", False, bool)
+    all_fields, errors = extract_fields_from_collection(rule_collection, backend, group)
+    if group:
+        all_fields = {logsource: sorted(fields) for logsource, fields in sorted(all_fields.items())}
+    else:
+        all_fields = sorted(all_fields)
+    return {"fields": all_fields, "errors": [str(error) for error in errors]}
+
+
+endpoints = {
+    "/convert": handle_convert,
+    "/check": handle_check,
+    "/analyze/logsource": handle_analyze_logsource,
+    "/analyze/attack": handle_analyze_attack,
+    "/analyze/fields": handle_analyze_fields,
+}
+
+
+def handle_request(path, request):
+    """
+    Handle a request to an endpoint and return the HTTP status and the response body. This runs in
+    the server threads or in the worker processes.
+    """
+    try:
+        return HTTPStatus.OK, endpoints[path](request)
+    except RequestError as e:
+        return e.status, e.body
+    except click.ClickException as e:  # invalid conversion options
+        return HTTPStatus.BAD_REQUEST, {"error": e.format_message()}
+    except Exception as e:  # the client gets an answer in any case
+        return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Internal error: {e.__class__.__name__}: {e}"}
+
+
+class SigmaRequestHandler(BaseHTTPRequestHandler):
+    server_version = "sigma-cli"
+
+    def address_string(self):
+        # Clients of Unix sockets have no address.
+        return self.client_address[0] if self.client_address else "unix"
+
+    def send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(HTTPStatus.OK, {"status": "ok"})
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint '{self.path}'."})
+
+    def do_POST(self):
+        server = self.server
+        if self.path not in endpoints:
+            self.close_connection = True
+            return self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint '{self.path}'."})
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.close_connection = True
+            return self.send_json(HTTPStatus.LENGTH_REQUIRED, {"error": "Content-Length required."})
+        if length > server.max_request_size:
+            # The body is not read, the connection can't be reused.
+            self.close_connection = True
+            return self.send_json(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                {"error": f"Request exceeds the size limit of {server.max_request_size} bytes."},
+            )
+        body = self.rfile.read(length)
+        if not server.slots.acquire(blocking=False):
+            return self.send_json(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"error": "Too many concurrent requests."},
+                [("Retry-After", "1")],
+            )
+        try:
+            try:
+                request = json.loads(body)
+                if not isinstance(request, dict):
+                    raise ValueError("request is not a JSON object")
+            except ValueError as e:
+                return self.send_json(HTTPStatus.BAD_REQUEST, {"error": f"Invalid JSON request: {e}"})
+            if server.executor is None:
+                status, response = handle_request(self.path, request)
+            else:
+                status, response = server.executor.submit(handle_request, self.path, request).result()
+            self.send_json(status, response)
+        finally:
+            server.slots.release()
+
+
+class SigmaServerMixin:
+    """
+    Server state shared by the request handlers: the limits and the optional pool of worker
+    processes. Without worker processes, the requests are handled by the server threads.
+    """
+
+    daemon_threads = True
+
+    def setup_limits(self, max_request_size, max_concurrency, workers, cache_dir, use_pipeline_cache):
+        self.max_request_size = max_request_size
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        init_serve_worker(cache_dir, use_pipeline_cache)
+        if workers > 1:
+            self.executor = ProcessPoolExecutor(
+                workers, initializer=init_serve_worker, initargs=(cache_dir, use_pipeline_cache)
+            )
+        else:
+            self.executor = None
+
+    def server_close(self):
+        super().server_close()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class SigmaHTTPServer(SigmaServerMixin, ThreadingHTTPServer):
+    pass
+
+
+# Unix sockets and socketserver.UnixStreamServer don't exist on Windows.
+if hasattr(socket, "AF_UNIX"):
+
+    class SigmaUnixHTTPServer(SigmaServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        def server_close(self):
+            super().server_close()
+            try:
+                os.unlink(self.server_address)
+            except OSError:
+                pass
+
+
+def create_server(
+    host="127.0.0.1",
+    port=8000,
+    socket_path=None,
+    max_request_size=10 * 1024 * 1024,
+    max_concurrency=4,
+    workers=1,
+    cache_dir=None,
+    use_pipeline_cache=True,
+):
+    """
+    Create a server listening on host and port or on the Unix socket socket_path if given. A stale
+    socket file from a previous server is replaced.
+    """
+    if socket_path is not None:
+        if not hasattr(socket, "AF_UNIX"):
+            raise click.UsageError("--socket requires Unix sockets, which aren't available on this platform.")
+        socket_path = str(socket_path)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = SigmaUnixHTTPServer(socket_path, SigmaRequestHandler)
+    else:
+        server = SigmaHTTPServer((host, port), SigmaRequestHandler)
+    server.setup_limits(max_request_size, max_concurrency, workers, cache_dir, use_pipeline_cache)
+    return server
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address the server listens on.")
+@click.option("--port", type=int, default=8000, show_default=True, help="TCP port the server listens on.")
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Listen on this Unix socket instead of a TCP port.",
+)
+@click.option(
+    "--max-request-size",
+    type=click.IntRange(min=1),
+    default=10 * 1024 * 1024,
+    show_default=True,
+    help="Maximum size of a request body in bytes. Larger requests are rejected.",
+)
+@click.option(
+    "--max-concurrency",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Maximum number of requests processed at the same time. Further requests are rejected with status 503.",
+)
+@click.option(
+    "--workers",
+    "-j",
+    type=JobsParamType(),
+    default="1",
+    show_default=True,
+    help="Number of worker processes that handle the requests. With one worker, the requests are handled by threads in the server process. 'auto' uses one worker per CPU.",
+)
+@click.option(
+    "--pipeline-cache/--no-pipeline-cache",
+    default=True,
+    show_default=True,
+    help="Cache resolved processing pipelines in memory and on disk.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    envvar="SIGMA_CLI_CACHE_DIR",
+    help="Cache directory. Defaults to sigma-cli in the user cache directory.",
+)
+def serve(host, port, socket_path, max_request_size, max_concurrency, workers, pipeline_cache, cache_dir):
+    """
+    Run a local server that handles conversion, check and analysis requests. Plugins, backends and
+    processing pipelines stay loaded between requests. Requests are POSTed as JSON objects with
+    the Sigma rules as YAML string in 'rules' to the endpoints /convert, /check,
+    /analyze/logsource, /analyze/attack and /analyze/fields.
+    """
+    server = create_server(
+        host, port, socket_path, max_request_size, max_concurrency, workers, cache_dir, pipeline_cache
+    )
+    if socket_path is not None:
+        click.echo(f"Serving on unix socket {socket_path}", err=True)
+    else:
+        click.echo(f"Serving on http://{host}:{server.server_address[1]}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
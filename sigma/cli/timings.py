@@ -0,0 +1,181 @@
+import functools
+import json
+import threading
+from time import perf_counter, process_time
+
+import click
+from prettytable import PrettyTable
+
+
+class Phase:
+    """Accumulated wall and CPU time and processed item count of a phase."""
+
+    __slots__ = ("wall", "cpu", "child_wall", "child_cpu", "items")
+
+    def __init__(self):
+        self.wall = self.cpu = self.child_wall = self.child_cpu = 0.0
+        self.items = 0
+
+    @property
+    def self_wall(self):
+        return self.wall - self.child_wall
+
+    @property
+    def self_cpu(self):
+        return self.cpu - self.child_cpu
+
+
+class PhaseMeasurement:
+    """A single measurement of a phase, nested in the measurements on stack."""
+
+    __slots__ = ("phase", "stack", "wall", "cpu")
+
+    def __init__(self, phase, stack):
+        self.phase = phase
+        self.stack = stack
+
+    def __enter__(self):
+        self.stack.append(self.phase)
+        self.wall, self.cpu = perf_counter(), process_time()
+        return self.phase
+
+    def __exit__(self, *exc_info):
+        wall, cpu = perf_counter() - self.wall, process_time() - self.cpu
+        stack = self.stack
+        stack.pop()
+        phase = self.phase
+        phase.wall += wall
+        phase.cpu += cpu
+        if stack:
+            stack[-1].child_wall += wall
+            stack[-1].child_cpu += cpu
+
+
+class Timings:
+    """
+    Wall and CPU time spent in the phases of a command. Phases can be nested, e.g. parsing of
+    rules that are loaded while they are converted. The time of nested phases is only accounted to
+    the innermost phase, so the phase times add up to the time of the whole command. Phases are
+    recorded per thread.
+
+    Phases are measured with two clock reads at start and end, this is cheap compared to the
+    measured work and is always done. The report is only shown with --timings. CPU times are the
+    times of the main process, work done in worker processes only contributes its wall time to the
+    phases waiting for it.
+    """
+
+    def __init__(self):
+        self.phases = dict()
+        self.local = threading.local()
+        self.start = (perf_counter(), process_time())
+
+    @property
+    def stack(self):
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = list()
+            return self.local.stack
+
+    def phase(self, name, items=0):
+        """
+        Measure a phase in a with statement. The phase object is returned on entering, further
+        processed items can be added to its items attribute.
+        """
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases.setdefault(name, Phase())
+        phase.items += items
+        return PhaseMeasurement(phase, self.stack)
+
+    def iterate(self, name, iterable, count=None):
+        """
+        Generate the items of iterable and measure the time spent in generating them as phase. The
+        item count is incremented by count(item) for each item or by one if count is not given.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name) as phase:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                phase.items += 1 if count is None else count(item)
+            yield item
+
+    def instrument(self, cls, method_name, name):
+        """Measure all calls of a method of cls as phase."""
+        method = getattr(cls, method_name)
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.phase(name, 1):
+                return method(*args, **kwargs)
+
+        setattr(cls, method_name, wrapper)
+
+    def rows(self):
+        total_wall = perf_counter() - self.start[0]
+        total_cpu = process_time() - self.start[1]
+        rows = [
+            (name, phase.self_wall, phase.self_cpu, phase.items)
+            for name, phase in self.phases.items()
+        ]
+        measured_wall = sum(row[1] for row in rows)
+        measured_cpu = sum(row[2] for row in rows)
+        rows.append(("other", total_wall - measured_wall, total_cpu - measured_cpu, 0))
+        rows.append(("total", total_wall, total_cpu, 0))
+        return rows
+
+    def report(self, format="table"):
+        """Print the time spent in each phase to stderr as table or JSON."""
+        rows = self.rows()
+        if format == "json":
+            click.echo(
+                json.dumps(
+                    [
+                        {
+                            "phase": name,
+                            "wall": wall,
+                            "cpu": cpu,
+                            "items": items,
+                            "throughput": items / wall if items and wall > 0 else None,
+                        }
+                        for name, wall, cpu, items in rows
+                    ]
+                ),
+                err=True,
+            )
+        else:
+            table = PrettyTable(
+                field_names=("Phase", "Wall (s)", "CPU (s)", "Items", "Items/s"), align="r"
+            )
+            table.align["Phase"] = "l"
+            table.add_rows(
+                [
+                    (
+                        name,
+                        f"{wall:.3f}",
+                        f"{cpu:.3f}",
+                        items or "",
+                        f"{items / wall:.1f}" if items and wall > 0 else "",
+                    )
+                    for name, wall, cpu, items in rows
+                ]
+            )
+            click.echo(table.get_string(), err=True)
+
+
+timings = Timings()
+
+
+def enable_timings():
+    """
+    Instrument the pySigma internals that are measured in addition to the phases of Sigma CLI.
+    This adds a function call per processing pipeline application and is therefore only done if
+    the timings are reported.
+    """
+    from sigma.processing.pipeline import ProcessingPipeline
+
+    if not hasattr(ProcessingPipeline.apply, "__wrapped__"):  # already instrumented
+        timings.instrument(ProcessingPipeline, "apply", "pipeline application")
@@ -0,0 +1,332 @@
+import ctypes
+import ctypes.util
+import os
+import pickle
+import select
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import click
+
+from sigma.cli.cache import RuleCache
+from sigma.cli.lean import lean_collection
+from sigma.cli.selection import RuleSelection
+from sigma.cli.rules import (
+    chunk_paths,
+    group_by_references,
+    is_archive,
+    is_excluded,
+    merge_collections,
+    parse_archive,
+    parse_rule_file,
+    remove_unresolved_correlations,
+    resolve_rule_paths,
+    resolve_rule_references,
+    select_shard,
+    stdin_path,
+)
+from sigma.collection import SigmaCollection
+
+
+def watch_options(func):
+    """Options of the watch mode of sigma convert and sigma check."""
+    func = click.option(
+        "--watch-interval",
+        type=click.FloatRange(min=0, min_open=True),
+        default=1.0,
+        show_default=True,
+        help="Interval in seconds between checks for changes with --watch-polling.",
+    )(func)
+    func = click.option(
+        "--watch-polling",
+        is_flag=True,
+        default=False,
+        help="Check the input paths for changes in regular intervals instead of using inotify. "
+        "This is the default on platforms without inotify.",
+    )(func)
+    func = click.option(
+        "--watch",
+        is_flag=True,
+        default=False,
+        help="Keep running and process the rules again when rule files change. Only changed files are parsed again.",
+    )(func)
+    return func
+
+
+class PollingWatcher:
+    """Wait for changes by sleeping for the polling interval, the changes are found by WatchedRules."""
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def wait(self):
+        time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Wait for changes of the watched directories with inotify. All directories below the watched
+    paths, except excluded ones, are watched. Watches are added again before each wait, so new
+    directories are watched as well. Events arriving within debounce seconds after the first one,
+    e.g. from editors writing files in multiple steps, are handled together.
+    """
+
+    events = (
+        0x00000004  # IN_ATTRIB
+        | 0x00000008  # IN_CLOSE_WRITE
+        | 0x00000040  # IN_MOVED_FROM
+        | 0x00000080  # IN_MOVED_TO
+        | 0x00000100  # IN_CREATE
+        | 0x00000200  # IN_DELETE
+        | 0x00000400  # IN_DELETE_SELF
+    )
+
+    def __init__(self, paths, exclude_path=(), debounce=0.1):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = paths
+        self.exclude_path = exclude_path
+        self.debounce = debounce
+
+    def directories(self):
+        for path in self.paths:
+            if not path.is_dir():
+                yield path.parent
+                continue
+            for directory, subdirectories, _ in os.walk(path):
+                relative = os.path.relpath(directory, path)
+                subdirectories[:] = [
+                    name
+                    for name in subdirectories
+                    if not is_excluded(name, os.path.normpath(os.path.join(relative, name)), self.exclude_path)
+                ]
+                yield Path(directory)
+
+    def watch(self):
+        for directory in self.directories():
+            if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.events) < 0:
+                raise OSError(ctypes.get_errno(), f"Watching {directory} failed")
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait(self):
+        self.watch()
+        select.select([self.fd], [], [])
+        time.sleep(self.debounce)
+        self.drain()
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(paths, exclude_path=(), polling=False, interval=1.0):
+    """Watch paths with inotify if available and requested and by polling otherwise."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyWatcher(paths, exclude_path)
+            watcher.watch()
+            return watcher
+        except (OSError, AttributeError) as e:  # no inotify in libc or watch limit reached
+            click.echo(f"Watching with inotify failed ({e}), falling back to polling.", err=True)
+    return PollingWatcher(interval)
+
+
+def parse_watched_files(paths, file_patterns, exclude_path, rule_cache=None, selection=None):
+    """
+    Parse a chunk of rule files and archives in watch mode. Returns a collection and an error
+    message for each file, errors in one file, e.g. one that is being edited, don't affect the
+    others.
+    """
+    results = list()
+    for path in paths:
+        try:
+            if is_archive(path):
+                collections = list(parse_archive(path, file_patterns, exclude_path, 1, None, selection))
+                collection = SigmaCollection(
+                    [rule for collection in collections for rule in collection.rules + collection.filters],
+                    [error for collection in collections for error in collection.errors],
+                    collect_filters=True,
+                    resolve_references=False,
+                )
+            else:
+                collection = parse_rule_file(path, rule_cache, selection)
+            results.append((collection, None))
+        except Exception as e:
+            results.append((SigmaCollection([], collect_filters=True, resolve_references=False), str(e)))
+    return results
+
+
+class WatchedRules:
+    """
+    Rule files of the inputs of a command in watch mode. Each file is parsed once and again only
+    if it changed, identified by its modification time, size and inode. The parsed rules of each
+    file are kept pickled, collection() unpickles a fresh copy of all rules for each run, because
+    filters, processing pipelines and reference resolution modify the rules.
+    """
+
+    def __init__(
+        self,
+        input,
+        file_pattern,
+        exclude_path=(),
+        changed_since=None,
+        jobs=1,
+        rule_cache=False,
+        rule_cache_dir=None,
+        shard=None,
+        select=(),
+        min_level=None,
+        status=(),
+        tag=(),
+        lean=False,
+    ):
+        if stdin_path in input:
+            raise click.UsageError("--watch can't be used with rules from standard input.")
+        if changed_since is not None:
+            raise click.UsageError("--watch can't be used with --changed-since.")
+        self.input = input
+        self.file_pattern = file_pattern
+        self.file_patterns = (file_pattern,) if isinstance(file_pattern, str) else file_pattern
+        self.exclude_path = exclude_path
+        self.jobs = jobs
+        self.shard = shard
+        self.lean = lean
+        self.selection = RuleSelection.create(select, min_level, status, tag)
+        self.rule_cache = RuleCache(rule_cache_dir, self.selection) if rule_cache else None
+        self.files = dict()  # path -> (file key, pickled collection, contains filters)
+
+    @staticmethod
+    def file_key(path):
+        stat = path.stat()
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def parse_all(self, paths):
+        """
+        Parse the rule files and archives in paths. Many files, like on the first run, are parsed
+        in jobs worker processes. Files that can't be parsed are reported and contain no rules.
+        """
+        parse = partial(
+            parse_watched_files,
+            file_patterns=self.file_patterns,
+            exclude_path=self.exclude_path,
+            rule_cache=self.rule_cache,
+            selection=self.selection,
+        )
+        if self.jobs == 1 or len(paths) < 2:
+            results = parse(paths)
+        else:
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                results = [
+                    result
+                    for chunk_results in executor.map(parse, chunk_paths(paths, self.jobs))
+                    for result in chunk_results
+                ]
+        collections = list()
+        for path, (collection, error) in zip(paths, results):
+            if error is not None:
+                click.echo(f"Error while parsing {path}: {error}", err=True)
+            collections.append(collection)
+        return collections
+
+    def update(self):
+        """
+        Parse new and changed rule files. Returns the paths of the changed and new files and the
+        paths of the removed files.
+        """
+        files = dict()
+        changed = list()
+        for path in resolve_rule_paths(self.input, self.file_pattern, self.exclude_path):
+            try:
+                key = self.file_key(path)
+            except OSError:  # removed in the meantime
+                continue
+            entry = self.files.get(path)
+            if entry is None or entry[0] != key:
+                changed.append(path)
+                entry = (key, None, False)
+            files[path] = entry
+        for path, collection in zip(changed, self.parse_all(changed)):
+            files[path] = (
+                files[path][0],
+                pickle.dumps(collection, protocol=pickle.HIGHEST_PROTOCOL),
+                bool(collection.filters),
+            )
+        removed = [path for path in self.files if path not in files]
+        self.filters_changed = any(
+            self.files[path][2] for path in removed + changed if path in self.files
+        ) or any(files[path][2] for path in changed)
+        self.files = files
+        return changed, removed
+
+    def collection(self):
+        """Fresh copy of all rules with applied filters and resolved references, restricted to the shard if given."""
+        collections = [pickle.loads(collection) for _, collection, _ in self.files.values()]
+        if self.lean:  # strings are interned again after each unpickling
+            collections = [lean_collection(collection) for collection in collections]
+        if self.selection is not None:
+            remove_unresolved_correlations(collections)
+        rule_collection = merge_collections(collections)
+        resolve_rule_references(rule_collection)
+        if self.shard is not None:
+            select_shard(rule_collection, self.shard)
+        return rule_collection
+
+    def affected_rules(self, rule_collection, changed):
+        """
+        Rules of rule_collection that are affected by changes of the changed files: the rules of
+        these files and the rules connected to them by correlation references. All rules are
+        affected if filters changed.
+        """
+        if self.filters_changed:
+            return rule_collection.rules
+        changed = set(changed)
+        changed_archives = [path for path in changed if is_archive(path)]
+
+        def is_changed(rule):
+            if rule.source is None:
+                return False
+            path = rule.source.path
+            return path in changed or any(archive in path.parents for archive in changed_archives)
+
+        return [
+            rule
+            for group in group_by_references(rule_collection.rules)
+            if any(is_changed(rule) for rule in group)
+            for rule in group
+        ]
+
+
+def watch_rules(watched, watcher, handle):
+    """
+    Call handle(changed, removed) with the changed and removed rule files, first with all files,
+    then after each change until interrupted. Errors are shown and watching continues.
+    """
+    try:
+        changed, removed = watched.update()
+        while True:
+            if changed or removed:
+                click.echo(f"{len(changed)} rule files changed, {len(removed)} removed.", err=True)
+                try:
+                    handle(changed, removed)
+                except click.ClickException as e:
+                    e.show()
+                click.echo("Watching for changes...", err=True)
+            watcher.wait()
+            changed, removed = watched.update()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
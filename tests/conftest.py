@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """Keep the caches of the commands invoked by the tests out of the user cache directory."""
+    monkeypatch.setenv("SIGMA_CLI_CACHE_DIR", str(tmp_path_factory.mktemp("sigma-cli-cache")))
@@ -51,6 +51,35 @@ def test_attack_generate():
     assert '"minValue": 0' in result.stdout
 
 
+@pytest.fixture
+def mitre_attack_data(monkeypatch):
+    """Offline MITRE ATT&CK data for the techniques of the test rules."""
+    import sigma.data.mitre_attack
+
+    # The module dict is patched directly, attribute access would load the data.
+    data = vars(sigma.data.mitre_attack)
+    monkeypatch.setitem(data, "mitre_attack_version", "test")
+    monkeypatch.setitem(data, "mitre_attack_techniques_tactics_mapping", {"T1505.003": ["persistence"]})
+
+
+def test_attack_generate_rule_without_level(tmp_path, mitre_attack_data):
+    rule = open("tests/files/valid/sigma_rule.yml").read().replace("level: high\n", "")
+    (tmp_path / "rule.yml").write_text(rule)
+    cli = CliRunner()
+    result = cli.invoke(analyze_attack, ["--min-level", "medium", "count", "-", str(tmp_path)])
+    assert result.exit_code == 0
+    assert '"techniqueID": "T1505.003"' in result.stdout
+
+
+def test_attack_generate_no_techniques(tmp_path, mitre_attack_data):
+    rule = open("tests/files/valid/sigma_rule.yml").read().replace("level: high", "level: low")
+    (tmp_path / "rule.yml").write_text(rule)
+    cli = CliRunner()
+    result = cli.invoke(analyze_attack, ["--min-level", "medium", "count", "-", str(tmp_path)])
+    assert result.exit_code == 0
+    assert '"maxValue": 0' in result.stdout
+
+
 def test_attack_generate_max_value():
     cli = CliRunner()
     result = cli.invoke(
@@ -0,0 +1,157 @@
+import os
+import time
+
+import pytest
+
+from sigma.collection import SigmaCollection
+from sigma.cli.cache import (
+    ConversionCache,
+    MemoryConversionCache,
+    PipelineCache,
+    module_version,
+    pipeline_fingerprint,
+    pipeline_module,
+    rule_digest,
+)
+from sigma.cli.rules import load_rules
+from sigma.pipelines.base import Pipeline
+
+
+@pytest.fixture
+def rule():
+    return SigmaCollection.from_yaml(open("tests/files/valid/sigma_rule.yml").read()).rules[0]
+
+
+def test_rule_digest_filter_identifiers(tmp_path):
+    paths = (
+        tmp_path / "rule.yml",
+        tmp_path / "filter.yml",
+    )
+    paths[0].write_text(open("tests/files/valid/sigma_rule.yml").read())
+    paths[1].write_text(open("tests/files/sigma_filter.yml").read())
+    digests = {rule_digest(load_rules(paths, "*.yml").rules[0]) for _ in range(3)}
+    assert len(digests) == 1
+    assert digests != {rule_digest(load_rules(paths[:1], "*.yml").rules[0])}
+
+
+def test_pipeline_fingerprint(tmp_path):
+    pipeline = tmp_path / "pipeline.yml"
+    pipeline.write_text("name: test")
+    fingerprint = pipeline_fingerprint([str(pipeline), str(tmp_path)], {})
+    assert fingerprint == pipeline_fingerprint([str(pipeline), str(tmp_path)], {})
+    pipeline.write_text("name: changed")
+    assert fingerprint != pipeline_fingerprint([str(pipeline), str(tmp_path)], {})
+
+
+def test_pipeline_fingerprint_decorated_pipeline(pipeline_resolver):
+    pipelines = pipeline_resolver.pipelines
+    assert isinstance(pipelines["dummy_test"], Pipeline)  # registered with the decorator
+    assert pipeline_module("dummy_test") == "sigma.pipelines.test"
+    assert pipeline_module("another_test") == "sigma.pipelines.test"
+    assert pipeline_module("unknown") is None
+    fingerprint = pipeline_fingerprint(["dummy_test"], pipelines)
+    assert fingerprint == [("name", "dummy_test", module_version("sigma.pipelines.test"))]
+
+
+def test_conversion_cache(tmp_path, rule):
+    cache = ConversionCache(tmp_path, {"format": "default"})
+    assert cache.load(rule, lambda: (["query"], True)) == ["query"]
+    assert cache.load(rule, lambda: (["other"], True)) == ["query"]
+    assert (cache.hits, cache.misses) == (1, 1)
+    other_context = ConversionCache(tmp_path, {"format": "other"})
+    assert other_context.load(rule, lambda: (["other"], True)) == ["other"]
+
+
+def test_conversion_cache_not_cacheable(tmp_path, rule):
+    cache = ConversionCache(tmp_path)
+    assert cache.load(rule, lambda: ([], False)) == []
+    assert cache.load(rule, lambda: (["query"], True)) == ["query"]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_memory_conversion_cache(tmp_path, rule):
+    disk_cache = ConversionCache(tmp_path)
+    disk_cache.load(rule, lambda: (["query"], True))
+    cache = MemoryConversionCache(disk_cache)
+    assert cache.load(rule, lambda: (["other"], True)) == ["query"]  # from disk
+    assert cache.load(rule, lambda: (["other"], True)) == ["query"]  # from memory
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert (disk_cache.hits, disk_cache.misses) == (1, 1)
+
+
+def test_memory_conversion_cache_prune(rule):
+    cache = MemoryConversionCache()
+    assert cache.load(rule, lambda: ([], False)) == []
+    assert cache.entries == {}
+    cache.load(rule, lambda: (["query"], True))
+    cache.prune()
+    assert len(cache.entries) == 1
+    cache.prune()  # not used since the previous prune
+    assert cache.entries == {}
+
+
+def test_conversion_cache_evict(tmp_path):
+    rules = SigmaCollection.from_yaml(
+        "\n---\n".join(
+            open("tests/files/valid/sigma_rule.yml").read().replace("06a98a2cca2e", f"{i:012d}")
+            for i in range(4)
+        )
+    ).rules
+    cache = ConversionCache(tmp_path)
+    for i, rule in enumerate(rules):
+        cache.load(rule, lambda: (["x" * 1000], True))
+        os.utime(cache.entry_path(rule), (time.time() - 1000 * i,) * 2)
+    entry_size = cache.entry_path(rules[0]).stat().st_size
+
+    removed, entries = cache.evict(max_age=2500)
+    assert removed == 1  # the oldest entry
+    assert not cache.entry_path(rules[3]).exists()
+
+    removed, entries = cache.evict(max_size=2 * entry_size)
+    assert removed == 1
+    assert [path for path, _ in entries] == [cache.entry_path(rule) for rule in rules[:2]]
+
+
+@pytest.fixture
+def pipeline_resolver():
+    from sigma.cli.convert import pipeline_resolver
+
+    return pipeline_resolver
+
+
+def convert_with_pipeline(pipeline):
+    from sigma.backends.test import TextQueryTestBackend
+
+    return TextQueryTestBackend(pipeline).convert(
+        SigmaCollection.from_yaml(open("tests/files/valid/sigma_rule.yml").read())
+    )
+
+
+def test_pipeline_cache(tmp_path, pipeline_resolver):
+    pipeline_file = tmp_path / "pipeline.yml"
+    pipeline_file.write_text(open("tests/files/custom_pipeline.yml").read())
+    specs = [str(pipeline_file), "another_test"]
+    cache = PipelineCache(tmp_path / "cache")
+    pipeline = cache.resolve(pipeline_resolver, specs)
+    expected = convert_with_pipeline(pipeline_resolver.resolve(specs))
+    assert convert_with_pipeline(pipeline) == expected
+
+    cached_pipeline = cache.resolve(pipeline_resolver, specs)
+    assert cached_pipeline is not pipeline
+    assert convert_with_pipeline(cached_pipeline) == expected
+    assert convert_with_pipeline(PipelineCache(tmp_path / "cache").resolve(pipeline_resolver, specs)) == expected
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    pipeline_file.write_text(pipeline_file.read_text().replace("some_other_string", "changed"))
+    assert "changed" in convert_with_pipeline(cache.resolve(pipeline_resolver, specs))[0]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_pipeline_cache_errors_not_cached(tmp_path, pipeline_resolver):
+    from sigma.exceptions import SigmaPipelineNotFoundError
+
+    cache = PipelineCache(tmp_path)
+    for _ in range(2):
+        with pytest.raises(SigmaPipelineNotFoundError):
+            cache.resolve(pipeline_resolver, [str(tmp_path / "missing.yml")])
+    assert list(tmp_path.iterdir()) == []
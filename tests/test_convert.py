@@ -1,7 +1,15 @@
+import json
+import os
+import sys
+import time
+from collections import Counter
+from uuid import UUID
 from click.testing import CliRunner
 import pytest
+import sigma.cli.convert
 from sigma.cli.convert import convert
 import sigma.backends.test.backend
+import sigma.collection
 
 
 def test_convert_help():
@@ -270,4 +278,418 @@ def test_convert_invalid_correlation_method():
         convert, ["-t", "text_query_test", "-f", "str", "-c", "invalid", "tests/files/valid"]
     )
     assert result.exit_code != 0
-    assert "Correlation method 'invalid' is not supported" in result.stderr
\ No newline at end of file
+    assert "Correlation method 'invalid' is not supported" in result.stderr
+
+
+@pytest.fixture
+def conversion_corpus(tmp_path):
+    """Rules interleaved with correlation rules, some of them using a field the pipeline rejects."""
+    base_rule = open("tests/files/valid/sigma_rule.yml").read()
+    for i in range(40):
+        rule_id = f"00000000-0000-0000-0000-{i:012d}"
+        rule = base_rule.replace("5013332f-8a70-4e04-bcc1-06a98a2cca2e", rule_id)
+        if i % 10 == 5:
+            rule = rule.replace(" Image|endswith", " Unsupported|endswith")
+        (tmp_path / f"rule_{i:02d}.yml").write_text(rule)
+    (tmp_path / "correlations.yml").write_text(
+        "\n---\n".join(
+            f"""title: Correlation {i}
+correlation:
+    type: event_count
+    rules:
+        - 00000000-0000-0000-0000-{i:012d}
+        - 00000000-0000-0000-0000-{i + 20:012d}
+    group-by:
+        - User
+    timespan: 5m
+    condition:
+        gte: {i}
+"""
+            for i in range(1, 20, 3)
+        )
+    )
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(
+        """name: Reject field
+transformations:
+    - id: reject
+      type: detection_item_failure
+      message: Field Unsupported is not supported
+      field_name_conditions:
+          - type: include_fields
+            fields:
+                - Unsupported
+"""
+    )
+    return tmp_path, pipeline
+
+
+@pytest.mark.parametrize("format", ["default", "list_of_dict"])
+def test_convert_jobs_same_output(conversion_corpus, format):
+    path, _ = conversion_corpus
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "-f", format, "--no-rule-cache", str(path)]
+    sequential = cli.invoke(convert, args)
+    parallel = cli.invoke(convert, ["--jobs", "3"] + args)
+    assert sequential.exit_code == 0
+    assert parallel.exit_code == 0
+    assert parallel.stdout == sequential.stdout
+    assert "event_count >= 19" in parallel.stdout
+
+
+def test_convert_resolves_references_once(conversion_corpus, monkeypatch):
+    path, _ = conversion_corpus
+    monkeypatch.setattr(
+        sigma.collection.SigmaCollection,
+        "resolve_rule_references",
+        lambda self: pytest.fail("references resolved again by the backend"),
+    )
+    result = CliRunner().invoke(convert, ["-t", "text_query_test", "--no-rule-cache", str(path)])
+    assert result.exit_code == 0
+    assert "event_count >= 19" in result.stdout
+
+def test_convert_jobs_skip_unsupported(conversion_corpus):
+    path, pipeline = conversion_corpus
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "-p", str(pipeline), "-s", "--no-rule-cache", str(path)]
+    sequential = cli.invoke(convert, args)
+    parallel = cli.invoke(convert, ["--jobs", "3"] + args)
+    assert parallel.exit_code == 0
+    assert parallel.stdout == sequential.stdout
+    ignored_errors = parallel.stderr.split("Ignored errors:")[1]
+    assert ignored_errors == sequential.stderr.split("Ignored errors:")[1]
+    assert ignored_errors.count("Field Unsupported is not supported") == 4
+
+
+def test_convert_jobs_fail_unsupported(conversion_corpus):
+    path, pipeline = conversion_corpus
+    cli = CliRunner()
+    result = cli.invoke(
+        convert, ["-t", "text_query_test", "-p", str(pipeline), "--jobs", "3", "--no-rule-cache", str(path)]
+    )
+    assert result.exit_code != 0
+    assert "Field Unsupported is not supported" in result.stderr
+
+
+@pytest.mark.parametrize("format", ["default", "list_of_dict"])
+@pytest.mark.parametrize("jobs", ["1", "3"])
+def test_convert_stream_same_output(conversion_corpus, format, jobs):
+    path, _ = conversion_corpus
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "-f", format, "--jobs", jobs, "--no-rule-cache", str(path)]
+    result = cli.invoke(convert, args)
+    streamed = cli.invoke(convert, ["--stream"] + args)
+    assert streamed.exit_code == 0
+    assert streamed.stdout == result.stdout
+
+
+def test_convert_ndjson(conversion_corpus):
+    path, _ = conversion_corpus
+    cli = CliRunner()
+    result = cli.invoke(convert, ["-t", "text_query_test", "--ndjson", "--no-rule-cache", str(path)])
+    assert result.exit_code == 0
+    lines = result.stdout.splitlines()
+    assert len(lines) == 26 + 7  # rules not referenced by correlations and correlation rules
+    queries = [json.loads(line) for line in lines]
+    assert sum(query.endswith("where event_count >= 19") for query in queries) == 1
+    assert queries[-1] == 'ParentImage endswith "\\httpd.exe" and Image endswith "\\cmd.exe"'
+
+
+def test_convert_ndjson_indent():
+    cli = CliRunner()
+    result = cli.invoke(
+        convert, ["-t", "text_query_test", "--ndjson", "-j", "2", "tests/files/valid"]
+    )
+    assert result.exit_code != 0
+    assert "JSON indentation is not possible" in result.stderr
+
+
+def test_convert_stream_unsupported_format():
+    cli = CliRunner()
+    result = cli.invoke(
+        convert, ["-t", "text_query_test", "-f", "str", "--stream", "tests/files/valid"]
+    )
+    assert result.exit_code != 0
+    assert "can't be streamed" in result.stderr
+
+
+def test_convert_conversion_cache(conversion_corpus, tmp_path_factory):
+    path, _ = conversion_corpus
+    cache_dir = tmp_path_factory.mktemp("cache")
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "--rule-cache-dir", str(cache_dir), "--conversion-cache", "--cache-stats", str(path)]
+    uncached = cli.invoke(convert, ["-t", "text_query_test", "--no-rule-cache", str(path)])
+    first = cli.invoke(convert, args)
+    second = cli.invoke(convert, args)
+    assert first.stdout == second.stdout == uncached.stdout
+    assert "Conversion cache: 0 hits, 26 misses" in first.stderr
+    assert "Conversion cache: 26 hits, 0 misses (100.0% hit rate)" in second.stderr
+    assert "Conversion cache size: 26 entries" in second.stderr
+
+    parallel = cli.invoke(convert, ["--jobs", "3"] + args)
+    assert parallel.stdout == uncached.stdout
+    assert "Conversion cache: 26 hits, 0 misses" in parallel.stderr
+
+    other_option = cli.invoke(convert, ["-O", "testparam=1"] + args)
+    assert "Conversion cache: 0 hits, 26 misses" in other_option.stderr
+
+
+def test_convert_output_dir(conversion_corpus, tmp_path_factory):
+    path, _ = conversion_corpus
+    output_dir = tmp_path_factory.mktemp("output")
+    unrelated = output_dir / "unrelated.txt"
+    unrelated.write_text("keep")
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "--no-rule-cache", "--output-dir", str(output_dir), str(path)]
+
+    result = cli.invoke(convert, args)
+    assert result.exit_code == 0
+    assert "33 files written, 0 unchanged, 0 removed" in result.stderr
+    rule_file = output_dir / "00000000-0000-0000-0000-000000000000.txt"
+    assert rule_file.read_text() == 'ParentImage endswith "\\httpd.exe" and Image endswith "\\cmd.exe"\n'
+    assert len(list(output_dir.glob("*.txt"))) == 26 + 7 + 1  # rules, correlations, unrelated file
+
+    unchanged_file = output_dir / "00000000-0000-0000-0000-000000000003.txt"
+    mtime = unchanged_file.stat().st_mtime_ns
+    (path / "rule_00.yml").write_text((path / "rule_00.yml").read_text().replace("cmd.exe", "powershell.exe"))
+    (path / "rule_02.yml").unlink()
+    result = cli.invoke(convert, ["--jobs", "2"] + args)
+    assert result.exit_code == 0
+    assert "1 files written, 31 unchanged, 1 removed" in result.stderr
+    assert "powershell.exe" in rule_file.read_text()
+    assert not (output_dir / "00000000-0000-0000-0000-000000000002.txt").exists()
+    assert unchanged_file.stat().st_mtime_ns == mtime
+    assert unrelated.read_text() == "keep"
+
+
+def test_convert_output_dir_with_output(tmp_path):
+    cli = CliRunner()
+    result = cli.invoke(
+        convert,
+        ["-t", "text_query_test", "--output-dir", str(tmp_path), "-o", str(tmp_path / "out"), "tests/files/valid"],
+    )
+    assert result.exit_code != 0
+    assert "can't be used together" in result.stderr
+
+
+@pytest.fixture
+def conversion_matrix(tmp_path):
+    matrix = tmp_path / "matrix.yml"
+    matrix.write_text(
+        f"""conversions:
+    - target: text_query_test
+      output: {tmp_path / "default.txt"}
+    - target: text_query_test
+      pipeline: another_test
+      format: list_of_dict
+      backend-options:
+          testparam: 123
+      output: {tmp_path / "list_of_dict.json"}
+    - target: text_query_test
+      pipeline:
+          - another_test
+      output-dir: {tmp_path / "rules"}
+"""
+    )
+    return matrix
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_convert_matrix(conversion_matrix, jobs):
+    path = conversion_matrix.parent
+    cli = CliRunner()
+    result = cli.invoke(
+        convert,
+        ["--matrix", str(conversion_matrix), "--disable-pipeline-check", "--jobs", jobs, "--rule-cache", "tests/files/valid", "tests/files/sigma_correlation_rules.yml"],
+    )
+    assert result.exit_code == 0
+    assert result.stderr.count("Rule cache:") == 1  # rules are loaded once
+    expected = cli.invoke(
+        convert, ["-t", "text_query_test", "tests/files/valid", "tests/files/sigma_correlation_rules.yml"]
+    )
+    assert (path / "default.txt").read_text() == expected.stdout
+    expected = cli.invoke(
+        convert,
+        ["-t", "text_query_test", "-p", "another_test", "--disable-pipeline-check", "-f", "list_of_dict", "-O", "testparam=123", "tests/files/valid", "tests/files/sigma_correlation_rules.yml"],
+    )
+    assert (path / "list_of_dict.json").read_text() == expected.stdout
+    assert '"test": 123' in expected.stdout
+    assert (path / "rules" / "5013332f-8a70-4e04-bcc1-06a98a2cca2e.txt").read_text() == (
+        'EventID=1 and ParentImage endswith "\\httpd.exe" and Image endswith "\\cmd.exe"\n'
+    )
+
+
+def test_convert_matrix_single_rule_jobs(tmp_path):
+    matrix = tmp_path / "matrix.yml"
+    matrix.write_text(
+        f"""conversions:
+    - target: text_query_test
+      pipeline: another_test
+      output: {tmp_path / "pipeline.txt"}
+    - target: text_query_test
+      output: {tmp_path / "default.txt"}
+"""
+    )
+    cli = CliRunner()
+    result = cli.invoke(
+        convert,
+        ["--matrix", str(matrix), "--disable-pipeline-check", "--jobs", "2", "tests/files/valid/sigma_rule.yml"],
+    )
+    assert result.exit_code == 0
+    assert (tmp_path / "pipeline.txt").read_text().startswith("EventID=1 and ")
+    assert (tmp_path / "default.txt").read_text() == 'ParentImage endswith "\\httpd.exe" and Image endswith "\\cmd.exe"\n'
+
+
+@pytest.mark.parametrize(
+    "option,args",
+    [
+        ("--target", ["-t", "text_query_test"]),
+        ("--pipeline", ["-p", "another_test"]),
+        ("--format", ["-f", "list_of_dict"]),
+        ("--correlation-method", ["-c", "test"]),
+        ("--backend-option", ["-O", "testparam=123"]),
+    ],
+)
+def test_convert_matrix_conversion_option(conversion_matrix, option, args):
+    result = CliRunner().invoke(convert, ["--matrix", str(conversion_matrix)] + args + ["tests/files/valid"])
+    assert result.exit_code == 2
+    assert f"{option} can't be used with --matrix" in result.stderr
+
+
+def test_convert_matrix_invalid(tmp_path):
+    matrix = tmp_path / "matrix.yml"
+    matrix.write_text("conversions:\n    - target: unknown\n      output: out.txt\n")
+    cli = CliRunner()
+    result = cli.invoke(convert, ["--matrix", str(matrix), "tests/files/valid"])
+    assert result.exit_code != 0
+    assert "unknown target 'unknown' in conversion 1" in result.stderr
+
+
+def test_convert_matrix_invalid_format(tmp_path):
+    matrix = tmp_path / "matrix.yml"
+    matrix.write_text("conversions:\n    - target: text_query_test\n      format: unknown\n      output: out.txt\n")
+    cli = CliRunner()
+    result = cli.invoke(convert, ["--matrix", str(matrix), "tests/files/valid"])
+    assert result.exit_code != 0
+    assert "Output format 'unknown' is not supported" in result.stderr
+
+
+def test_convert_missing_target():
+    cli = CliRunner()
+    result = cli.invoke(convert, ["tests/files/valid"])
+    assert result.exit_code != 0
+    assert "Missing option '--target'" in result.stderr
+
+
+@pytest.mark.parametrize("jobs", ["1", "3"])
+def test_convert_rule_limits_same_output(conversion_corpus, jobs):
+    path, pipeline = conversion_corpus
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "-p", str(pipeline), "-s", "--no-rule-cache", str(path)]
+    sequential = cli.invoke(convert, args)
+    limits = ["--rule-timeout", "60"]
+    if sys.platform == "linux":  # address space limits aren't supported on all platforms
+        limits += ["--rule-memory-limit", "65536"]
+    supervised = cli.invoke(convert, ["--jobs", jobs] + limits + args)
+    assert supervised.exit_code == 0
+    assert supervised.stdout == sequential.stdout
+    assert supervised.stderr.split("Ignored errors:")[1] == sequential.stderr.split("Ignored errors:")[1]
+
+
+def slow_conversion():
+    time.sleep(60)
+
+
+def memory_hog():
+    bytearray(64 * 1024 * 1024 * 1024)
+
+
+def worker_crash():
+    os._exit(3)
+
+
+faults = {"slow": slow_conversion, "memory": memory_hog, "crash": worker_crash}
+
+
+class FaultInjectionBackend(sigma.backends.test.backend.TextQueryTestBackend):
+    """
+    Test backend that runs the fault named by the backend option fault before the conversion of
+    the rule of the conversion corpus with the number given in the backend option fault_rule. The
+    backend class is passed to the worker processes, so this works with all start methods.
+    """
+
+    def convert_rule(self, rule, output_format=None, callback=None):
+        fault = self.backend_options.get("fault")
+        if fault is not None and rule.id == UUID(int=int(self.backend_options["fault_rule"])):
+            faults[fault]()
+        return super().convert_rule(rule, output_format, callback)
+
+
+def inject_fault(monkeypatch, rule_number, fault):
+    """Use FaultInjectionBackend as text_query_test backend and return the options that inject fault."""
+    monkeypatch.setitem(sigma.cli.convert.backends, "text_query_test", FaultInjectionBackend)
+    return ["-O", f"fault={fault}", "-O", f"fault_rule={rule_number}"]
+
+
+@pytest.mark.parametrize(
+    "rule_number,action,limits,message",
+    [
+        (4, "slow", ["--rule-timeout", "1"], "time limit of 1.0 seconds exceeded"),
+        pytest.param(
+            4,
+            "memory",
+            ["--rule-memory-limit", "32768"],
+            "memory limit of 32768 MiB exceeded",
+            marks=pytest.mark.skipif(sys.platform != "linux", reason="address space limit is only enforced on Linux"),
+        ),
+        (4, "crash", ["--rule-timeout", "60"], "worker process terminated with exit code 3"),
+        (2, "slow", ["--rule-timeout", "1"], "time limit of 1.0 seconds exceeded"),
+    ],
+)
+@pytest.mark.parametrize("jobs", ["1", "3"])
+def test_convert_rule_limits_skip(conversion_corpus, monkeypatch, rule_number, action, limits, message, jobs):
+    path, _ = conversion_corpus
+    fault_options = inject_fault(monkeypatch, rule_number, action)
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "--no-rule-cache", str(path)]
+    expected = cli.invoke(convert, args).stdout.split("\n\n")
+    start = time.monotonic()
+    result = cli.invoke(convert, ["--jobs", jobs] + limits + fault_options + args)
+    assert time.monotonic() - start < 30
+    assert result.exit_code == 0
+    ignored_errors = result.stderr.split("Ignored errors:")[1]
+    assert f"rule_{rule_number:02d}.yml: Conversion skipped: {message}" in ignored_errors
+    missing = Counter(expected) - Counter(result.stdout.split("\n\n"))
+    if rule_number == 4:  # rule referenced by a correlation, which is skipped as well
+        assert "Conversion skipped: referenced rule was skipped" in ignored_errors
+        assert list(missing.elements()) == [query for query in expected if query.endswith("event_count >= 4")]
+    else:
+        assert list(missing.elements()) == [next(query for query in expected if query.startswith("ParentImage"))]
+
+
+def test_convert_rule_limits_skip_extended_correlation(tmp_path, monkeypatch):
+    base_rule = open("tests/files/valid/sigma_rule.yml").read()
+    for i in (4, 24):
+        (tmp_path / f"rule_{i:02d}.yml").write_text(
+            base_rule.replace("5013332f-8a70-4e04-bcc1-06a98a2cca2e", f"00000000-0000-0000-0000-{i:012d}")
+            .replace("title: Test rule", f"title: Rule {i}\nname: rule_{i}")
+        )
+    (tmp_path / "correlation.yml").write_text(
+        """title: Extended correlation
+correlation:
+    type: temporal
+    group-by:
+        - User
+    timespan: 5m
+    condition: rule_4 and rule_24
+"""
+    )
+    fault_options = inject_fault(monkeypatch, 4, "slow")
+    result = CliRunner().invoke(
+        convert, ["-t", "text_query_test", "--rule-timeout", "1", "--no-rule-cache"] + fault_options + [str(tmp_path)]
+    )
+    assert result.exit_code == 0
+    ignored_errors = result.stderr.split("Ignored errors:")[1]
+    assert "rule_04.yml: Conversion skipped: time limit of 1.0 seconds exceeded" in ignored_errors
+    assert "correlation.yml: Conversion skipped: referenced rule was skipped" in ignored_errors
+    assert "temporal" not in result.stdout
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from sigma.cli.convert import convert
+from sigma.cli.lean import lean_rule
+from sigma.cli.rules import load_rules
+from sigma.collection import SigmaCollection
+from sigma.rule import SigmaRule
+
+rule = open("tests/files/valid/sigma_rule.yml").read()
+
+
+def test_lean_rule():
+    sigma_rule = lean_rule(SigmaRule.from_yaml(rule))
+    assert (sigma_rule.description, sigma_rule.author, sigma_rule.references, sigma_rule.falsepositives) == (
+        None,
+        None,
+        [],
+        [],
+    )
+    assert sigma_rule.title == "Test rule"
+    assert [str(tag) for tag in sigma_rule.tags] == ["attack.t1505.003"]
+    assert sigma_rule.to_dict()["detection"] == SigmaRule.from_yaml(rule).to_dict()["detection"]
+
+
+def test_lean_rule_shared_strings():
+    first, second = (lean_rule(SigmaRule.from_yaml(rule)) for _ in range(2))
+    assert first.logsource.product is second.logsource.product
+    assert first.tags[0].name is second.tags[0].name
+    first_item = first.detection.detections["selection"].detection_items[0]
+    second_item = second.detection.detections["selection"].detection_items[0]
+    assert first_item.field is second_item.field
+    assert first_item.value[0].s[1] is second_item.value[0].s[1]
+
+
+def test_load_rules_lean_correlations():
+    rule_collection = load_rules((Path("tests/files/sigma_correlation_rules.yml"),), "*.yml", lean=True)
+    expected = SigmaCollection.from_yaml(open("tests/files/sigma_correlation_rules.yml").read())
+    assert [rule.title for rule in rule_collection.rules] == [rule.title for rule in expected.rules]
+    assert all(rule.description is None for rule in rule_collection.rules)
+    assert rule_collection.rules[1].rules[0].rule is rule_collection.rules[0]
+
+
+def test_convert_lean():
+    args = ["-t", "text_query_test", "--filter", "tests/files/sigma_filter.yml", "tests/files/valid"]
+    result = CliRunner().invoke(convert, args)
+    lean_result = CliRunner().invoke(convert, ["--lean"] + args)
+    assert lean_result.exit_code == 0
+    assert lean_result.stdout == result.stdout
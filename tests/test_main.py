@@ -1,4 +1,8 @@
+import json
+
+from sigma.cli.convert import convert
 from sigma.cli.main import cli as main, version
+from sigma.cli.timings import Timings
 from click.testing import CliRunner
 import re
 
@@ -15,3 +19,47 @@ def test_version():
     result = cli.invoke(version)
     assert result.exit_code == 0
     assert re.search("\\d+\\.\\d+\\.\\d+", result.stdout)
+
+
+def test_version_yaml_loader():
+    cli = CliRunner()
+    result = cli.invoke(version, ["--yaml-loader"])
+    assert result.exit_code == 0
+    assert result.stdout.startswith("YAML loader: ")
+
+
+def test_timings():
+    main.add_command(convert)
+    cli = CliRunner()
+    result = cli.invoke(main, ["--timings", "convert", "-t", "text_query_test", "tests/files/valid"])
+    assert result.exit_code == 0
+    assert 'ParentImage endswith "\\httpd.exe"' in result.stdout
+    for phase in ("plugin discovery", "rule parsing", "query generation", "pipeline application", "output", "total"):
+        assert phase in result.stderr
+
+
+def test_timings_json():
+    main.add_command(convert)
+    cli = CliRunner()
+    result = cli.invoke(
+        main, ["--timings", "--timings-format", "json", "convert", "-t", "text_query_test", "tests/files/valid"]
+    )
+    assert result.exit_code == 0
+    phases = {phase["phase"]: phase for phase in json.loads(result.stderr.splitlines()[-1])}
+    assert phases["rule parsing"]["items"] >= 1
+    assert phases["total"]["wall"] >= sum(
+        phase["wall"] for name, phase in phases.items() if name not in ("other", "total")
+    )
+
+
+def test_timings_phases():
+    timings = Timings()
+    with timings.phase("outer", 1):
+        with timings.phase("inner", 2) as phase:
+            phase.items += 1
+        assert list(timings.iterate("iterate", [[1, 2], [3]], len)) == [[1, 2], [3]]
+    assert timings.phases["inner"].items == 3
+    assert timings.phases["iterate"].items == 3
+    outer = timings.phases["outer"]
+    assert outer.child_wall == timings.phases["inner"].wall + timings.phases["iterate"].wall
+    assert outer.self_wall == outer.wall - outer.child_wall
@@ -0,0 +1,63 @@
+import io
+
+import click
+import pytest
+
+from sigma.cli.output import OutputWriter
+
+
+class RecordingOutput(io.BytesIO):
+    """Binary output that records its content on each flush."""
+
+    def __init__(self):
+        super().__init__()
+        self.flushed = list()
+
+    def flush(self):
+        self.flushed.append(self.getvalue())
+
+
+@pytest.mark.parametrize(
+    "result,expected",
+    [
+        (["a", "b"], b"a\n\nb\n"),
+        ([{"a": 1}, {"b": 2}], b'{"a": 1}\n{"b": 2}\n'),
+        ([], b"\n"),
+        ("a", b"a\n"),
+        (b"a\x00b", b"a\x00b\n"),
+        ({"a": 1}, b'{"a": 1}\n'),
+    ],
+)
+def test_write_result(result, expected):
+    output = io.BytesIO()
+    OutputWriter(output).write_result(result)
+    assert output.getvalue() == expected
+
+
+def test_write_result_unexpected_format():
+    with pytest.raises(click.ClickException, match="unexpected format"):
+        OutputWriter(io.BytesIO()).write_result(["a", {"b": 1}])
+
+
+def test_write_items_incremental():
+    output = RecordingOutput()
+    writer = OutputWriter(output)
+    writer.write_items(["a"])
+    writer.write_items(["b", "c"])
+    writer.close()
+    assert output.flushed == [b"a", b"a\n\nb\n\nc", b"a\n\nb\n\nc\n"]
+
+
+def test_write_items_ndjson():
+    output = io.BytesIO()
+    writer = OutputWriter(output, ndjson=True)
+    writer.write_items(["a", {"b": 1}])
+    writer.close()
+    assert output.getvalue() == b'"a"\n{"b": 1}\n'
+
+
+def test_write_items_mixed():
+    writer = OutputWriter(io.BytesIO())
+    writer.write_items(["a"])
+    with pytest.raises(click.ClickException, match="mixed item types"):
+        writer.write_items([{"b": 1}])
@@ -0,0 +1,79 @@
+import json
+import pstats
+import time
+from collections import Counter
+
+import pytest
+from click.testing import CliRunner
+
+from sigma.cli.convert import convert
+from sigma.cli.main import cli as main
+from sigma.cli.profile import SamplingProfiler, samples_from_stats, stats_from_samples
+
+a = ("a.py", 1, "a")
+b = ("b.py", 1, "b")
+c = ("c.py", 1, "c")
+
+
+def test_stats_from_samples():
+    stats = stats_from_samples(Counter({(a, b): 2.0, (a, b, c): 1.0, (a,): 0.5}))
+    assert stats[a][:4] == (3, 3, 0.5, 3.5)
+    assert stats[b][:4] == (2, 2, 2.0, 3.0)
+    assert stats[c][4] == {b: (1, 1, 1.0, 1.0)}
+
+
+def test_samples_from_stats():
+    stats = stats_from_samples(Counter({(a, b): 2.0, (a, b, c): 1.0, (a, c): 1.0}))
+    samples = samples_from_stats(stats)
+    assert samples[(a, b)] == pytest.approx(2.0)
+    assert sum(samples.values()) == pytest.approx(4.0)
+    assert samples[(a, b, c)] + samples[(a, c)] == pytest.approx(2.0)
+
+
+def test_sampling_profiler():
+    profiler = SamplingProfiler(0.001)
+    profiler.start()
+    end = time.perf_counter() + 0.05
+    while time.perf_counter() < end:
+        pass
+    profiler.stop()
+    assert any(stack[-1][2] == "test_sampling_profiler" for stack in profiler.samples)
+
+
+@pytest.mark.parametrize("sampling", [[], ["--profile-sampling", "--profile-interval", "1"]])
+def test_profile_pstats(tmp_path, sampling):
+    main.add_command(convert)
+    profile_path = tmp_path / "sigma.prof"
+    result = CliRunner().invoke(
+        main, ["--profile", str(profile_path), *sampling, "convert", "-t", "text_query_test", "tests/files/valid"]
+    )
+    assert result.exit_code == 0
+    assert f"Profile written to {profile_path}" in result.stderr
+    pstats.Stats(str(profile_path))
+
+
+@pytest.mark.parametrize("sampling", [[], ["--profile-sampling", "--profile-interval", "1"]])
+def test_profile_speedscope(tmp_path, sampling):
+    main.add_command(convert)
+    profile_path = tmp_path / "sigma.json"
+    result = CliRunner().invoke(
+        main, ["--profile", str(profile_path), *sampling, "convert", "-t", "text_query_test", "tests/files/valid"]
+    )
+    assert result.exit_code == 0
+    profile = json.loads(profile_path.read_text())
+    assert profile["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+    sampled = profile["profiles"][0]
+    assert len(sampled["samples"]) == len(sampled["weights"])
+    frames = profile["shared"]["frames"]
+    assert all(0 <= index < len(frames) for sample in sampled["samples"] for index in sample)
+
+
+def test_profile_format_option(tmp_path):
+    main.add_command(convert)
+    profile_path = tmp_path / "sigma.out"
+    result = CliRunner().invoke(
+        main,
+        ["--profile", str(profile_path), "--profile-format", "speedscope", "convert", "-t", "text_query_test", "tests/files/valid"],
+    )
+    assert result.exit_code == 0
+    assert "profiles" in json.loads(profile_path.read_text())
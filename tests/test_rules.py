@@ -0,0 +1,755 @@
+import io
+import os
+import subprocess
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+
+import click
+import pytest
+import yaml
+from click.testing import CliRunner
+
+import sigma.cli.convert
+
+from sigma.cli.check import check
+from sigma.cli.convert import convert
+from sigma.cli.cache import RuleCache
+from sigma.cli.git import changed_files
+from sigma.collection import SigmaCollection
+from sigma.correlations import SigmaCorrelationRule
+from sigma.exceptions import SigmaCollectionError
+from sigma.cli.rules import (
+    FilterIndex,
+    JobsParamType,
+    RuleStream,
+    ShardParamType,
+    check_rule_errors,
+    chunk_paths,
+    group_by_references,
+    iter_yaml_collections,
+    load_rules,
+    merge_collections,
+    order_by_references,
+    parse_rule_content,
+    parse_yaml,
+    requires_collection,
+    resolve_rule_paths,
+)
+
+
+def rule_ids(rule_collection):
+    return [str(rule.id) for rule in rule_collection.rules]
+
+
+def test_jobs_param_type():
+    jobs = JobsParamType()
+    assert jobs.convert("4", None, None) == 4
+    assert jobs.convert(2, None, None) == 2
+    assert jobs.convert("auto", None, None) >= 1
+
+
+@pytest.mark.parametrize("value", ["0", "-1", "many"])
+def test_jobs_param_type_invalid(value):
+    with pytest.raises(click.BadParameter):
+        JobsParamType().convert(value, None, None)
+
+
+def test_shard_param_type():
+    assert ShardParamType().convert("2/4", None, None) == (2, 4)
+    assert ShardParamType().convert("1/1", None, None) == (1, 1)
+
+
+@pytest.mark.parametrize("value", ["0/4", "5/4", "1", "1/2/3", "a/b"])
+def test_shard_param_type_invalid(value):
+    with pytest.raises(click.BadParameter):
+        ShardParamType().convert(value, None, None)
+
+
+@pytest.fixture
+def shard_corpus(tmp_path):
+    rule = Path("tests/files/valid/sigma_rule.yml").read_text()
+    for i in range(20):
+        (tmp_path / f"rule_{i:02d}.yml").write_text(rule.replace("06a98a2cca2e", f"{i:012d}"))
+    (tmp_path / "correlations.yml").write_text(Path("tests/files/sigma_correlation_rules.yml").read_text())
+    return tmp_path
+
+
+def test_load_rules_shards(shard_corpus):
+    all_rules = load_rules((shard_corpus,), "*.yml").rules
+    positions = {str(rule.id): position for position, rule in enumerate(all_rules)}
+    shards = [load_rules((shard_corpus,), "*.yml", shard=(k, 3)) for k in range(1, 4)]
+    shard_ids = [rule_ids(shard) for shard in shards]
+    # every rule is in exactly one shard and the shards keep the order of the rules
+    assert sorted(id for ids in shard_ids for id in ids) == sorted(positions)
+    assert all(ids == sorted(ids, key=positions.get) for ids in shard_ids)
+    assert all(shard_ids)
+    # correlation rules are in the shard of the rules they reference
+    for shard in shards:
+        for rule in shard.rules:
+            if isinstance(rule, SigmaCorrelationRule):
+                assert all(rule_reference.rule in shard.rules for rule_reference in rule.referenced_rules)
+    # the assignment is stable
+    assert rule_ids(load_rules((shard_corpus,), "*.yml", shard=(2, 3))) == shard_ids[1]
+
+
+def test_load_rules_shard_errors(shard_corpus):
+    (shard_corpus / "invalid.yml").write_text(
+        Path("tests/files/invalid/sigma_rule_with_errors.yml").read_text()
+    )
+    error_counts = [len(load_rules((shard_corpus,), "*.yml", shard=(k, 3)).errors) for k in range(1, 4)]
+    assert sum(error_counts) == len(load_rules((shard_corpus,), "*.yml").errors)
+
+
+def test_rule_stream_shard(shard_corpus):
+    streamed = [str(rule.id) for rule in RuleStream((shard_corpus,), "*.yml", shard=(1, 2))]
+    assert streamed == rule_ids(load_rules((shard_corpus,), "*.yml", shard=(1, 2)))
+
+
+def test_convert_shards_concatenated(shard_corpus):
+    def run(*args):
+        result = CliRunner().invoke(convert, ["-t", "text_query_test", "--no-rule-cache", *args, str(shard_corpus)])
+        assert result.exit_code == 0
+        return result.stdout.strip().split("\n\n")
+
+    queries = run()
+    sharded = run("--shard", "1/2") + run("--shard", "2/2")
+    assert sorted(sharded) == sorted(queries)
+
+
+def test_chunk_paths():
+    paths = list(range(10))
+    chunks = chunk_paths(paths, 2)
+    assert [path for chunk in chunks for path in chunk] == paths
+    assert all(len(chunk) <= 2 for chunk in chunks)
+
+
+def test_load_rules_parallel_same_as_sequential():
+    input = (Path("tests/files"),)
+    sequential = load_rules(input, "*.yml")
+    parallel = load_rules(input, "*.yml", jobs=2)
+    assert rule_ids(parallel) == rule_ids(sequential)
+    assert [str(error) for error in parallel.errors] == [
+        str(error) for error in sequential.errors
+    ]
+
+
+def test_load_rules_parallel_resolves_correlations():
+    rule_collection = load_rules((Path("tests/files/sigma_correlation_rules.yml"),), "*.yml", jobs=2)
+    correlation_rule = rule_collection["4db3cdb5-aac6-4827-a756-d99475865d32"]
+    assert correlation_rule.rules[0].rule is rule_collection["base_rule"]
+
+
+def test_convert_jobs():
+    cli = CliRunner()
+    result = cli.invoke(
+        convert,
+        ["-t", "text_query_test", "--jobs", "2", "--filter", "tests/files/sigma_filter.yml", "tests/files/valid"],
+    )
+    assert result.exit_code == 0
+    assert 'and not User startswith "ADM_"' in result.stdout
+
+
+def test_check_jobs_invalid():
+    cli = CliRunner()
+    result = cli.invoke(check, ["--jobs", "none", "tests/files/valid"])
+    assert result.exit_code == 2
+    assert "not a number" in result.stderr
+
+
+def test_rule_cache_hits_and_misses(tmp_path):
+    rule_path = tmp_path / "rule.yml"
+    rule_path.write_text(Path("tests/files/valid/sigma_rule.yml").read_text())
+    cache = RuleCache(tmp_path / "cache")
+    first = cache.load(rule_path, parse_rule_content)
+    second = cache.load(rule_path, parse_rule_content)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert rule_ids(second) == rule_ids(first)
+    assert second.rules[0].source.path == rule_path
+
+
+def test_rule_cache_content_hash(tmp_path):
+    rule_path = tmp_path / "rule.yml"
+    content = Path("tests/files/valid/sigma_rule.yml").read_text()
+    rule_path.write_text(content)
+    cache = RuleCache(tmp_path / "cache")
+    cache.load(rule_path, parse_rule_content)
+    os.utime(rule_path, ns=(0, 0))  # only modification time changed: served from cache
+    cache.load(rule_path, parse_rule_content)
+    rule_path.write_text(content.replace("cmd.exe", "powershell.exe"))
+    changed = cache.load(rule_path, parse_rule_content)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert "powershell.exe" in str(changed.rules[0].detection.detections["selection"])
+
+
+def test_rule_cache_corrupt_entry(tmp_path):
+    rule_path = Path("tests/files/valid/sigma_rule.yml")
+    cache = RuleCache(tmp_path)
+    cache.entry_path(rule_path).parent.mkdir(parents=True)
+    cache.entry_path(rule_path).write_bytes(b"garbage")
+    assert len(cache.load(rule_path, parse_rule_content)) == 1
+    assert cache.misses == 1
+
+
+def test_rule_cache_evict(tmp_path):
+    cache = RuleCache(tmp_path / "cache")
+    rule_paths = [tmp_path / f"rule{i}.yml" for i in range(4)]
+    for i, rule_path in enumerate(rule_paths):
+        rule_path.write_text(Path("tests/files/valid/sigma_rule.yml").read_text())
+        cache.load(rule_path, parse_rule_content)
+        os.utime(cache.entry_path(rule_path), (time.time() - 1000 * i,) * 2)
+    cache.load(rule_paths[-1], parse_rule_content)  # hit marks the entry as recently used
+
+    removed, entries = cache.evict(max_age=1500)
+    assert removed == 1
+    assert not cache.entry_path(rule_paths[2]).exists()
+
+    removed, entries = cache.evict(max_size=2 * max(stat.st_size for _, stat in entries))
+    assert removed == 1  # the least recently used entry
+    assert {path for path, _ in entries} == {cache.entry_path(rule_paths[0]), cache.entry_path(rule_paths[3])}
+
+
+def test_convert_rule_cache(tmp_path):
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "--rule-cache", "--rule-cache-dir", str(tmp_path), "tests/files/valid"]
+    result = cli.invoke(convert, args)
+    assert "Rule cache: 0 hits, 1 misses" in result.stderr
+    result = cli.invoke(convert, ["--jobs", "2"] + args)
+    assert "Rule cache: 1 hits, 0 misses" in result.stderr
+    assert 'Image endswith "\\cmd.exe"' in result.stdout
+
+
+def test_convert_no_rule_cache(tmp_path):
+    cli = CliRunner()
+    result = cli.invoke(
+        convert,
+        ["-t", "text_query_test", "--no-rule-cache", "--rule-cache-dir", str(tmp_path), "tests/files/valid"],
+    )
+    assert result.exit_code == 0
+    assert "Rule cache" not in result.stderr
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_load_rules_many_path_arguments(tmp_path):
+    content = Path("tests/files/valid/sigma_rule.yml").read_text()
+    rule_paths = list()
+    for i in range(50):
+        rule_path = tmp_path / f"rule_{i}.yml"
+        rule_path.write_text(content.replace("title: ", f"title: {i} "))
+        rule_paths.append(rule_path)
+    rule_collection = load_rules(tuple(rule_paths), "*.yml")
+    assert [rule.source.path for rule in rule_collection.rules] == rule_paths
+
+
+def test_load_rules_filter_in_directory_applied_once(tmp_path):
+    for name in ("valid/sigma_rule.yml", "sigma_filter.yml"):
+        (tmp_path / Path(name).name).write_text(Path("tests/files", name).read_text())
+    cli = CliRunner()
+    result = cli.invoke(convert, ["-t", "text_query_test", "--no-rule-cache", str(tmp_path)])
+    assert result.stdout.count('not User startswith "ADM_"') == 1
+
+
+def test_rule_stream():
+    rule_stream = RuleStream((Path("tests/files/valid"), Path("tests/files/sigma_filter.yml")), "*.yml")
+    rules = list(rule_stream)
+    assert [str(rule.id) for rule in rules] == ["5013332f-8a70-4e04-bcc1-06a98a2cca2e"]
+    assert len(rule_stream.filters) == 1
+    assert rule_stream.errors == []
+
+
+def test_rule_stream_batches():
+    rule_stream = RuleStream((Path("tests/files/sigma_correlation_rules.yml"),), "*.yml", jobs=2)
+    assert [len(batch) for batch in rule_stream.batches(4)] == [4, 2]
+
+
+def test_rule_stream_errors():
+    rule_stream = RuleStream((Path("tests/files/invalid"),), "*.yml")
+    rules = list(rule_stream)
+    assert all(not rule.errors for rule in rules)
+    assert len(rule_stream.errors) > 0
+    with pytest.raises(click.ClickException):
+        check_rule_errors(rule_stream)
+
+
+def test_convert_stream_same_as_collection():
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "--no-rule-cache", "tests/files/valid"]
+    streamed = cli.invoke(convert, args)
+    with_filter = cli.invoke(convert, args + ["--filter", "tests/files/valid/sigma_rule.yml"])
+    assert streamed.exit_code == 0
+    assert streamed.stdout.strip() == with_filter.stdout.strip().split("\n\n")[0]
+
+
+def test_convert_stream_correlation_fallback():
+    cli = CliRunner()
+    result = cli.invoke(
+        convert, ["-t", "text_query_test", "--no-rule-cache", "tests/files/sigma_correlation_rules.yml"]
+    )
+    assert result.exit_code == 0
+    assert "| aggregate window=15min count() as event_count by fieldC, fieldD" in result.stdout
+
+
+@pytest.mark.parametrize(
+    "input,expected",
+    [
+        (("tests/files/valid",), False),
+        (("tests/files/valid", "tests/files/sigma_correlation_rules.yml"), True),
+        (("tests/files/sigma_filter.yml",), True),
+        (("-",), True),
+    ],
+)
+def test_requires_collection(input, expected):
+    assert requires_collection([Path(path) for path in input], "*.yml") is expected
+
+
+def test_convert_correlations_not_streamed(monkeypatch):
+    def rule_stream(*args, **kwargs):
+        raise AssertionError("rules with correlations must not be streamed")
+
+    monkeypatch.setattr(sigma.cli.convert, "RuleStream", rule_stream)
+    result = CliRunner().invoke(
+        convert, ["-t", "text_query_test", "tests/files/valid", "tests/files/sigma_correlation_rules.yml"]
+    )
+    assert result.exit_code == 0
+    assert "| aggregate window=15min count() as event_count by fieldC, fieldD" in result.stdout
+
+
+def test_convert_stdin_correlations():
+    result = CliRunner().invoke(
+        convert, ["-t", "text_query_test", "-"], input=open("tests/files/sigma_correlation_rules.yml").read()
+    )
+    assert result.exit_code == 0
+    assert "| aggregate window=15min count() as event_count by fieldC, fieldD" in result.stdout
+
+
+@pytest.mark.parametrize("path", sorted(Path("tests/files").glob("**/*.yml")))
+def test_parse_yaml_same_as_pure_python_loader(path):
+    content = path.read_text()
+    assert parse_yaml(content) == list(yaml.load_all(content, Loader=yaml.SafeLoader))
+
+
+@pytest.fixture
+def rule_tree(tmp_path):
+    for name in ("a.yml", "b.yaml", "c.txt", "sub/d.yml", "deprecated/e.yml", ".git/f.yml", "sub/deprecated/g.yml"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    return tmp_path
+
+
+def relative_paths(paths, root):
+    return [path.relative_to(root).as_posix() for path in paths]
+
+
+def test_resolve_rule_paths(rule_tree):
+    assert relative_paths(resolve_rule_paths((rule_tree,), "*.yml"), rule_tree) == [
+        "a.yml",
+        ".git/f.yml",
+        "deprecated/e.yml",
+        "sub/d.yml",
+        "sub/deprecated/g.yml",
+    ]
+
+
+def test_resolve_rule_paths_multiple_patterns_and_excludes(rule_tree):
+    rule_paths = resolve_rule_paths((rule_tree,), ("*.yml", "*.yaml"), (".git", "sub/deprecated"))
+    assert relative_paths(rule_paths, rule_tree) == ["a.yml", "b.yaml", "deprecated/e.yml", "sub/d.yml"]
+
+
+def test_resolve_rule_paths_exclude_name_in_any_directory(rule_tree):
+    rule_paths = resolve_rule_paths((rule_tree,), "*.yml", ("deprecated", ".*"))
+    assert relative_paths(rule_paths, rule_tree) == ["a.yml", "sub/d.yml"]
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        ("sub/*.yml", ["sub/d.yml"]),
+        ("deprecated/*.yml", ["deprecated/e.yml", "sub/deprecated/g.yml"]),
+        ("sub/deprecated/*.yml", ["sub/deprecated/g.yml"]),
+        ("nonexistent/*.yml", []),
+    ],
+)
+def test_resolve_rule_paths_pattern_with_directory(rule_tree, pattern, expected):
+    rule_paths = resolve_rule_paths((rule_tree,), pattern)
+    assert relative_paths(rule_paths, rule_tree) == expected
+    assert sorted(relative_paths(rule_tree.glob("**/" + pattern), rule_tree)) == sorted(expected)
+
+
+def test_convert_pattern_with_directory():
+    result = CliRunner().invoke(convert, ["-t", "text_query_test", "-P", "valid/*.yml", "tests/files"])
+    assert result.exit_code == 0
+    assert result.stdout.count("ParentImage") == 1
+
+
+def test_resolve_rule_paths_exclude_given_file(rule_tree):
+    assert resolve_rule_paths((rule_tree / "a.yml",), "*.yml", ("a.yml",)) == []
+
+
+def test_resolve_rule_paths_deduplication(rule_tree):
+    (rule_tree / "link").symlink_to(rule_tree / "sub")
+    (rule_tree / "sub" / "loop").symlink_to(rule_tree)
+    (rule_tree / "a_link.yml").symlink_to(rule_tree / "a.yml")
+    rule_paths = resolve_rule_paths(
+        (rule_tree / "sub" / "d.yml", rule_tree, rule_tree / "a.yml", Path("-")), "*.yml", (".git",)
+    )
+    assert relative_paths(rule_paths[:-1], rule_tree) == [
+        "sub/d.yml",
+        "a.yml",
+        "deprecated/e.yml",
+        "link/deprecated/g.yml",  # sub was already reached through the link
+    ]
+    assert rule_paths[-1] == Path("-")
+
+
+def test_convert_multiple_file_patterns(tmp_path):
+    (tmp_path / "rule.yaml").write_text(Path("tests/files/valid/sigma_rule.yml").read_text())
+    cli = CliRunner()
+    result = cli.invoke(
+        convert, ["-t", "text_query_test", "--no-rule-cache", "-P", "*.yml", "-P", "*.yaml", str(tmp_path)]
+    )
+    assert 'Image endswith "\\cmd.exe"' in result.stdout
+
+
+def write_correlation_chain(path, count):
+    """Chained correlation rules, all referencing rules that are loaded later."""
+    base_rule = Path("tests/files/valid/sigma_rule.yml").read_text()
+    (path / "b_rules.yml").write_text(
+        "\n---\n".join(
+            base_rule.replace("id: ", "name: base_{i}\nid: ".format(i=i))
+            .replace("5013332f-8a70-4e04-bcc1-", "00000000-0000-0000-0000-")
+            .replace("06a98a2cca2e", f"{i:012d}")
+            for i in range(count)
+        )
+    )
+    (path / "a_correlations.yml").write_text(
+        "---\n".join(
+            f"""title: Correlation {i}
+name: correlation_{i}
+correlation:
+    type: event_count
+    rules:
+        - base_{i}
+        - {f"correlation_{i - 1}" if i else "00000000-0000-0000-0000-000000000000"}
+    group-by:
+        - User
+    timespan: 5m
+    condition:
+        gte: 10
+"""
+            for i in reversed(range(count))
+        )
+    )
+
+
+@pytest.fixture
+def correlation_corpus(tmp_path):
+    """Thousands of chained correlation rules, all referencing rules that are loaded later."""
+    count = 2000
+    write_correlation_chain(tmp_path, count)
+    return tmp_path, count
+
+
+def test_resolve_rule_references_correlation_corpus(correlation_corpus):
+    path, count = correlation_corpus
+    rule_collection = load_rules((path,), "*.yml")
+    assert len(rule_collection) == 2 * count
+    positions = {id(rule): position for position, rule in enumerate(rule_collection.rules)}
+    correlation_rules = [rule for rule in rule_collection.rules if isinstance(rule, SigmaCorrelationRule)]
+    assert len(correlation_rules) == count
+    for rule in correlation_rules:
+        assert len(rule.referenced_rules) == 2
+        for rule_reference in rule.referenced_rules:
+            assert positions[id(rule_reference.rule)] < positions[id(rule)]
+            assert rule in rule_reference.rule._backreferences
+    assert rule_collection["correlation_0"].referenced_rules[1].rule is rule_collection["base_0"]
+
+
+def test_group_by_references(correlation_corpus):
+    path, count = correlation_corpus
+    (path / "c_unrelated.yml").write_text(Path("tests/files/valid/sigma_rule.yml").read_text())
+    rule_collection = load_rules((path,), "*.yml")
+    groups = group_by_references(rule_collection.rules)
+    # All correlations are chained, so they form one group with their base rules.
+    assert [len(group) for group in groups] == [2 * count, 1]
+    assert groups[0] == rule_collection.rules[: 2 * count]
+    assert rule_ids(SigmaCollection(groups[1])) == ["5013332f-8a70-4e04-bcc1-06a98a2cca2e"]
+
+
+@pytest.mark.parametrize("options", [["--jobs", "2"], ["--jobs", "2", "--rule-timeout", "60"]])
+def test_convert_correlation_chain_parallel(tmp_path, options):
+    write_correlation_chain(tmp_path, 300)  # deeper than the recursion limit of pickle
+    cli = CliRunner()
+    args = ["-t", "text_query_test", "--no-rule-cache", str(tmp_path)]
+    expected = cli.invoke(convert, args)
+    result = cli.invoke(convert, options + args)
+    assert result.exit_code == 0
+    assert result.stdout == expected.stdout
+
+
+def test_order_by_references_keeps_order():
+    rule_collection = load_rules((Path("tests/files/sigma_correlation_rules.yml"),), "*.yml")
+    assert [rule.title for rule in order_by_references(rule_collection.rules)] == [
+        "Base rule",
+        "Multiple occurrences of base event",
+        "Multiple occurrences of base event with different values",
+        "Base rule 1",
+        "Base rule 2",
+        "Temporal correlation rule",
+    ]
+
+
+collection_actions_yaml = """action: global
+title: Global title
+logsource:
+    category: process_creation
+detection:
+    condition: selection
+---
+id: 1a3e1a37-3c47-4b5a-8d4c-5b7f3a2b1c01
+detection:
+    selection:
+        Image: a.exe
+---
+action: repeat
+id: 1a3e1a37-3c47-4b5a-8d4c-5b7f3a2b1c02
+detection:
+    selection:
+        Image: b.exe
+---
+action: reset
+---
+title: Standalone
+id: 1a3e1a37-3c47-4b5a-8d4c-5b7f3a2b1c03
+logsource:
+    category: test
+detection:
+    selection:
+        Image: c.exe
+    condition: selection
+---
+"""
+
+
+def test_iter_yaml_collections_same_as_from_yaml():
+    streamed = SigmaCollection.merge(
+        list(iter_yaml_collections(io.StringIO(collection_actions_yaml))), resolve_references=False
+    )
+    expected = SigmaCollection.from_yaml(collection_actions_yaml)
+    assert [rule.to_dict() for rule in streamed.rules] == [rule.to_dict() for rule in expected.rules]
+
+
+def test_iter_yaml_collections_incremental():
+    class TrackedStream(io.StringIO):
+        def read(self, size=-1):
+            assert size >= 0, "stream must not be read at once"
+            return super().read(size)
+
+    rule = Path("tests/files/valid/sigma_rule.yml").read_text()
+    stream = TrackedStream("\n---\n".join([rule] * 1000))
+    collections = iter_yaml_collections(stream)
+    assert len(next(collections)) == 1
+    assert stream.tell() < len(stream.getvalue())
+    assert sum(1 for collection in collections) == 999
+
+
+def test_iter_yaml_collections_unknown_action():
+    with pytest.raises(SigmaCollectionError, match="Unknown Sigma collection action 'invalid' in rule 1"):
+        list(iter_yaml_collections(io.StringIO("action: invalid\n")))
+
+
+@pytest.fixture(params=["rules.zip", "rules.tar.gz"])
+def rule_archive(request, tmp_path):
+    path = tmp_path / request.param
+    members = {
+        "rules/windows/rule.yml": Path("tests/files/valid/sigma_rule.yml").read_text(),
+        "rules/readme.txt": "no rule",
+        "rules/deprecated/old.yml": "invalid: rule",
+    }
+    if request.param.endswith(".zip"):
+        with zipfile.ZipFile(path, "w") as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+    else:
+        with tarfile.open(path, "w:gz") as archive:
+            for name, content in members.items():
+                data = content.encode("utf-8")
+                member = tarfile.TarInfo(name)
+                member.size = len(data)
+                archive.addfile(member, io.BytesIO(data))
+    return path
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_load_rules_from_archive(rule_archive, jobs):
+    rule_collection = load_rules((rule_archive,), "*.yml", exclude_path=("deprecated",), jobs=jobs)
+    assert rule_ids(rule_collection) == ["5013332f-8a70-4e04-bcc1-06a98a2cca2e"]
+    assert rule_collection.rules[0].source.path == rule_archive / "rules/windows/rule.yml"
+
+
+def test_load_rules_from_archive_pattern_with_directory(rule_archive):
+    rule_collection = load_rules((rule_archive,), "windows/*.yml")
+    assert rule_ids(rule_collection) == ["5013332f-8a70-4e04-bcc1-06a98a2cca2e"]
+
+
+def test_load_rules_from_archive_errors(rule_archive):
+    rule_collection = load_rules((rule_archive,), "*.yml")
+    assert len(rule_collection.rules) == 2
+    assert str(rule_archive / "rules/deprecated/old.yml") in str(rule_collection.errors[0])
+
+
+def test_convert_archive(rule_archive):
+    cli = CliRunner()
+    result = cli.invoke(convert, ["-t", "text_query_test", "--exclude-path", "deprecated", str(rule_archive)])
+    assert result.exit_code == 0
+    assert 'Image endswith "\\cmd.exe"' in result.stdout
+
+
+def run_git(repo, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+    )
+
+
+@pytest.fixture
+def rule_repo(tmp_path, monkeypatch):
+    """Git repository with a base rule, a correlation referencing it and an unrelated rule."""
+    base_rule = Path("tests/files/valid/sigma_rule.yml").read_text()
+    (tmp_path / "base.yml").write_text(base_rule.replace("id: ", "name: base\nid: "))
+    (tmp_path / "other.yml").write_text(
+        base_rule.replace("5013332f-8a70-4e04-bcc1-06a98a2cca2e", "00000000-0000-0000-0000-000000000001")
+    )
+    (tmp_path / "correlation.yml").write_text(
+        """title: Correlation
+name: correlation
+correlation:
+    type: event_count
+    rules: base
+    group-by:
+        - User
+    timespan: 5m
+    condition:
+        gte: 10
+"""
+    )
+    run_git(tmp_path, "init", "-q")
+    run_git(tmp_path, "add", ".")
+    run_git(tmp_path, "commit", "-q", "-m", "initial")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_changed_files(rule_repo):
+    (rule_repo / "other.yml").write_text((rule_repo / "other.yml").read_text() + "\n")
+    (rule_repo / "new.yml").write_text("")
+    assert changed_files("HEAD") == {(rule_repo / "other.yml").resolve(), (rule_repo / "new.yml").resolve()}
+
+
+def test_changed_files_unknown_revision(rule_repo):
+    with pytest.raises(click.ClickException, match="git diff failed"):
+        changed_files("unknown-revision")
+
+
+def test_load_rules_changed_since_nothing_changed(rule_repo):
+    assert len(load_rules((rule_repo,), "*.yml", changed_since="HEAD")) == 0
+
+
+def test_load_rules_changed_since(rule_repo):
+    (rule_repo / "other.yml").write_text((rule_repo / "other.yml").read_text() + "\n")
+    assert rule_ids(load_rules((rule_repo,), "*.yml", changed_since="HEAD")) == [
+        "00000000-0000-0000-0000-000000000001"
+    ]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_load_rules_changed_since_with_referenced_rules(rule_repo, jobs):
+    (rule_repo / "correlation.yml").write_text(
+        (rule_repo / "correlation.yml").read_text().replace("gte: 10", "gte: 20")
+    )
+    rule_collection = load_rules((rule_repo,), "*.yml", changed_since="HEAD", jobs=jobs)
+    assert [rule.name for rule in rule_collection.rules] == ["base", "correlation"]
+    assert rule_collection["correlation"].rules[0].rule is rule_collection["base"]
+
+
+def test_convert_changed_since(rule_repo):
+    (rule_repo / "correlation.yml").write_text(
+        (rule_repo / "correlation.yml").read_text().replace("gte: 10", "gte: 20")
+    )
+    cli = CliRunner()
+    result = cli.invoke(convert, ["-t", "text_query_test", "--changed-since", "HEAD", str(rule_repo)])
+    assert result.exit_code == 0
+    assert "where event_count >= 20" in result.stdout
+
+
+filter_template = """
+title: Filter {i}
+logsource:
+{logsource}
+filter:
+    rules: {rules}
+    selection:
+        User: user{i}
+    condition: not selection
+"""
+
+
+def filter_rules():
+    logsources = ["    category: process_creation", "    product: windows", "    product: linux", "    service: sysmon"]
+    references = [
+        "any",
+        "[5013332f-8a70-4e04-bcc1-06a98a2cca2e]",
+        "[5013332F-8A70-4E04-BCC1-06A98A2CCA2E]",
+        "[base_rule, 5d8fd9da-6916-45ef-8d4d-3fa9d19d1a64]",
+        "[other_rule]",
+    ]
+    filters = list()
+    for logsource in logsources:
+        for rules in references:
+            filters.append(filter_template.format(i=len(filters), logsource=logsource, rules=rules))
+    return SigmaCollection.from_yaml("---".join(filters), collect_filters=True).filters
+
+
+def test_filter_index_same_as_sigma_filter():
+    rules = SigmaCollection.merge(
+        [
+            load_rules((Path("tests/files/valid"),), "*.yml"),
+            SigmaCollection.from_yaml(open("tests/files/sigma_correlation_rules.yml").read()),
+        ]
+    ).rules
+    filters = filter_rules()
+    filter_index = FilterIndex(filters)
+    for rule in rules:
+        if isinstance(rule, SigmaCorrelationRule):
+            continue
+        expected = [sigma_filter for sigma_filter in filters if sigma_filter._should_apply_on_rule(rule)]
+        assert filter_index.filters_for(rule) == expected
+    assert len(filter_index.filters_for(rules[0])) == 6
+
+
+def test_merge_collections_applies_filters():
+    collections = [
+        load_rules((Path("tests/files/valid"),), "*.yml"),
+        SigmaCollection(filter_rules(), collect_filters=True, resolve_references=False),
+    ]
+    rule_collection = merge_collections(collections)
+    assert rule_collection.rules[0].detection.condition[0].count(" and ") == 6
+    assert len(rule_collection.filters) == 20
+
+
+def test_convert_changed_since_unchanged_filter(rule_repo):
+    (rule_repo / "filters").mkdir()
+    (rule_repo / "filters" / "filter.yml").write_text(Path(__file__).with_name("files").joinpath("sigma_filter.yml").read_text())
+    run_git(rule_repo, "add", ".")
+    run_git(rule_repo, "commit", "-q", "-m", "filter")
+    (rule_repo / "base.yml").write_text((rule_repo / "base.yml").read_text() + "\n")
+    cli = CliRunner()
+    result = cli.invoke(
+        convert,
+        ["-t", "text_query_test", "--changed-since", "HEAD", "--filter", "filters/filter.yml", "base.yml"],
+    )
+    assert result.exit_code == 0
+    assert 'not User startswith "ADM_"' in result.stdout
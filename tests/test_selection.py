@@ -0,0 +1,125 @@
+import click
+import pytest
+import yaml
+from click.testing import CliRunner
+
+import sigma.cli.rules
+from sigma.cli.cache import RuleCache
+from sigma.cli.convert import convert
+from sigma.cli.rules import load_rules, parse_rule_file
+from sigma.cli.selection import RuleSelection
+
+rule = open("tests/files/valid/sigma_rule.yml").read()
+correlation_rules = open("tests/files/sigma_correlation_rules.yml").read()
+
+
+@pytest.fixture
+def rules_dir(tmp_path):
+    rules_dir = tmp_path / "rules"
+    rules_dir.mkdir()
+    (rules_dir / "windows.yml").write_text(rule)
+    (rules_dir / "linux.yml").write_text(
+        rule.replace("product: windows", "product: linux")
+        .replace("level: high", "level: low")
+        .replace("status: stable", "status: test")
+        .replace("attack.t1505.003", "attack.t1059")
+        .replace("5013332f-8a70-4e04-bcc1-06a98a2cca2e", "11111111-1111-1111-1111-111111111111")
+    )
+    return rules_dir
+
+
+def test_selection_none():
+    assert RuleSelection.create() is None
+
+
+def test_selection_invalid():
+    with pytest.raises(click.BadParameter, match="key=pattern"):
+        RuleSelection(select=["logsource.product"])
+
+
+@pytest.mark.parametrize(
+    "options,selected",
+    [
+        ({"select": ["logsource.product=windows"]}, True),
+        ({"select": ["logsource.product=Win*"]}, True),
+        ({"select": ["logsource.product=linux"]}, False),
+        ({"select": ["logsource.product=linux", "logsource.product=windows"]}, True),
+        ({"select": ["logsource.product=windows", "logsource.category=network*"]}, False),
+        ({"select": ["logsource.service=*"]}, False),
+        ({"min_level": "medium"}, True),
+        ({"min_level": "critical"}, False),
+        ({"status": ["stable", "test"]}, True),
+        ({"status": ["experimental"]}, False),
+        ({"tag": ["attack.t1505*"]}, True),
+        ({"tag": ["attack.t1059"]}, False),
+    ],
+)
+def test_selection_matches(options, selected):
+    selection = RuleSelection.create(**options)
+    assert selection.matches(yaml.safe_load(rule)) is selected
+    assert selection.matches(yaml.safe_load(selection.header(rule))) is selected
+
+
+def test_selection_header():
+    header = RuleSelection(select=["logsource.product=windows"], tag=["attack.*"]).header(rule)
+    assert header == "logsource:\n  category: process_creation\n  product: windows\ntags:\n  - attack.t1505.003"
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        correlation_rules,
+        "action: global\nlevel: high\n",
+        "{title: Test rule, level: high}\n",
+    ],
+)
+def test_selection_header_undecidable(content):
+    assert RuleSelection(min_level="high").header(content) is None
+
+
+def test_load_rules_selection(rules_dir):
+    rules = load_rules((rules_dir,), "*.yml", select=("logsource.product=linux",))
+    assert [rule.source.path.name for rule in rules.rules] == ["linux.yml"]
+    rules = load_rules((rules_dir,), "*.yml", min_level="high", tag=("attack.t1505*",), status=("stable",))
+    assert [rule.source.path.name for rule in rules.rules] == ["windows.yml"]
+
+
+def test_load_rules_selection_not_parsed(rules_dir, monkeypatch):
+    parsed = list()
+    from_dicts = sigma.cli.rules.SigmaCollection.from_dicts
+
+    def count_from_dicts(documents, *args, **kwargs):
+        parsed.extend(documents)
+        return from_dicts(documents, *args, **kwargs)
+
+    monkeypatch.setattr(sigma.cli.rules.SigmaCollection, "from_dicts", count_from_dicts)
+    rules = load_rules((rules_dir,), "*.yml", select=("logsource.product=windows",), rule_cache=False)
+    assert len(rules.rules) == 1
+    assert [document["logsource"]["product"] for document in parsed] == ["windows"]
+
+
+def test_load_rules_selection_correlations(tmp_path):
+    (tmp_path / "correlations.yml").write_text(correlation_rules)
+    rules = load_rules((tmp_path,), "*.yml", min_level="informational")
+    assert len(rules.rules) == 6
+    rules = load_rules((tmp_path,), "*.yml", min_level="low")
+    assert rules.rules == []
+
+
+def test_rule_cache_selection(rules_dir, tmp_path):
+    path = rules_dir / "linux.yml"
+    all_rules = parse_rule_file(path, RuleCache(tmp_path))
+    selection = RuleSelection(select=["logsource.product=windows"])
+    selected = parse_rule_file(path, RuleCache(tmp_path, selection), selection)
+    assert len(all_rules.rules) == 1
+    assert selected.rules == []
+    assert len(parse_rule_file(path, RuleCache(tmp_path)).rules) == 1
+
+
+def test_convert_select(rules_dir):
+    result = CliRunner().invoke(
+        convert,
+        ["-t", "text_query_test", "--select", "logsource.product=windows", "--min-level", "high", str(rules_dir)],
+    )
+    assert result.exit_code == 0
+    assert result.stdout.count("ParentImage") == 1
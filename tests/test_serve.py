@@ -0,0 +1,271 @@
+import http.client
+import json
+import socket
+import threading
+
+import click
+import pytest
+
+from sigma.cli import serve
+from sigma.cli.serve import create_server
+
+rule = open("tests/files/valid/sigma_rule.yml").read()
+query = 'ParentImage endswith "\\httpd.exe" and Image endswith "\\cmd.exe"'
+
+
+@pytest.fixture
+def server(request, tmp_path):
+    options = getattr(request, "param", {})
+    server = create_server(port=0, cache_dir=tmp_path, **options)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def connect(server):
+    if isinstance(server.server_address, str):
+        return UnixHTTPConnection(server.server_address)
+    return http.client.HTTPConnection(*server.server_address[:2])
+
+
+def post(server, path, request):
+    connection = connect(server)
+    body = request if isinstance(request, bytes) else json.dumps(request).encode("utf-8")
+    connection.request("POST", path, body, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+def test_serve_health(server):
+    connection = connect(server)
+    connection.request("GET", "/health")
+    response = connection.getresponse()
+    assert response.status == 200
+    assert json.loads(response.read()) == {"status": "ok"}
+
+
+def test_serve_convert(server):
+    status, response = post(server, "/convert", {"target": "text_query_test", "rules": rule})
+    assert status == 200
+    assert response == {"result": [query], "errors": []}
+
+
+def test_serve_convert_filters(server):
+    status, response = post(
+        server,
+        "/convert",
+        {
+            "target": "text_query_test",
+            "rules": rule,
+            "filters": [open("tests/files/sigma_filter.yml").read()],
+        },
+    )
+    assert status == 200
+    assert response["result"] == [query + ' and not User startswith "ADM_"']
+
+
+def test_serve_convert_correlation(server):
+    status, response = post(
+        server,
+        "/convert",
+        {
+            "target": "text_query_test",
+            "rules": open("tests/files/sigma_correlation_rules.yml").read(),
+        },
+    )
+    assert status == 200
+    assert len(response["result"]) == 3
+
+
+def test_serve_convert_pipeline_cached(server):
+    request = {"target": "text_query_test", "pipeline": ["tests/files/custom_pipeline.yml"], "rules": rule}
+    results = [post(server, "/convert", request) for i in range(2)]
+    assert results[0] == results[1]
+    assert results[0][0] == 200
+    assert server.executor is None
+    assert (serve.pipeline_cache.hits, serve.pipeline_cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize(
+    "request_body,message",
+    [
+        ({"rules": rule}, "Request contains no 'target'."),
+        ({"target": "nonexistent", "rules": rule}, "Unknown target 'nonexistent'."),
+        ({"target": "text_query_test", "format": "nonexistent", "rules": rule}, "Output format 'nonexistent'"),
+        ({"target": "text_query_test", "pipeline": "sysmon", "rules": rule}, "Invalid value of 'pipeline'."),
+        ({"target": "text_query_test"}, "Request contains no 'rules'."),
+        (b"not json", "Invalid JSON request"),
+        (b"[]", "Invalid JSON request"),
+    ],
+)
+def test_serve_convert_bad_request(server, request_body, message):
+    status, response = post(server, "/convert", request_body)
+    assert status == 400
+    assert message in response["error"]
+
+
+@pytest.mark.parametrize(
+    "request_body,status,message",
+    [
+        ({"target": "text_query_test", "rules": "title: ["}, 400, "Invalid YAML"),
+        ({"target": "text_query_test", "rules": rule, "filters": ["title: ["]}, 400, "Invalid YAML"),
+        ({"target": "text_query_test", "rules": rule, "filters": [1]}, 400, "Invalid item in 'filters'."),
+        ({"target": "text_query_test", "rules": rule, "pipeline": [1]}, 400, "Invalid item in 'pipeline'."),
+        ({"target": "text_query_test", "rules": "- title: Test\n"}, 422, "must be a mapping"),
+        ({"target": "text_query_test", "rules": "just text"}, 422, "must be a mapping"),
+        ({"target": "text_query_test", "rules": rule + "\n---\n- a\n"}, 422, "must be a mapping"),
+    ],
+)
+def test_serve_convert_malformed_request(server, request_body, status, message):
+    response_status, response = post(server, "/convert", request_body)
+    assert response_status == status
+    assert message in response["error"]
+
+
+def test_serve_check_malformed_exclude(server):
+    status, response = post(server, "/check", {"rules": rule, "exclude": [1]})
+    assert status == 400
+    assert response["error"] == "Invalid item in 'exclude'."
+
+
+def test_serve_internal_error(server, monkeypatch):
+    def fail(request):
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setitem(serve.endpoints, "/convert", fail)
+    status, response = post(server, "/convert", {"target": "text_query_test", "rules": rule})
+    assert status == 500
+    assert response["error"] == "Internal error: RuntimeError: unexpected"
+
+
+def test_serve_convert_rule_errors(server):
+    status, response = post(
+        server,
+        "/convert",
+        {"target": "text_query_test", "rules": open("tests/files/invalid/sigma_rule_with_errors.yml").read()},
+    )
+    assert status == 422
+    assert response["error"] == "Errors found in Sigma rules."
+    assert len(response["rule_errors"]) > 0
+
+
+def test_serve_check(server):
+    status, response = post(
+        server,
+        "/check",
+        {"rules": open("tests/files/issues/sigma_rule_wildcards_instead_of_endswith.yml").read()},
+    )
+    assert status == 200
+    assert response["rule_errors"] == []
+    assert "WildcardInsteadOfEndswithIssue" in [issue["issue"] for issue in response["issues"]]
+
+
+def test_serve_check_repeated(server):
+    request = {"rules": rule, "exclude": ["attacktag", "d3_fendtag"]}  # these download their data
+    responses = [post(server, "/check", request) for _ in range(2)]
+    assert responses[0] == responses[1]
+    status, response = responses[0]
+    assert status == 200
+    issues = [issue["issue"] for issue in response["issues"]]
+    assert "FilenameLengthIssue" not in issues
+    assert "DuplicateTitleIssue" not in issues
+
+
+def test_serve_check_condition_errors(server):
+    status, response = post(
+        server,
+        "/check",
+        {"rules": open("tests/files/invalid/sigma_rule_with_condition_errors.yml").read()},
+    )
+    assert status == 200
+    assert len(response["condition_errors"]) == 1
+
+
+def test_serve_analyze_logsource(server):
+    status, response = post(server, "/analyze/logsource", {"rules": rule})
+    assert status == 200
+    assert response["logsources"]["process_creation"]["Overall"] == 1
+
+
+def test_serve_analyze_attack(server):
+    status, response = post(server, "/analyze/attack", {"rules": rule, "subtechniques": False})
+    assert status == 200
+    assert response == {"scores": {"T1505": 1}}
+
+
+def test_serve_analyze_fields(server):
+    status, response = post(server, "/analyze/fields", {"target": "text_query_test", "rules": rule})
+    assert status == 200
+    assert response == {"fields": ["Image", "ParentImage"], "errors": []}
+
+
+def test_serve_unknown_endpoint(server):
+    status, response = post(server, "/nonexistent", {})
+    assert status == 404
+
+
+@pytest.mark.parametrize("server", [{"max_request_size": 100}], indirect=True)
+def test_serve_request_too_large(server):
+    status, response = post(server, "/convert", {"target": "text_query_test", "rules": rule})
+    assert status == 413
+    assert "100 bytes" in response["error"]
+
+
+@pytest.mark.parametrize("server", [{"max_concurrency": 1}], indirect=True)
+def test_serve_too_many_requests(server):
+    server.slots.acquire()  # simulate a running request
+    try:
+        status, response = post(server, "/convert", {"target": "text_query_test", "rules": rule})
+    finally:
+        server.slots.release()
+    assert status == 503
+    status, response = post(server, "/convert", {"target": "text_query_test", "rules": rule})
+    assert status == 200
+
+
+@pytest.mark.parametrize("server", [{"workers": 2}], indirect=True)
+def test_serve_worker_processes(server):
+    assert server.executor is not None
+    for i in range(3):
+        status, response = post(server, "/convert", {"target": "text_query_test", "rules": rule})
+        assert status == 200
+        assert response["result"] == [query]
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix sockets are not available")
+def test_serve_unix_socket(tmp_path):
+    socket_path = tmp_path / "sigma.sock"
+    socket_path.touch()  # stale socket file from a previous run
+    server = create_server(socket_path=socket_path, cache_dir=tmp_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        status, response = post(server, "/convert", {"target": "text_query_test", "rules": rule})
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+    assert status == 200
+    assert response["result"] == [query]
+    assert not socket_path.exists()
+
+
+def test_serve_unix_socket_unavailable(tmp_path, monkeypatch):
+    monkeypatch.delattr(socket, "AF_UNIX", raising=False)
+    with pytest.raises(click.UsageError, match="Unix sockets"):
+        create_server(socket_path=tmp_path / "sigma.sock", cache_dir=tmp_path)
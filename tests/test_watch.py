@@ -0,0 +1,263 @@
+import os
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+import sigma.cli.check
+import sigma.cli.convert
+import sigma.backends.test.backend
+from sigma.cli.check import check
+from sigma.cli.convert import convert
+from sigma.cli.watch import InotifyWatcher, PollingWatcher, WatchedRules, create_watcher
+
+rule = open("tests/files/valid/sigma_rule.yml").read()
+query = 'ParentImage endswith "\\httpd.exe" and Image endswith "\\cmd.exe"'
+base_rule = """
+title: Base rule
+id: 5d8fd9da-6916-45ef-8d4d-3fa9d19d1a64
+name: base_rule
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value1
+    condition: selection
+"""
+correlation_rule = """
+title: Multiple occurrences of base event
+id: 4db3cdb5-aac6-4827-a756-d99475865d32
+status: test
+correlation:
+    type: event_count
+    rules:
+        - base_rule
+    group-by:
+        - fieldC
+    timespan: 15m
+    condition:
+        gte: 10
+"""
+
+
+def write(path, content):
+    """Write a rule file with a new modification time, also on file systems with coarse timestamps."""
+    path.write_text(content)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def rules_dir(tmp_path):
+    rules_dir = tmp_path / "rules"
+    rules_dir.mkdir()
+    write(rules_dir / "rule.yml", rule)
+    return rules_dir
+
+
+def test_watched_rules_update(rules_dir):
+    watched = WatchedRules((rules_dir,), "*.yml")
+    assert watched.update() == ([rules_dir / "rule.yml"], [])
+    assert watched.update() == ([], [])
+    write(rules_dir / "other.yml", rule.replace("endswith", "startswith"))
+    assert watched.update() == ([rules_dir / "other.yml"], [])
+    (rules_dir / "rule.yml").unlink()
+    assert watched.update() == ([], [rules_dir / "rule.yml"])
+    assert [str(rule.source.path) for rule in watched.collection().rules] == [str(rules_dir / "other.yml")]
+
+
+def test_watched_rules_fresh_copies(rules_dir):
+    watched = WatchedRules((rules_dir,), "*.yml")
+    watched.update()
+    first, second = watched.collection(), watched.collection()
+    assert first.rules[0] is not second.rules[0]
+    assert first.rules[0].id == second.rules[0].id
+
+
+def test_watched_rules_parse_error(rules_dir, capsys):
+    watched = WatchedRules((rules_dir,), "*.yml")
+    write(rules_dir / "broken.yml", "title: [")
+    changed, removed = watched.update()
+    assert len(changed) == 2
+    assert "Error while parsing" in capsys.readouterr().err
+    assert len(watched.collection().rules) == 1
+
+
+def test_watched_rules_parallel(rules_dir):
+    for i in range(5):
+        write(rules_dir / f"rule_{i}.yml", rule)
+    write(rules_dir / "broken.yml", "title: [")
+    watched = WatchedRules((rules_dir,), "*.yml", jobs=2)
+    changed, removed = watched.update()
+    assert len(changed) == 7
+    assert len(watched.collection().rules) == 6
+
+
+def test_watched_rules_affected_rules(rules_dir):
+    write(rules_dir / "base.yml", base_rule)
+    write(rules_dir / "correlation.yml", correlation_rule)
+    watched = WatchedRules((rules_dir,), "*.yml")
+    watched.update()
+    write(rules_dir / "base.yml", base_rule.replace("value1", "value2"))
+    changed, removed = watched.update()
+    rule_collection = watched.collection()
+    affected = watched.affected_rules(rule_collection, changed)
+    assert sorted(rule.title for rule in affected) == [
+        "Base rule",
+        "Multiple occurrences of base event",
+    ]
+
+
+def test_watched_rules_filter_changed(rules_dir):
+    write(rules_dir / "base.yml", base_rule)
+    watched = WatchedRules((rules_dir,), "*.yml")
+    watched.update()
+    write(rules_dir / "filter.yml", open("tests/files/sigma_filter.yml").read())
+    changed, removed = watched.update()
+    rule_collection = watched.collection()
+    assert watched.affected_rules(rule_collection, changed) == rule_collection.rules
+    assert len(rule_collection.rules) == 2
+
+
+def test_watched_rules_stdin():
+    with pytest.raises(Exception, match="standard input"):
+        WatchedRules((sigma.cli.watch.stdin_path,), "*.yml")
+
+
+def test_create_watcher_polling(rules_dir):
+    assert isinstance(create_watcher((rules_dir,), polling=True), PollingWatcher)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is only available on Linux")
+def test_inotify_watcher(rules_dir):
+    (rules_dir / "excluded").mkdir()
+    watcher = InotifyWatcher((rules_dir,), ("excluded",), debounce=0)
+    try:
+        assert list(watcher.directories()) == [rules_dir]
+        watcher.watch()
+        write(rules_dir / "other.yml", rule)
+        watcher.wait()  # returns because of the pending events
+    finally:
+        watcher.close()
+
+
+class FakeWatcher:
+    """Watcher that applies a change to the rule files on each wait and stops after the last one."""
+
+    def __init__(self, changes):
+        self.changes = list(changes)
+
+    def wait(self):
+        if not self.changes:
+            raise KeyboardInterrupt()
+        self.changes.pop(0)()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_watcher(monkeypatch):
+    def fake_watcher(module, *changes):
+        monkeypatch.setattr(module, "create_watcher", lambda *args: FakeWatcher(changes))
+
+    return fake_watcher
+
+
+def test_convert_watch(rules_dir, fake_watcher):
+    fake_watcher(
+        sigma.cli.convert,
+        lambda: write(rules_dir / "other.yml", rule.replace("endswith", "startswith")),
+        lambda: write(rules_dir / "broken.yml", "title: ["),
+    )
+    result = CliRunner().invoke(
+        convert, ["-t", "text_query_test", "--no-rule-cache", "--watch", str(rules_dir)]
+    )
+    assert result.exit_code == 0
+    assert result.stdout.count(query) == 1  # unchanged rule isn't converted again
+    assert result.stdout.count(query.replace("endswith", "startswith")) == 1
+    assert "Error while parsing" in result.stderr
+    assert "2 rule files changed" not in result.stderr
+
+
+def test_convert_watch_rule_errors(rules_dir, fake_watcher):
+    fake_watcher(
+        sigma.cli.convert,
+        lambda: write(rules_dir / "invalid.yml", open("tests/files/invalid/sigma_rule_with_errors.yml").read()),
+        lambda: (rules_dir / "invalid.yml").unlink(),
+    )
+    result = CliRunner().invoke(
+        convert, ["-t", "text_query_test", "--no-rule-cache", "--watch", str(rules_dir)]
+    )
+    assert result.exit_code == 0
+    assert "Errors found in Sigma rules" in result.stderr
+    assert "0 rule files changed, 1 removed" in result.stderr
+
+
+def test_convert_watch_output_dir(rules_dir, tmp_path, fake_watcher):
+    fake_watcher(
+        sigma.cli.convert,
+        lambda: write(rules_dir / "other.yml", rule.replace("endswith", "startswith").replace(
+            "5013332f-8a70-4e04-bcc1-06a98a2cca2e", "11111111-1111-1111-1111-111111111111"
+        )),
+        lambda: (rules_dir / "other.yml").unlink(),
+    )
+    output_dir = tmp_path / "output"
+    result = CliRunner().invoke(
+        convert,
+        [
+            "-t",
+            "text_query_test",
+            "--no-rule-cache",
+            "--cache-stats",
+            "--watch",
+            "--output-dir",
+            str(output_dir),
+            str(rules_dir),
+        ],
+    )
+    assert result.exit_code == 0
+    assert "Output directory: 1 files written, 1 unchanged, 0 removed" in result.stderr
+    assert "Conversion cache: 1 hits, 1 misses" in result.stderr
+    assert "Output directory: 0 files written, 1 unchanged, 1 removed" in result.stderr
+    assert [path.name for path in output_dir.iterdir() if not path.name.startswith(".")] == [
+        "5013332f-8a70-4e04-bcc1-06a98a2cca2e.txt"
+    ]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        ["--matrix", "tests/files/valid/sigma_rule.yml"],
+        ["--rule-timeout", "1"],
+        ["--changed-since", "HEAD"],
+    ],
+)
+def test_convert_watch_incompatible_options(rules_dir, options):
+    result = CliRunner().invoke(
+        convert, ["-t", "text_query_test", "--watch"] + options + [str(rules_dir)]
+    )
+    assert result.exit_code != 0
+    assert "--watch can't be used with" in result.stderr
+
+
+def test_check_watch(rules_dir, fake_watcher):
+    fake_watcher(
+        sigma.cli.check,
+        lambda: write(
+            rules_dir / "wildcards.yml",
+            open("tests/files/issues/sigma_rule_wildcards_instead_of_endswith.yml").read(),
+        ),
+    )
+    # tag validators are excluded, they download the MITRE data
+    exclude = ["filename_length", "attacktag", "d3_fendtag", "cartag", "namespace_tag"]
+    result = CliRunner().invoke(
+        check,
+        ["--no-rule-cache", "--watch", str(rules_dir)] + [f"--exclude={name}" for name in exclude],
+    )
+    assert result.exit_code == 0
+    summaries = result.stdout.split("=== Summary ===")[1:]
+    assert len(summaries) == 2
+    assert "0 issues" in summaries[0]
+    assert "WildcardInsteadOfEndswithIssue" in summaries[1]